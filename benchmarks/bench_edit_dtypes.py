@@ -0,0 +1,99 @@
+"""编辑单元格后的列类型和内存占用检查：按列类型写入与原来直接写入字符串对比
+
+用法: python benchmarks/bench_edit_dtypes.py [--rows 100000] [--edits 1000]
+对整数、浮点、可空整数、日期、布尔和分类列各修改N个单元格，
+检查列类型和内存占用不变（误差1%以内）；有列发生变化时以非零状态退出。
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sheet_model import SheetModel  # noqa: E402
+
+
+def make_frame(rows, seed=0):
+    """生成各种紧凑类型的测试数据"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "整数": rng.integers(0, 1_000_000, rows),
+        "浮点": rng.random(rows) * 1000,
+        "可空整数": pd.array(rng.integers(0, 100, rows), dtype="Int64"),
+        "日期": pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 2000, rows), unit="D"),
+        "布尔": rng.random(rows) > 0.5,
+        "分类": pd.Categorical(rng.choice(["北京", "上海", "广州"], rows)),
+    })
+
+
+def edit_values(column, count, rng):
+    """生成用户在编辑框中输入的字符串"""
+    if column == "整数" or column == "可空整数":
+        return [str(v) for v in rng.integers(0, 100, count)]
+    if column == "浮点":
+        return [f"{v:.2f}" for v in rng.random(count) * 100]
+    if column == "日期":
+        return [f"2021-{m:02d}-15" for m in rng.integers(1, 13, count)]
+    if column == "布尔":
+        return [rng.choice(["是", "否", "true", "false"]) for _ in range(count)]
+    return [rng.choice(["北京", "上海", "广州"]) for _ in range(count)]
+
+
+def column_memory(df):
+    return df.memory_usage(index=False, deep=True).to_dict()
+
+
+def legacy_edit(df, edits):
+    """原实现：直接把字符串写入单元格（列被转换为object）"""
+    df = df.copy()
+    for column, positions, values in edits:
+        series = df[column].astype(object)
+        series.iloc[positions] = values
+        df[column] = series
+    return df
+
+
+def model_edit(df, edits):
+    """新实现：SheetModel.update_cells按列类型转换后写入"""
+    model = SheetModel(df.copy())
+    for column, positions, values in edits:
+        for position, value in zip(positions, values):
+            model.update_cells(model.row_id(position), {column: value})
+    return model.df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--edits", type=int, default=1000)
+    args = parser.parse_args()
+
+    df = make_frame(args.rows)
+    rng = np.random.default_rng(1)
+    edits = [(column, rng.choice(args.rows, args.edits, replace=False), edit_values(column, args.edits, rng))
+             for column in df.columns]
+    before = column_memory(df)
+
+    start = time.perf_counter()
+    edited = model_edit(df, edits)
+    elapsed = time.perf_counter() - start
+    after = column_memory(edited)
+    legacy = column_memory(legacy_edit(df, edits))
+
+    print(f"数据规模: {args.rows}行，每列修改{args.edits}个单元格，耗时{elapsed:.3f}s")
+    failed = False
+    for column in df.columns:
+        # 分类列的类别索引可能带有少量缓存，允许1%的误差
+        same = edited[column].dtype == df[column].dtype and after[column] <= before[column] * 1.01
+        failed |= not same
+        print(f"{column}: {df[column].dtype} -> {edited[column].dtype}，"
+              f"内存 {before[column] / 1e6:.2f}MB -> {after[column] / 1e6:.2f}MB"
+              f"（直接写入字符串: {legacy[column] / 1e6:.2f}MB）{'' if same else '  ← 发生变化'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
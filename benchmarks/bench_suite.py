@@ -0,0 +1,464 @@
+"""性能基准套件：用合成工作簿测量打开、切换、渲染、排序、汇总、编辑、导入和保存各路径的耗时与峰值内存
+
+用法:
+  python benchmarks/bench_suite.py [--scenario small,medium|all] [--rows N --cols N --sheets N]
+                                   [--mode engine|gui|both] [--ops 100] [--no-memory]
+                                   [--json results.json] [--baseline baseline.json] [--tolerance 0.25]
+
+合成工作簿（整数、浮点、文本、日期、布尔和分类列）按规模缓存在--data-dir中，只生成一次。
+每个场景在单独的子进程中运行，峰值RSS互不影响。engine模式直接调用WorkbookEngine；
+gui模式通过ExcelManager执行界面路径，没有DISPLAY时启动Xvfb虚拟X服务器。
+结果以JSON输出（默认输出到标准输出，表格输出到标准错误）。把一次的结果保存为基线后，
+用--baseline比较：耗时或峰值内存超出容差的步骤列为回退，此时以非零状态退出。
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 预设场景：名称 -> (行数, 列数, 工作表数)
+SCENARIOS = {
+    "small": (1_000, 5, 1),
+    "medium": (100_000, 20, 5),
+    "wide": (10_000, 100, 1),
+    "sheets": (1_000, 10, 50),
+    "large": (1_000_000, 10, 1),
+}
+DEFAULT_SCENARIOS = "small,medium"
+# 导入文件的行数占工作表行数的比例
+IMPORT_RATIO = 0.1
+# 比较基线时忽略的耗时（秒）和内存（MB）差异，避免把计时噪声当作回退
+MIN_SECONDS_DELTA = 0.05
+MIN_MEMORY_DELTA = 1.0
+# gui模式等待后台任务的最长时间（秒）
+GUI_TIMEOUT = 3600
+
+
+def make_frame(rows, cols, seed=0):
+    """生成整数、浮点、文本、日期、布尔和分类列依次循环的测试数据"""
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i in range(cols):
+        kind = i % 6
+        if kind == 0:
+            data[f"整数{i}"] = rng.integers(0, 1_000_000, rows)
+        elif kind == 1:
+            data[f"浮点{i}"] = np.round(rng.random(rows) * 1000, 2)
+        elif kind == 2:
+            data[f"文本{i}"] = np.char.add("item-", rng.integers(0, 5000, rows).astype(str))
+        elif kind == 3:
+            data[f"日期{i}"] = pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 2000, rows), unit="D")
+        elif kind == 4:
+            data[f"布尔{i}"] = rng.random(rows) > 0.5
+        else:
+            data[f"分类{i}"] = pd.Categorical(rng.choice(["北京", "上海", "广州", "深圳"], rows))
+    return pd.DataFrame(data)
+
+
+def write_workbook(file_path, frames):
+    """用openpyxl的只写模式写入{工作表名: DataFrame}（比pandas.to_excel快且内存恒定）"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for sheet_name, df in frames.items():
+        sheet = workbook.create_sheet(sheet_name)
+        sheet.append(list(df.columns))
+        columns = [df[column].astype(object).to_numpy() if isinstance(df[column].dtype, pd.CategoricalDtype)
+                   else df[column].to_numpy(dtype=object) for column in df.columns]
+        for row in zip(*columns):
+            sheet.append(row)
+    tmp_path = file_path + ".tmp"
+    workbook.save(tmp_path)
+    os.replace(tmp_path, file_path)
+
+
+def prepare_workbooks(data_dir, rows, cols, sheets):
+    """返回(工作簿, 导入文件)的路径，不存在时生成"""
+    os.makedirs(data_dir, exist_ok=True)
+    workbook = os.path.join(data_dir, f"bench_{rows}x{cols}x{sheets}.xlsx")
+    import_file = os.path.join(data_dir, f"bench_{rows}x{cols}_import.xlsx")
+    if not os.path.exists(workbook):
+        print(f"正在生成 {os.path.basename(workbook)}", file=sys.stderr)
+        write_workbook(workbook, {f"Sheet{i + 1}": make_frame(rows, cols, seed=i) for i in range(sheets)})
+    if not os.path.exists(import_file):
+        write_workbook(import_file, {"Sheet1": make_frame(max(int(rows * IMPORT_RATIO), 1), cols, seed=1000)})
+    return workbook, import_file
+
+
+class Recorder:
+    """记录各步骤的耗时和（可选的）tracemalloc峰值内存"""
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.steps = {}
+
+    @contextmanager
+    def step(self, name, ops=1):
+        gc.collect()
+        if self.trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = None
+            if self.trace:
+                peak = tracemalloc.get_traced_memory()[1] / 1e6
+                tracemalloc.stop()
+        self.steps[name] = {"seconds": round(elapsed, 4), "ops": ops,
+                            "peak_mb": None if peak is None else round(peak, 2)}
+
+
+class Workload:
+    """各场景相同的编辑操作：修改单元格、新增记录和删除记录的数据（同一种子每次相同）"""
+
+    def __init__(self, columns, ops, seed=0):
+        rng = np.random.default_rng(seed)
+        self.ops = ops
+        self.rng = rng
+        self.edit_column = columns[0]
+        self.sort_column = next((column for column in columns if column.startswith("文本")), columns[0])
+        self.value_column = next((column for column in columns if column.startswith("浮点")), columns[0])
+        self.edit_values = [str(value) for value in rng.integers(0, 1_000_000, ops)]
+        self.records = make_frame(ops, len(columns), seed=seed + 7).astype(str).to_dict("records")
+
+    def row_ids(self, model, count):
+        """随机选取count条不同记录的行ID"""
+        positions = self.rng.choice(len(model), min(count, len(model)), replace=False)
+        return [int(row_id) for row_id in model.row_ids(positions)]
+
+
+def run_engine(recorder, workbook, import_file, ops, work_dir):
+    """直接调用WorkbookEngine测量各路径（update_treeview测量渲染首屏的数据准备）"""
+    from excel_manager import VIRTUAL_ROW_THRESHOLD, compute_column_width, format_rows, sample_positions
+    from workbook_engine import WorkbookEngine
+
+    engine = WorkbookEngine()
+    try:
+        with recorder.step("open_file"):
+            sheets = engine.open(workbook)
+        with recorder.step("load_sheet_data"):
+            engine.select(sheets[0])
+        if len(sheets) > 1:
+            # 切换到另一个工作表再切换回来（已缓存）
+            with recorder.step("switch_sheet"):
+                engine.select(sheets[1])
+                engine.select(sheets[0])
+        model = engine.model
+        workload = Workload(list(model.columns), ops)
+
+        with recorder.step("update_treeview"):
+            sample = sample_positions(len(model))
+            window = model.take(sample)
+            for column in model.columns:
+                compute_column_width(column, window[column])
+            view = model.view
+            format_rows(model.take(view if len(view) <= VIRTUAL_ROW_THRESHOLD else view[:100]))
+        with recorder.step("sort_column"):
+            engine.sort([(workload.sort_column, False)])
+        summary = ((workload.sort_column,), workload.value_column, "mean")
+        with recorder.step("summary"):
+            engine.column_stats()
+            engine.pivot(*summary)
+        row_ids = workload.row_ids(model, ops)
+        with recorder.step("save_edit", ops):
+            for row_id, value in zip(row_ids, workload.edit_values):
+                engine.update_cells(row_id, {workload.edit_column: value})
+        with recorder.step("save_new_record", ops):
+            for record in workload.records:
+                engine.add_rows(pd.DataFrame([record]))
+        row_ids = workload.row_ids(model, ops)
+        with recorder.step("delete_record", len(row_ids)):
+            engine.delete_rows(row_ids)
+        # 编辑后刷新汇总：只重新计算受影响的部分
+        with recorder.step("summary_refresh"):
+            engine.column_stats()
+            engine.pivot(*summary)
+        with recorder.step("perform_import"):
+            df_import, report = engine.read_imports([(import_file, None)], reference=list(model.columns),
+                                                    schema=engine.schema())
+            engine.merge(df_import)
+        with recorder.step("save_file"):
+            engine.save()
+        with recorder.step("export_file"):
+            engine.export(os.path.join(work_dir, "export.xlsx"))
+    finally:
+        engine.close()
+
+
+def run_gui(recorder, workbook, import_file, ops, work_dir):
+    """通过ExcelManager测量界面路径（对话框的返回值由这里给出）"""
+    import tkinter as tk
+    from tkinter import filedialog, messagebox
+
+    from excel_manager import FIRST_SHEET_LABEL, ExcelManager
+    from multi_import import ALIGN_UNION
+
+    answers = {}
+    errors = []
+    filedialog.askopenfilename = lambda **kw: answers["open"]
+    filedialog.asksaveasfilename = lambda **kw: answers["save"]
+    messagebox.showinfo = messagebox.showwarning = lambda *args, **kw: "ok"
+    messagebox.showerror = lambda title, message, **kw: errors.append(message)
+    messagebox.askyesno = lambda *args, **kw: True
+
+    root = tk.Tk()
+    app = ExcelManager(root)
+    root.update()
+
+    def wait(ready=lambda: True):
+        """处理界面事件直到后台任务结束且ready()为真"""
+        deadline = time.monotonic() + GUI_TIMEOUT
+        while app.jobs.is_busy() or not ready():
+            if errors:
+                raise RuntimeError(errors[-1])
+            if time.monotonic() > deadline:
+                raise TimeoutError("等待后台任务超时")
+            root.update()
+            time.sleep(0.001)
+        root.update()
+        if errors:
+            raise RuntimeError(errors[-1])
+
+    try:
+        answers["open"] = workbook
+        with recorder.step("open_file"):
+            app.open_file()
+            wait(lambda: app.model is not None)
+        sheets = app.engine.sheets
+        target = sheets[1] if len(sheets) > 1 else sheets[0]
+        with recorder.step("load_sheet_data"):
+            app.sheet_var.set(target)
+            app.load_sheet_data(target)
+            wait(lambda: app.current_sheet == target and app.model is not None)
+        workload = Workload(list(app.model.columns), ops)
+
+        with recorder.step("update_treeview"):
+            app.update_treeview()
+            root.update()
+        with recorder.step("sort_column"):
+            app.sort_column(workload.sort_column, True)
+            root.update()
+        row_ids = workload.row_ids(app.model, ops)
+        with recorder.step("save_edit", ops):
+            for row_id, value in zip(row_ids, workload.edit_values):
+                app.editing_cell = (row_id, workload.edit_column)
+                app.edit_entry.delete(0, tk.END)
+                app.edit_entry.insert(0, value)
+                app.save_edit()
+                root.update()
+        with recorder.step("save_new_record", ops):
+            for record in workload.records:
+                app.add_window = tk.Toplevel(root)
+                app.entry_vars = {column: tk.StringVar(value=value) for column, value in record.items()}
+                app.save_new_record()
+                root.update()
+        row_ids = workload.row_ids(app.model, ops)
+        with recorder.step("delete_record", len(row_ids)):
+            if app.virtual:
+                app.selected_ids = set(row_ids)
+            else:
+                app.tree.selection_set([str(row_id) for row_id in row_ids])
+            app.delete_record()
+            root.update()
+        count = len(app.model)
+        with recorder.step("perform_import"):
+            app.import_window = tk.Toplevel(root)
+            app.import_sheet_var = tk.StringVar(value=FIRST_SHEET_LABEL)
+            app.import_mode_var = tk.StringVar(value="merge")
+            app.import_align_var = tk.StringVar(value=ALIGN_UNION)
+            app.perform_import([import_file])
+            wait(lambda: len(app.model) > count)
+        with recorder.step("save_file"):
+            app.save_file()
+            wait()
+        answers["save"] = os.path.join(work_dir, "export.xlsx")
+        with recorder.step("export_file"):
+            app.export_file()
+            app.perform_export()
+            wait()
+    finally:
+        app.jobs.shutdown()
+        root.destroy()
+
+
+def run_scenario(name, mode, params, workbook, import_file, ops, trace):
+    """在子进程中运行一个场景，返回结果字典"""
+    result = {"scenario": name, "mode": mode, **params, "ops": ops, "steps": {}}
+    recorder = Recorder(trace)
+    work_dir = tempfile.mkdtemp(prefix="excel_bench_")
+    try:
+        # 保存会改写工作簿，在副本上测量
+        work_copy = os.path.join(work_dir, os.path.basename(workbook))
+        shutil.copyfile(workbook, work_copy)
+        runner = run_gui if mode == "gui" else run_engine
+        runner(recorder, work_copy, import_file, ops, work_dir)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    result["steps"] = recorder.steps
+    if resource is not None:
+        # Linux上ru_maxrss的单位为KB，macOS上为字节
+        scale = 1 if sys.platform == "darwin" else 1024
+        result["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6, 1)
+    return result
+
+
+def start_display():
+    """没有DISPLAY时启动Xvfb虚拟X服务器，返回其进程（已有显示时返回None）"""
+    if os.environ.get("DISPLAY"):
+        return None
+    xvfb = shutil.which("Xvfb")
+    if xvfb is None:
+        raise RuntimeError("没有DISPLAY且未找到Xvfb，无法测量界面路径")
+    for number in range(99, 130):
+        if os.path.exists(f"/tmp/.X{number}-lock"):
+            continue
+        process = subprocess.Popen([xvfb, f":{number}", "-screen", "0", "1280x1024x24", "-nolisten", "tcp"],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 5
+        while process.poll() is None and time.monotonic() < deadline:
+            if os.path.exists(f"/tmp/.X11-unix/X{number}"):
+                os.environ["DISPLAY"] = f":{number}"
+                return process
+            time.sleep(0.05)
+        process.kill()
+    raise RuntimeError("启动Xvfb失败")
+
+
+def compare(results, baseline, tolerance):
+    """与基线比较，返回回退列表[(场景, 模式, 步骤, 指标, 基线值, 当前值)]"""
+    old = {(result["scenario"], result["mode"], step): metrics
+           for result in baseline.get("results", []) for step, metrics in result.get("steps", {}).items()}
+    regressions = []
+    for result in results:
+        for step, metrics in result["steps"].items():
+            before = old.get((result["scenario"], result["mode"], step))
+            if before is None:
+                continue
+            for metric, min_delta in (("seconds", MIN_SECONDS_DELTA), ("peak_mb", MIN_MEMORY_DELTA)):
+                new_value, old_value = metrics.get(metric), before.get(metric)
+                if new_value is None or old_value is None:
+                    continue
+                if new_value > old_value * (1 + tolerance) and new_value - old_value >= min_delta:
+                    regressions.append((result["scenario"], result["mode"], step, metric, old_value, new_value))
+    return regressions
+
+
+def print_results(results, out):
+    for result in results:
+        rss = f"，峰值RSS {result['max_rss_mb']}MB" if "max_rss_mb" in result else ""
+        print(f"[{result['scenario']}/{result['mode']}] {result['rows']}行 x {result['cols']}列 x "
+              f"{result['sheets']}个工作表{rss}", file=out)
+        for step, metrics in result["steps"].items():
+            per_op = f"（每次{metrics['seconds'] / metrics['ops'] * 1000:.2f}ms）" if metrics["ops"] > 1 else ""
+            peak = f"  峰值{metrics['peak_mb']:.1f}MB" if metrics["peak_mb"] is not None else ""
+            print(f"  {step:<16}{metrics['seconds']:>10.3f}s{peak}{per_op}", file=out)
+        if "error" in result:
+            print(f"  失败: {result['error']}", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", default=DEFAULT_SCENARIOS,
+                        help=f"逗号分隔的预设场景（{', '.join(SCENARIOS)}）或all，默认{DEFAULT_SCENARIOS}")
+    parser.add_argument("--rows", type=int, help="自定义场景的行数（与--cols、--sheets一起代替预设场景）")
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--sheets", type=int, default=1)
+    parser.add_argument("--mode", choices=["engine", "gui", "both"], default="engine")
+    parser.add_argument("--ops", type=int, default=100, help="修改、新增和删除的记录数")
+    parser.add_argument("--no-memory", action="store_true", help="不用tracemalloc测量峰值内存（耗时更准确）")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "excel_manager_bench"),
+                        help="合成工作簿的缓存目录")
+    parser.add_argument("--json", default="-", help="结果JSON文件，默认输出到标准输出")
+    parser.add_argument("--baseline", help="基线结果JSON文件")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许比基线慢（或多用内存）的比例")
+    args = parser.parse_args()
+
+    if args.rows:
+        scenarios = {"custom": (args.rows, args.cols, args.sheets)}
+    else:
+        names = list(SCENARIOS) if args.scenario == "all" else args.scenario.split(",")
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            parser.error(f"未知的场景: {', '.join(unknown)}")
+        scenarios = {name: SCENARIOS[name] for name in names}
+    modes = ["engine", "gui"] if args.mode == "both" else [args.mode]
+
+    display = None
+    if "gui" in modes:
+        try:
+            display = start_display()
+        except RuntimeError as e:
+            print(f"跳过gui模式: {e}", file=sys.stderr)
+            modes.remove("gui")
+
+    results = []
+    try:
+        for name, (rows, cols, sheets) in scenarios.items():
+            workbook, import_file = prepare_workbooks(args.data_dir, rows, cols, sheets)
+            params = {"rows": rows, "cols": cols, "sheets": sheets}
+            for mode in modes:
+                print(f"正在运行 {name}/{mode}", file=sys.stderr)
+                # 每个场景一个新的子进程，峰值RSS和缓存互不影响
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    results.append(pool.submit(run_scenario, name, mode, params, workbook, import_file,
+                                               args.ops, not args.no_memory).result())
+    finally:
+        if display is not None:
+            display.terminate()
+
+    print_results(results, sys.stderr)
+    output = {
+        "meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "pandas": pd.__version__, "platform": platform.platform(), "cpus": os.cpu_count(),
+                 "memory_tracing": not args.no_memory},
+        "results": results,
+    }
+    text = json.dumps(output, ensure_ascii=False, indent=2)
+    if args.json == "-":
+        print(text)
+    else:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    failed = any("error" in result for result in results)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("memory_tracing") != output["meta"]["memory_tracing"]:
+            print("注意: 基线与本次的内存测量设置不同，耗时不可直接比较", file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        for scenario, mode, step, metric, old, new in regressions:
+            unit = "s" if metric == "seconds" else "MB"
+            print(f"回退: {scenario}/{mode} {step} {metric} {old}{unit} -> {new}{unit}", file=sys.stderr)
+        if not regressions:
+            print(f"与基线相比没有超出{args.tolerance:.0%}的回退", file=sys.stderr)
+        failed |= bool(regressions)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
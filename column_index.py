@@ -0,0 +1,215 @@
+import numpy as np
+import pandas as pd
+
+# 筛选条件类型
+FILTER_CONTAINS = "contains"
+FILTER_EQUALS = "equals"
+FILTER_NUMBER_RANGE = "number_range"
+FILTER_DATE_RANGE = "date_range"
+# 小写定长字符串数组的内存上限（字节），超过时子串匹配逐个比较
+TEXT_ARRAY_LIMIT = 256 * 1024 * 1024
+# 转换为文本时格式取决于整列的值的列类型（日期时间、时间间隔），修改单元格后需要重建文本
+COLUMN_FORMATTED_KINDS = "mM"
+
+
+def parse_number(text):
+    """解析数值范围的边界，空字符串表示不限"""
+    text = text.strip()
+    if not text:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        raise ValueError(f"无效的数值: {text}")
+
+
+def parse_date(text, end=False):
+    """解析日期范围的边界，空字符串表示不限；上界只给出日期时包含当天"""
+    text = text.strip()
+    if not text:
+        return None
+    try:
+        value = pd.Timestamp(text)
+    except ValueError:
+        raise ValueError(f"无效的日期: {text}")
+    if end and ":" not in text:
+        value = value.normalize() + pd.Timedelta(days=1) - pd.Timedelta(1, "ns")
+    return value.value
+
+
+class RowFilter:
+    """一列上的筛选条件
+
+    包含（不区分大小写的子串）和等于使用value；数值范围和日期范围的下界为value、上界为upper，
+    边界可以为空，表示不限。
+    """
+
+    def __init__(self, column, kind, value="", upper=""):
+        self.column = column
+        self.kind = kind
+        self.value = value
+        self.upper = upper
+        if kind == FILTER_NUMBER_RANGE:
+            self.bounds = (parse_number(value), parse_number(upper))
+        elif kind == FILTER_DATE_RANGE:
+            self.bounds = (parse_date(value), parse_date(upper, end=True))
+        else:
+            self.bounds = None
+
+    def describe(self):
+        """条件的文字描述"""
+        if self.kind == FILTER_CONTAINS:
+            return f"{self.column} 包含 “{self.value}”"
+        if self.kind == FILTER_EQUALS:
+            return f"{self.column} = “{self.value}”"
+        return f"{self.column} ∈ [{self.value.strip() or '-∞'}, {self.upper.strip() or '+∞'}]"
+
+
+class SortedValues:
+    """一列数值（或日期的纳秒数）按值排序后的数组和对应的行位置，用于范围查找"""
+
+    def __init__(self, values, null):
+        valid = np.flatnonzero(~null)
+        order = np.argsort(values[valid], kind="stable")
+        self.sorted_values = values[valid][order]
+        self.positions = valid[order]
+
+    def range_mask(self, low, high, length):
+        """值在[low, high]内的行的布尔掩码，边界为None时不限"""
+        start = 0 if low is None else np.searchsorted(self.sorted_values, low, side="left")
+        stop = len(self.sorted_values) if high is None else np.searchsorted(self.sorted_values, high, side="right")
+        mask = np.zeros(length, dtype=bool)
+        mask[self.positions[start:stop]] = True
+        return mask
+
+    def update(self, position, value, null):
+        """修改一行的值：从排序数组中移除旧值并把新值插入到对应位置"""
+        index = np.flatnonzero(self.positions == position)
+        if len(index):
+            self.sorted_values = np.delete(self.sorted_values, index)
+            self.positions = np.delete(self.positions, index)
+        if not null:
+            # 值相同的行按行位置排列，与重新构建（稳定排序）的结果一致
+            start = np.searchsorted(self.sorted_values, value, side="left")
+            stop = np.searchsorted(self.sorted_values, value, side="right")
+            index = start + np.searchsorted(self.positions[start:stop], position)
+            self.sorted_values = np.insert(self.sorted_values, index, value)
+            self.positions = np.insert(self.positions, index, position)
+
+
+def numeric_values(series):
+    """列转换为浮点数组和空值掩码，无法转换的值视为空"""
+    values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    return values, np.isnan(values)
+
+
+def text_values(series):
+    """列转换为单元格文本（对象数组）"""
+    # pandas的字符串类型转换后仍保留空值，与object列一样显示为"nan"
+    return series.astype(str).fillna("nan").to_numpy(dtype=object)
+
+
+def date_values(series):
+    """列转换为纳秒整数数组和空值掩码，无法转换的值视为空"""
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        # 数值列不按日期解释
+        series = pd.Series(pd.NaT, index=series.index, dtype="datetime64[ns]")
+    elif not pd.api.types.is_datetime64_any_dtype(series.dtype):
+        series = pd.to_datetime(series, errors="coerce", format="mixed")
+    dates = series.to_numpy(dtype="datetime64[ns]")
+    return dates.view(np.int64).copy(), np.isnat(dates)
+
+
+class ColumnIndex:
+    """一列的筛选索引
+
+    各部分在第一次用到时才构建：单元格文本（精确匹配）、小写文本数组（子串匹配）、
+    按值排序的数值和日期数组（范围查找）。单元格修改时通过update增量更新已构建的部分。
+    """
+
+    def __init__(self, source):
+        self.source = source  # 返回该列当前Series的函数
+        self._strings = None
+        self._lower = None
+        self._numbers = None
+        self._dates = None
+
+    def __len__(self):
+        return len(self.source())
+
+    def strings(self):
+        """单元格的文本（对象数组）"""
+        if self._strings is None:
+            self._strings = text_values(self.source())
+        return self._strings
+
+    def lower(self):
+        """小写文本；内存允许时为定长字符串数组，以便向量化查找子串"""
+        if self._lower is None:
+            strings = self.strings()
+            width = max(map(len, strings), default=1) or 1
+            if width * 4 * len(strings) <= TEXT_ARRAY_LIMIT:
+                self._lower = np.char.lower(strings.astype(f"U{width}"))
+            else:
+                self._lower = np.array([text.lower() for text in strings], dtype=object)
+        return self._lower
+
+    def numbers(self):
+        if self._numbers is None:
+            self._numbers = SortedValues(*numeric_values(self.source()))
+        return self._numbers
+
+    def dates(self):
+        if self._dates is None:
+            self._dates = SortedValues(*date_values(self.source()))
+        return self._dates
+
+    def match(self, row_filter):
+        """按条件计算该列的布尔掩码"""
+        if row_filter.kind == FILTER_CONTAINS:
+            needle = row_filter.value.lower()
+            lower = self.lower()
+            if lower.dtype == object:
+                return np.fromiter((needle in text for text in lower), dtype=bool, count=len(lower))
+            return np.char.find(lower, needle) >= 0
+        if row_filter.kind == FILTER_EQUALS:
+            if pd.api.types.is_numeric_dtype(self.source().dtype):
+                try:
+                    number = float(row_filter.value)
+                except ValueError:
+                    pass
+                else:
+                    return self.numbers().range_mask(number, number, len(self))
+            return self.strings() == row_filter.value
+        if row_filter.kind == FILTER_NUMBER_RANGE:
+            return self.numbers().range_mask(*row_filter.bounds, len(self))
+        if row_filter.kind == FILTER_DATE_RANGE:
+            return self.dates().range_mask(*row_filter.bounds, len(self))
+        raise ValueError(f"未知的筛选条件: {row_filter.kind}")
+
+    def update(self, position):
+        """单元格修改后增量更新已构建的部分（该位置的值已写入列中）"""
+        # 取出写入后的值（保留列类型），文本与整列转换的结果一致
+        cell = self.source().iloc[[position]]
+        if self._strings is not None:
+            if cell.dtype.kind in COLUMN_FORMATTED_KINDS:
+                self._strings = self._lower = None
+            else:
+                text = text_values(cell)[0]
+                self._strings[position] = text
+                if self._lower is not None:
+                    if self._lower.dtype != object and len(text) > self._lower.dtype.itemsize // 4:
+                        # 新文本超出定长数组的宽度，下次查找时重建
+                        self._lower = None
+                    else:
+                        self._lower[position] = text.lower()
+        if self._numbers is not None:
+            values, null = numeric_values(cell)
+            self._numbers.update(position, values[0], null[0])
+        if self._dates is not None:
+            if cell.dtype.kind == "M" or pd.api.types.is_numeric_dtype(cell.dtype):
+                values, null = date_values(cell)
+                self._dates.update(position, values[0], null[0])
+            else:
+                # 文本按整列推断日期格式，单个值的解析结果可能不同，下次查找时重建
+                self._dates = None
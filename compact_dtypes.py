@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+# 不同值的个数不超过行数的该比例时，字符串列转换为分类类型
+CATEGORY_RATIO = 0.5
+# 行数少于该值时不转换为分类类型（类别索引的开销不值得）
+CATEGORY_MIN_ROWS = 100
+
+try:
+    import pyarrow  # noqa: F401
+    ARROW_STRING_DTYPE = pd.StringDtype("pyarrow")
+except ImportError:
+    ARROW_STRING_DTYPE = None
+
+
+def compact_numeric(series):
+    """把数值列转换为能无损表示全部值的最小类型"""
+    kind = series.dtype.kind
+    if kind in "iu":
+        return pd.to_numeric(series, downcast="unsigned" if series.min() >= 0 else "integer")
+    if kind != "f":
+        return series
+    values = series.to_numpy()
+    valid = ~np.isnan(values)
+    if valid.any() and np.array_equal(values[valid], np.trunc(values[valid])) \
+            and np.abs(values[valid]).max() < 2 ** 53:
+        # 全部为整数值的浮点列（通常因为有空单元格）转换为可空整数
+        integers = pd.to_numeric(series.dropna().astype(np.int64), downcast="integer")
+        return series.astype(pd.api.types.pandas_dtype(integers.dtype.name.capitalize()))
+    float32 = values.astype(np.float32)
+    if np.array_equal(float32.astype(np.float64), values, equal_nan=True):
+        return series.astype(np.float32)
+    return series
+
+
+def compact_text(series):
+    """低基数字符串列转换为分类类型，其余纯字符串列在可用时使用Arrow字符串"""
+    values = series.dropna()
+    if not len(values) or not pd.api.types.infer_dtype(values, skipna=True) == "string":
+        # 混合类型的列保持不变
+        return series
+    if len(series) >= CATEGORY_MIN_ROWS and values.nunique() <= len(series) * CATEGORY_RATIO:
+        return series.astype("category")
+    if ARROW_STRING_DTYPE is not None:
+        return series.astype(ARROW_STRING_DTYPE)
+    return series
+
+
+def compact_frame(df):
+    """返回各列使用紧凑类型的DataFrame（数值降位、低基数字符串分类编码）"""
+    columns = {}
+    for i in range(df.shape[1]):
+        series = df.iloc[:, i]
+        if pd.api.types.is_bool_dtype(series.dtype) or isinstance(series.dtype, pd.CategoricalDtype):
+            columns[i] = series
+        elif isinstance(series.dtype, np.dtype) and series.dtype.kind in "iuf":
+            columns[i] = compact_numeric(series)
+        elif pd.api.types.is_object_dtype(series.dtype) or pd.api.types.is_string_dtype(series.dtype):
+            columns[i] = compact_text(series)
+        else:
+            columns[i] = series
+    compact = pd.DataFrame(columns, index=df.index, copy=False)
+    compact.columns = df.columns
+    return compact
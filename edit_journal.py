@@ -0,0 +1,224 @@
+import sys
+from collections import deque
+
+import numpy as np
+
+from workbook_session import frame_memory
+
+# 每个工作表的撤销记录默认占用的内存上限（字节）
+DEFAULT_JOURNAL_BUDGET = 64 * 1024 * 1024
+# 最多保留的撤销步数
+MAX_JOURNAL_STEPS = 1000
+
+
+class CellDelta:
+    """修改一行中若干单元格：记录各列的原值和新值（以及被改变的列类型）"""
+
+    def __init__(self, row_id, old, new, dtype_changes):
+        self.row_id = row_id
+        self.old = old                      # 列名 -> 原值
+        self.new = new                      # 列名 -> 新值
+        self.dtype_changes = dtype_changes  # 列名 -> (原类型, 新类型)
+        self.nbytes = 200 + sum(sys.getsizeof(value) for value in list(old.values()) + list(new.values()))
+
+    @property
+    def description(self):
+        return "修改单元格" if len(self.new) == 1 else "修改记录"
+
+    def undo(self, model):
+        changes = model.update_cells(self.row_id, self.old, allow_dtype_change=True)
+        model.restore_dtypes({column: old for column, (old, new) in self.dtype_changes.items()})
+        return changes
+
+    def redo(self, model):
+        return model.update_cells(self.row_id, self.new, allow_dtype_change=True)
+
+
+class BlockDelta:
+    """修改多行中的若干单元格：记录这些单元格的原值和新值（索引为行ID的DataFrame）以及被改变的列类型"""
+
+    def __init__(self, old, new, dtype_changes):
+        self.old = old
+        self.new = new
+        self.dtype_changes = dtype_changes
+        self.nbytes = frame_memory(old) + frame_memory(new)
+
+    @property
+    def description(self):
+        return f"修改{len(self.new)}条记录"
+
+    def undo(self, model):
+        changes = model.update_rows(self.old, allow_dtype_change=True)
+        model.restore_dtypes({column: old for column, (old, new) in self.dtype_changes.items()})
+        return changes
+
+    def redo(self, model):
+        return model.update_rows(self.new, allow_dtype_change=True)
+
+
+class RowsDelta:
+    """插入或删除一批行：记录这些行的数据（索引为行ID）和它们在DataFrame中的位置
+
+    插入的行可以只给出行ID（row_ids），撤销时再从模型中取出这些行的数据用于重做。
+    """
+
+    def __init__(self, rows, positions, inserted, dtype_changes=None, added_columns=(), row_ids=None):
+        self.rows = rows
+        self.row_ids = rows.index if row_ids is None else row_ids
+        self.positions = np.asarray(positions)
+        self.inserted = inserted
+        self.dtype_changes = dtype_changes or {}
+        self.added_columns = list(added_columns)  # 插入时新增的列
+        self.nbytes = (frame_memory(rows) if rows is not None else 0) + self.positions.nbytes * 2
+
+    @property
+    def description(self):
+        return f"{'新增' if self.inserted else '删除'}{len(self.row_ids)}条记录"
+
+    def undo(self, model):
+        if self.inserted:
+            if self.rows is None:
+                self.rows = model.take(model.positions(self.row_ids))
+            changes = model.delete_rows(self.row_ids)
+            if self.added_columns:
+                changes = model.drop_columns(self.added_columns)
+            model.restore_dtypes({column: old for column, (old, new) in self.dtype_changes.items()})
+            return changes
+        return model.restore_rows(self.rows, self.positions)
+
+    def redo(self, model):
+        if self.inserted:
+            return model.restore_rows(self.rows, self.positions)
+        return model.delete_rows(self.row_ids)
+
+
+class OrderDelta:
+    """改变排序：记录排序前后的显示顺序（行位置的排列）和排序条件"""
+
+    def __init__(self, old, new):
+        self.old = old  # (order, sort_spec)
+        self.new = new
+        self.nbytes = sum(order.nbytes for order, spec in (old, new) if order is not None)
+
+    description = "排序"
+
+    def undo(self, model):
+        return model.set_order(*self.old)
+
+    def redo(self, model):
+        return model.set_order(*self.new)
+
+
+class FrameDelta:
+    """整体替换数据：保留替换前后的DataFrame"""
+
+    def __init__(self, old, new):
+        self.old = old
+        self.new = new
+        self.nbytes = frame_memory(old)
+
+    description = "替换工作表数据"
+
+    def undo(self, model):
+        return model.replace(self.old)
+
+    def redo(self, model):
+        return model.replace(self.new)
+
+
+class CompoundDelta:
+    """作为一步撤销的多个修改（如按键合并的更新、删除和新增），以及操作前统一转换的列类型"""
+
+    def __init__(self, deltas, description, dtype_changes=None):
+        self.deltas = list(deltas)
+        self.description = description
+        self.dtype_changes = dtype_changes or {}
+        self.nbytes = sum(delta.nbytes for delta in self.deltas)
+
+    def undo(self, model):
+        changes = [delta.undo(model) for delta in reversed(self.deltas)]
+        changes.append(model.restore_dtypes({column: old for column, (old, new) in self.dtype_changes.items()}))
+        return changes[0].combine(changes)
+
+    def redo(self, model):
+        changes = [model.restore_dtypes({column: new for column, (old, new) in self.dtype_changes.items()})]
+        changes.extend(delta.redo(model) for delta in self.deltas)
+        return changes[0].combine(changes)
+
+
+class DeltaCollector:
+    """临时代替模型的撤销记录，收集一次复合操作中各步骤的修改"""
+
+    replaying = False
+
+    def __init__(self):
+        self.deltas = []
+
+    def record(self, delta):
+        self.deltas.append(delta)
+
+
+class EditJournal:
+    """一个工作表的撤销/重做记录
+
+    每次修改只记录能够还原它的最小差异（单元格原值、增删的行、排序前后的顺序），
+    撤销和重做返回ChangeSet，视图据此增量更新。记录总大小超过budget或步数超过
+    max_steps时丢弃最早的记录。
+    """
+
+    def __init__(self, budget=DEFAULT_JOURNAL_BUDGET, max_steps=MAX_JOURNAL_STEPS):
+        self.budget = budget
+        self.max_steps = max_steps
+        self.undo_stack = deque()
+        self.redo_stack = deque()
+        self.nbytes = 0
+        self.replaying = False  # 撤销/重做执行期间，模型的修改不再记录
+        self.frame = None       # 记录对应的DataFrame的弱引用
+
+    def record(self, delta):
+        """记录一次修改，清空重做记录"""
+        if self.replaying:
+            return
+        for old in self.redo_stack:
+            self.nbytes -= old.nbytes
+        self.redo_stack.clear()
+        self.undo_stack.append(delta)
+        self.nbytes += delta.nbytes
+        while self.undo_stack and (self.nbytes > self.budget or len(self.undo_stack) > self.max_steps):
+            self.nbytes -= self.undo_stack.popleft().nbytes
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def undo(self, model):
+        """撤销最近一次修改，返回(记录, 变更集)，没有可撤销的修改时返回None"""
+        if not self.undo_stack:
+            return None
+        delta = self.undo_stack[-1]
+        changes = self._replay(delta.undo, model)
+        self.redo_stack.append(self.undo_stack.pop())
+        return delta, changes
+
+    def redo(self, model):
+        """重做最近一次撤销的修改，返回(记录, 变更集)，没有可重做的修改时返回None"""
+        if not self.redo_stack:
+            return None
+        delta = self.redo_stack[-1]
+        changes = self._replay(delta.redo, model)
+        self.undo_stack.append(self.redo_stack.pop())
+        return delta, changes
+
+    def _replay(self, action, model):
+        self.replaying = True
+        try:
+            return action(model)
+        finally:
+            self.replaying = False
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.nbytes = 0
@@ -0,0 +1,135 @@
+"""Excel文件批量处理命令行工具，多个文件在进程池中并行处理
+
+用法:
+  python excel_cli.py convert 文件或目录... -o 输出目录 [--format xlsx|csv|tsv|parquet] [-j 进程数]
+  python excel_cli.py merge 文件或目录... -o 输出文件 [--sheet 工作表名] [--align union|intersect] [-j 进程数]
+
+convert把每个工作簿转换为xlsx（保留全部工作表）或每个工作表一个CSV/TSV/Parquet文件；
+merge把各文件中同名（默认第一个）工作表的记录按列名对齐（取并集或交集）后合并为一个工作表。
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from io_backends import write_frames
+from multi_import import ALIGN_INTERSECT, ALIGN_UNION
+from workbook_engine import WorkbookEngine
+
+# 目录中被处理的文件类型
+WORKBOOK_PATTERNS = ("*.xlsx", "*.xls")
+
+
+def collect_files(paths):
+    """展开参数中的目录，返回要处理的文件列表（忽略Excel的临时文件）"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in WORKBOOK_PATTERNS:
+                files.extend(sorted(glob.glob(os.path.join(path, pattern))))
+        else:
+            files.append(path)
+    return [path for path in files if not os.path.basename(path).startswith(("~$", ".~"))]
+
+
+def convert_workbook(file_path, output_dir, fmt):
+    """转换一个工作簿（在子进程中执行），返回(工作表数, 记录数)"""
+    engine = WorkbookEngine()
+    sheets = engine.open(file_path)
+    try:
+        base = os.path.splitext(os.path.basename(file_path))[0]
+        if fmt == "xlsx":
+            return len(sheets), engine.export(os.path.join(output_dir, base + ".xlsx"), sheets)
+        rows = 0
+        for sheet in sheets:
+            rows += engine.export(os.path.join(output_dir, f"{base}_{sheet}.{fmt}"), [sheet])
+        return len(sheets), rows
+    finally:
+        engine.close()
+
+
+def run_parallel(func, tasks, jobs):
+    """在进程池中对每个文件执行func(file, *args)，逐个报告进度，返回({文件: 结果}, {文件: 错误})"""
+    results, failures = {}, {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(func, file_path, *args): file_path for file_path, args in tasks}
+        for done, future in enumerate(as_completed(futures), start=1):
+            file_path = futures[future]
+            try:
+                results[file_path] = future.result()
+            except Exception as e:
+                failures[file_path] = e
+                print(f"[{done}/{len(futures)}] {file_path}: 失败: {e}", file=sys.stderr)
+            else:
+                print(f"[{done}/{len(futures)}] {file_path}: 完成")
+    return results, failures
+
+
+def convert(args):
+    files = collect_files(args.inputs)
+    os.makedirs(args.output, exist_ok=True)
+    start = time.perf_counter()
+    results, failures = run_parallel(convert_workbook, [(path, (args.output, args.format)) for path in files],
+                                     args.jobs)
+    sheets = sum(count for count, _ in results.values())
+    rows = sum(rows for _, rows in results.values())
+    print(f"已转换{len(results)}个文件（{sheets}个工作表，{rows}条记录），失败{len(failures)}个，"
+          f"耗时{time.perf_counter() - start:.1f}s")
+    return not failures
+
+
+def merge(args):
+    files = collect_files(args.inputs)
+    start = time.perf_counter()
+    sources = [(path, args.sheet) for path in files]
+
+    def progress(message, fraction=None):
+        print(message)
+
+    try:
+        # 各文件在进程池中并行读取，按列名对齐后一次合并
+        merged, report = WorkbookEngine.read_imports(sources, args.align, jobs=args.jobs, progress=progress)
+    except ValueError as e:
+        print(f"没有可合并的数据:\n{e}", file=sys.stderr)
+        return False
+    if report.summary():
+        print(report.summary(), file=sys.stderr if report.failures else sys.stdout)
+    try:
+        engine = write_frames(args.output, {args.sheet or "Sheet1": merged})
+    except ValueError as e:
+        print(f"无法写入{args.output}: {e}", file=sys.stderr)
+        return False
+    print(f"已合并{len(report.sources)}个文件，共{len(merged)}条记录: {args.output}（{engine}），失败{len(report.failures)}个，"
+          f"耗时{time.perf_counter() - start:.1f}s")
+    return not report.failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = subparsers.add_parser("convert", help="转换工作簿格式")
+    convert_parser.add_argument("inputs", nargs="+", help="工作簿文件或目录")
+    convert_parser.add_argument("-o", "--output", required=True, help="输出目录")
+    convert_parser.add_argument("--format", choices=["xlsx", "csv", "tsv", "parquet"], default="xlsx")
+    convert_parser.set_defaults(func=convert)
+
+    merge_parser = subparsers.add_parser("merge", help="合并多个文件的记录")
+    merge_parser.add_argument("inputs", nargs="+", help="工作簿文件或目录")
+    merge_parser.add_argument("-o", "--output", required=True, help="输出文件（.xlsx/.csv/.tsv/.parquet）")
+    merge_parser.add_argument("--sheet", help="要合并的工作表名，默认为第一个工作表")
+    merge_parser.add_argument("--align", choices=[ALIGN_UNION, ALIGN_INTERSECT], default=ALIGN_UNION,
+                              help="各文件的列不一致时取并集或交集，默认为并集")
+    merge_parser.set_defaults(func=merge)
+
+    for subparser in (convert_parser, merge_parser):
+        subparser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="并行进程数，默认为CPU核数")
+
+    args = parser.parse_args(argv)
+    return 0 if args.func(args) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,87 @@
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, simpledialog
 import pandas as pd
+import numpy as np
 import os
+import threading
+import time
+
+from column_index import FILTER_CONTAINS, FILTER_DATE_RANGE, FILTER_EQUALS, FILTER_NUMBER_RANGE, RowFilter
+from io_backends import TEXT_SEPARATORS, engine_summary, sheet_names
+from job_scheduler import JobConflict, JobScheduler
+from multi_import import ALIGN_NAMES, ALIGN_UNION, gui_pool_context
+from perf_trace import DEFAULT_PERF_LOG, TRACER, span
+from sheet_model import DtypeChangeError
+from sheet_summary import AGGREGATIONS, STAT_NAMES
+from sidecar_cache import SidecarCache
+from validation import TYPE_NAMES, ColumnRule
+from workbook_engine import WorkbookEngine, parse_records
+from workbook_session import file_signature
+
+# 虚拟滚动：记录数超过该阈值时只渲染可见窗口内的行
+VIRTUAL_ROW_THRESHOLD = 1000
+# 虚拟滚动时可见窗口上下额外渲染的行数
+VIRTUAL_OVERSCAN = 10
+# Treeview默认行高（像素）
+DEFAULT_ROW_HEIGHT = 20
+# 自动列宽：最小/最大宽度、每个字符的宽度和边距（像素）
+MIN_COLUMN_WIDTH = 100
+MAX_COLUMN_WIDTH = 300
+CHAR_WIDTH = 8
+COLUMN_PADDING = 20
+# 自动列宽采样行数（头部、尾部和随机行各取该数量）
+WIDTH_SAMPLE_ROWS = 200
+# 筛选条件类型的显示名称
+FILTER_KINDS = {"包含": FILTER_CONTAINS, "等于": FILTER_EQUALS,
+                "数值范围": FILTER_NUMBER_RANGE, "日期范围": FILTER_DATE_RANGE}
+# 输入筛选文本后自动筛选的延迟（毫秒）
+FILTER_DELAY_MS = 200
+# 导入多个文件时“每个文件的第一个工作表”选项
+FIRST_SHEET_LABEL = "（第一个工作表）"
+# 检查打开的文件是否被其他程序修改的间隔（毫秒）
+WATCH_INTERVAL_MS = 2000
+# 汇总面板：记录数超过该阈值且结果未缓存时在后台计算；修改数据后延迟刷新的时间（毫秒）；最多显示的分组数
+SUMMARY_BACKGROUND_ROWS = 100000
+SUMMARY_DELAY_MS = 300
+SUMMARY_MAX_GROUPS = 1000
+
+
+def sample_positions(row_count, size=WIDTH_SAMPLE_ROWS, seed=0):
+    """返回用于估算列宽的采样行位置（头部、尾部和随机行）"""
+    if row_count <= size * 3:
+        return np.arange(row_count)
+    rng = np.random.default_rng(seed)
+    head = np.arange(size)
+    tail = np.arange(row_count - size, row_count)
+    middle = rng.choice(np.arange(size, row_count - size), size=size, replace=False)
+    return np.unique(np.concatenate([head, middle, tail]))
+
+
+def compute_column_width(column, values):
+    """根据列名和采样值的字符串长度计算列宽"""
+    max_len = len(str(column))
+    if len(values):
+        max_len = max(max_len, max(map(len, format_column(values))))
+    return min(max(MIN_COLUMN_WIDTH, max_len * CHAR_WIDTH + COLUMN_PADDING), MAX_COLUMN_WIDTH)
+
+
+def format_column(series):
+    """将一列数据转换为显示字符串数组"""
+    if series.dtype.kind in "iufb":
+        # 数值列转为Python标量后再格式化，比astype(str)快
+        return list(map(str, series.to_numpy().tolist()))
+    text = series.astype(str)
+    if text.dtype != object:
+        # pandas的字符串类型转换后仍保留空值
+        text = text.fillna("nan")
+    return text.to_numpy()
+
+
+def format_rows(window):
+    """按列批量将若干行（DataFrame）转换为显示字符串，返回行元组列表"""
+    columns = [format_column(window.iloc[:, i]) for i in range(window.shape[1])]
+    return list(zip(*columns))
+
 
 class ExcelManager:
     def __init__(self, root):
@@ -10,10 +90,8 @@ class ExcelManager:
         self.root.geometry("1000x600")
         
         # 初始化变量
-        self.file_path = ""
-        self.df = None
-        self.current_sheet = ""
-        self.sheets = []
+        self.engine = WorkbookEngine()  # 不依赖界面的数据操作，self.model/self.df为其当前工作表
+        self.sidecar = SidecarCache()  # 磁盘列式缓存，加速重复打开同一工作簿
         
         # 创建主框架
         self.main_frame = ttk.Frame(self.root)
@@ -28,12 +106,34 @@ class ExcelManager:
         # 创建工作表选择区域
         self.create_sheet_selection()
         
+        # 创建筛选栏
+        self.create_filter_bar()
+        
         # 创建数据编辑区域
         self.create_data_area()
         
         # 创建状态栏
         self.create_status_bar()
         
+        # 后台任务调度器，耗时的文件操作在工作线程中执行
+        self.jobs = JobScheduler(self.root, on_progress=self.show_progress, on_finish=self.on_job_finish)
+        
+        # 操作计时：主线程中的操作完成后刷新，后台任务的操作在任务结束时刷新
+        self.perf_window = None
+        self.perf_version = None
+        self.perf_refresh_pending = False
+        self.shown_profile = None
+        TRACER.add_listener(self.on_span)
+        
+        # 汇总面板，修改数据后延迟刷新
+        self.summary_window = None
+        self.summary_pending = None
+        
+        # 定时检查打开的文件是否被其他程序修改
+        self.watch_signature = None   # 上次检查时发现的变化后的文件签名，连续两次相同才处理
+        self.watch_prompting = False  # 正在询问如何处理外部修改
+        self.root.after(WATCH_INTERVAL_MS, self.watch_file)
+        
     def create_menu(self):
         """创建菜单栏"""
         self.menu_bar = tk.Menu(self.root)
@@ -52,15 +152,50 @@ class ExcelManager:
         # 编辑菜单
         edit_menu = tk.Menu(self.menu_bar, tearoff=0)
         self.menu_bar.add_cascade(label="编辑", menu=edit_menu)
+        edit_menu.add_command(label="撤销", command=self.undo, accelerator="Ctrl+Z")
+        edit_menu.add_command(label="重做", command=self.redo, accelerator="Ctrl+Y")
+        edit_menu.add_separator()
         edit_menu.add_command(label="新增记录", command=self.add_record)
+        edit_menu.add_command(label="粘贴记录", command=self.paste_records, accelerator="Ctrl+Shift+V")
+        edit_menu.add_command(label="从文件添加记录...", command=self.add_records_from_file)
         edit_menu.add_command(label="删除记录", command=self.delete_record)
         edit_menu.add_command(label="修改记录", command=self.modify_record)
+        edit_menu.add_separator()
+        edit_menu.add_command(label="校验规则...", command=self.edit_validation_rules)
+        edit_menu.add_command(label="校验数据", command=self.validate_sheet)
+        
+        # 视图菜单
+        self.virtual_mode_var = tk.BooleanVar(value=True)
+        view_menu = tk.Menu(self.menu_bar, tearoff=0)
+        self.menu_bar.add_cascade(label="视图", menu=view_menu)
+        view_menu.add_checkbutton(label="大表虚拟滚动", variable=self.virtual_mode_var, command=self.update_treeview)
+        view_menu.add_command(label="恢复原始顺序", command=self.clear_sort)
+        self.stream_mode_var = tk.BooleanVar(value=True)
+        view_menu.add_checkbutton(label="流式加载工作表", variable=self.stream_mode_var)
+        view_menu.add_command(label="工作表缓存上限...", command=self.set_memory_budget)
+        self.compact_mode_var = tk.BooleanVar(value=False)
+        view_menu.add_checkbutton(label="紧凑加载（节省内存）", variable=self.compact_mode_var,
+                                  command=self.set_compact_mode)
+        self.sidecar_var = tk.BooleanVar(value=True)
+        view_menu.add_checkbutton(label="使用磁盘缓存", variable=self.sidecar_var)
+        view_menu.add_command(label="清除磁盘缓存", command=self.clear_sidecar_cache)
+        view_menu.add_separator()
+        view_menu.add_command(label="汇总...", command=self.show_summary)
+        view_menu.add_command(label="性能...", command=self.show_performance)
+        view_menu.add_command(label="分析下一次操作", command=self.profile_next_operation)
+        self.perf_log_var = tk.BooleanVar(value=False)
+        view_menu.add_checkbutton(label="写入性能日志", variable=self.perf_log_var, command=self.set_perf_log)
         
         # 帮助菜单
         help_menu = tk.Menu(self.menu_bar, tearoff=0)
         self.menu_bar.add_cascade(label="帮助", menu=help_menu)
         help_menu.add_command(label="关于", command=self.show_about)
         
+        self.root.bind("<Control-z>", lambda event: self.undo())
+        self.root.bind("<Control-y>", lambda event: self.redo())
+        self.root.bind("<Control-Z>", lambda event: self.redo())
+        self.root.bind("<Control-V>", lambda event: self.paste_records())
+        
     def create_toolbar(self):
         """创建工具栏"""
         self.toolbar = ttk.Frame(self.main_frame)
@@ -90,10 +225,47 @@ class ExcelManager:
         ttk.Label(self.sheet_frame, text="工作表：").pack(side=tk.LEFT)
         
         self.sheet_var = tk.StringVar()
+        self.sheet_labels = {}  # 工作表名 -> 下拉框中显示的文字（含记录数和列数）
         self.sheet_combobox = ttk.Combobox(self.sheet_frame, textvariable=self.sheet_var, state="readonly")
         self.sheet_combobox.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
         self.sheet_combobox.bind("<<ComboboxSelected>>", self.on_sheet_change)
         
+    def create_filter_bar(self):
+        """创建筛选栏"""
+        self.filter_frame = ttk.Frame(self.main_frame)
+        self.filter_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(self.filter_frame, text="筛选：").pack(side=tk.LEFT)
+        
+        self.filter_column_var = tk.StringVar()
+        self.filter_column_combobox = ttk.Combobox(self.filter_frame, textvariable=self.filter_column_var,
+                                                   state="readonly", width=15)
+        self.filter_column_combobox.pack(side=tk.LEFT, padx=2)
+        
+        self.filter_kind_var = tk.StringVar(value="包含")
+        ttk.Combobox(self.filter_frame, textvariable=self.filter_kind_var, values=list(FILTER_KINDS),
+                     state="readonly", width=8).pack(side=tk.LEFT, padx=2)
+        
+        self.filter_value_var = tk.StringVar()
+        filter_entry = ttk.Entry(self.filter_frame, textvariable=self.filter_value_var, width=15)
+        filter_entry.pack(side=tk.LEFT, padx=2)
+        filter_entry.bind("<KeyRelease>", self.on_filter_key)
+        filter_entry.bind("<Return>", lambda event: self.apply_filter())
+        
+        ttk.Label(self.filter_frame, text="至").pack(side=tk.LEFT)
+        self.filter_upper_var = tk.StringVar()
+        upper_entry = ttk.Entry(self.filter_frame, textvariable=self.filter_upper_var, width=15)
+        upper_entry.pack(side=tk.LEFT, padx=2)
+        upper_entry.bind("<Return>", lambda event: self.apply_filter())
+        
+        ttk.Button(self.filter_frame, text="筛选", command=self.apply_filter).pack(side=tk.LEFT, padx=2)
+        ttk.Button(self.filter_frame, text="清除筛选", command=self.clear_filters).pack(side=tk.LEFT, padx=2)
+        
+        # 当前生效的筛选条件
+        self.filter_label_var = tk.StringVar()
+        ttk.Label(self.filter_frame, textvariable=self.filter_label_var).pack(side=tk.LEFT, padx=5)
+        self.filter_pending = None
+        
     def create_data_area(self):
         """创建数据编辑区域"""
         self.data_frame = ttk.Frame(self.main_frame)
@@ -105,14 +277,19 @@ class ExcelManager:
         
         # 创建Treeview用于显示数据
         self.tree = ttk.Treeview(self.data_frame, columns=[], show="headings", 
-                                yscrollcommand=self.vsb.set, xscrollcommand=self.hsb.set)
+                                yscrollcommand=self.on_tree_yscroll, xscrollcommand=self.hsb.set)
         
-        self.vsb.config(command=self.tree.yview)
+        self.vsb.config(command=self.on_vscroll)
         self.hsb.config(command=self.tree.xview)
         
         # 绑定双击事件，用于编辑单元格
         self.tree.bind("<Double-1>", self.on_cell_double_click)
         
+        # 绑定选择和尺寸变化事件，用于虚拟滚动
+        self.tree.bind("<Button-1>", self.on_tree_click, add="+")
+        self.tree.bind("<<TreeviewSelect>>", self.on_tree_select)
+        self.tree.bind("<Configure>", self.on_tree_configure)
+        
         # 布局Treeview和滚动条
         self.vsb.pack(side=tk.RIGHT, fill=tk.Y)
         self.hsb.pack(side=tk.BOTTOM, fill=tk.X)
@@ -126,188 +303,392 @@ class ExcelManager:
         self.edit_entry.pack_forget()
         
         # 编辑状态变量
-        self.editing_cell = None  # (item_id, column)
+        self.editing_cell = None  # (row_id, column)
+        
+        # 虚拟滚动状态变量
+        self.virtual = False         # 当前是否处于虚拟滚动模式
+        self.view_offset = 0         # 可见区域第一行的显示行号
+        self.window_start = 0        # 已渲染的第一行的显示行号
+        self.window_rows = []        # 已渲染行对应的DataFrame行位置（按显示顺序，取自model.view）
+        self.selected_ids = set()    # 选中记录的行ID
+        self.sort_append = False     # 按住Shift单击列标题时追加排序列
+        self.render_pending = False  # 是否已安排重新渲染
+        
+        # 列宽缓存：列名 -> 宽度，仅在列数据变化时重新计算
+        self.column_widths = {}
         
     def create_status_bar(self):
         """创建状态栏"""
+        self.status_frame = ttk.Frame(self.root)
+        self.status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        
         self.status_var = tk.StringVar()
         self.status_var.set("就绪")
-        self.status_bar = ttk.Label(self.root, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
-        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.status_bar = ttk.Label(self.status_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
+        # 最近一次操作的耗时
+        self.perf_var = tk.StringVar()
+        ttk.Label(self.status_frame, textvariable=self.perf_var, relief=tk.SUNKEN, anchor=tk.E).pack(side=tk.RIGHT)
+        self.status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        # 后台任务进度条和取消按钮，仅在任务执行时显示
+        self.progress = ttk.Progressbar(self.status_frame, length=160, mode="determinate", maximum=100)
+        self.btn_cancel = ttk.Button(self.status_frame, text="取消", command=self.cancel_jobs)
         
     def open_file(self):
         """打开Excel文件"""
+        if not self.check_idle():
+            return
         filetypes = [("Excel文件", "*.xlsx;*.xls"), ("所有文件", "*.*")]
         filepath = filedialog.askopenfilename(title="打开Excel文件", filetypes=filetypes)
         
         if filepath:
-            try:
-                self.status_var.set(f"正在打开文件: {filepath}")
-                self.root.update_idletasks()
-                
-                # 读取Excel文件，获取所有工作表
-                self.file_path = filepath
-                xl = pd.ExcelFile(filepath)
-                self.sheets = xl.sheet_names
+            self.status_var.set(f"正在打开文件: {filepath}")
+            
+            self.engine.sidecar = self.sidecar if self.sidecar_var.get() else None
+            self.engine.set_compact(self.compact_mode_var.get())
+            
+            def work(job):
+                # 打开工作簿会话，获取所有工作表
+                return self.engine.open_session(filepath)
+            
+            def done(session):
+                # 切换到新文件，清空上一个文件的数据
+                self.engine.attach(session)
+                self.update_treeview()
                 
-                # 更新工作表选择下拉框
-                self.sheet_combobox['values'] = self.sheets
-                if self.sheets:
+                # 更新工作表选择下拉框（各工作表的大小来自工作簿清单，尚未解析数据）
+                sheets = self.engine.sheets
+                self.update_sheet_list()
+                self.status_var.set(f"已打开文件: {os.path.basename(filepath)}，共{len(sheets)}个工作表")
+                if sheets:
                     # 选择第一个工作表
-                    self.sheet_var.set(self.sheets[0])
-                    self.current_sheet = self.sheets[0]
-                    self.load_sheet_data(self.current_sheet)
-                
-                self.status_var.set(f"已打开文件: {os.path.basename(filepath)}，共{len(self.sheets)}个工作表")
-            except Exception as e:
-                messagebox.showerror("错误", f"打开文件失败: {str(e)}")
-                self.status_var.set("打开文件失败")
+                    self.select_sheet_label(sheets[0])
+                    self.load_sheet_data(sheets[0])
+            
+            self.submit_job(filepath, "打开文件", work, done, "打开文件失败")
         
     def save_file(self):
         """保存Excel文件"""
-        if self.df is not None and self.file_path:
-            try:
-                self.status_var.set("正在保存文件...")
-                self.root.update_idletasks()
-                
-                # 创建ExcelWriter对象，保存所有工作表
-                with pd.ExcelWriter(self.file_path, engine='openpyxl' if self.file_path.endswith('.xlsx') else 'xlwt') as writer:
-                    # 先保存当前修改的工作表
-                    self.df.to_excel(writer, sheet_name=self.current_sheet, index=False)
-                    
-                    # 保存其他未修改的工作表
-                    xl = pd.ExcelFile(self.file_path)
-                    for sheet in self.sheets:
-                        if sheet != self.current_sheet:
-                            df_other = pd.read_excel(self.file_path, sheet_name=sheet)
-                            df_other.to_excel(writer, sheet_name=sheet, index=False)
-                
-                self.status_var.set(f"文件已保存: {os.path.basename(self.file_path)}")
+        if self.model is not None and self.engine.file_path:
+            if not self.check_idle():
+                return
+            # 文件已被其他程序修改时先重新加载其他工作表的修改，有冲突时确认是否覆盖
+            changes = self.engine.detect_changes()
+            if changes is not None:
+                if changes.conflicts and not messagebox.askyesno(
+                        "文件已被修改",
+                        f"文件已被其他程序修改，工作表“{'、'.join(sorted(changes.conflicts))}”同时有未保存的修改。\n\n"
+                        "继续保存将用本地数据覆盖其他程序对这些工作表的修改，是否继续？"):
+                    return
+                self.reload_external(changes, then=self.save_file)
+                return
+            self.status_var.set("正在保存文件...")
+            
+            # 只写入有修改的工作表，未修改的工作表部件原样复制，最后原子替换原文件；
+            # 新增记录的追加缓冲在主线程中先合并
+            self.engine.flush()
+            dirty_count = self.engine.dirty_count
+            file_path = self.engine.file_path
+            
+            def work(job):
+                return self.engine.save(progress=job.report)
+            
+            def done(result):
+                self.status_var.set(f"文件已保存: {os.path.basename(file_path)}，写入{dirty_count}个修改过的工作表")
                 messagebox.showinfo("成功", "文件保存成功")
-            except Exception as e:
-                messagebox.showerror("错误", f"保存文件失败: {str(e)}")
-                self.status_var.set("保存文件失败")
+            
+            self.submit_job(file_path, "保存文件", work, done, "保存文件失败")
         else:
             messagebox.showwarning("警告", "没有可保存的数据")
         
+    def watch_file(self):
+        """定时检查打开的文件是否被其他程序修改（比较修改时间和大小，不依赖系统的文件监视接口）"""
+        self.root.after(WATCH_INTERVAL_MS, self.watch_file)
+        session = self.engine.session
+        if session is None or self.watch_prompting or self.jobs.is_busy():
+            return
+        try:
+            signature = file_signature(session.file_path) if session.file_changed() else None
+        except OSError:  # 文件正在被其他程序替换
+            signature = None
+        # 文件可能还在写入中：连续两次检查的签名相同后再处理
+        if signature is None or signature != self.watch_signature:
+            self.watch_signature = signature
+            return
+        self.watch_signature = None
+        self.handle_external_change()
+    
+    def handle_external_change(self):
+        """文件被其他程序修改后重新加载内容有变化的工作表，有未保存修改的工作表询问是否放弃本地修改"""
+        changes = self.engine.detect_changes()
+        if changes is None:
+            return
+        discard = False
+        if changes.conflicts:
+            self.watch_prompting = True
+            try:
+                discard = messagebox.askyesno(
+                    "文件已被修改",
+                    f"文件已被其他程序修改，工作表“{'、'.join(sorted(changes.conflicts))}”同时有未保存的修改。\n\n"
+                    "是否放弃本地修改并重新加载？选择“否”保留本地修改，保存时将覆盖其他程序对这些工作表的修改。")
+            finally:
+                self.watch_prompting = False
+        self.reload_external(changes, discard)
+    
+    def reload_external(self, changes, discard=False, then=None):
+        """在后台按外部修改更新缓存，当前工作表内容有变化时重新显示（保留排序、筛选和滚动位置）"""
+        self.engine.flush()
+        current = self.current_sheet
+        
+        def work(job):
+            return self.engine.reload_changed(changes, discard)
+        
+        def done(reloaded):
+            sheets = self.engine.sheets
+            if current and current not in sheets:
+                self.engine.show("", None)
+                if sheets:
+                    self.select_sheet_label(sheets[0])
+                    self.load_sheet_data(sheets[0])
+                else:
+                    self.update_treeview()
+            elif current in reloaded:
+                self.engine.reshow(current)
+                self.invalidate_column_widths()
+                self.update_treeview()
+                self.schedule_summary_refresh(reset=True)
+            self.update_sheet_list()
+            self.status_var.set(f"文件已被其他程序修改，重新加载了{len(reloaded)}个工作表")
+            if then is not None:
+                then()
+        
+        self.submit_job(self.engine.file_path, "重新加载外部修改", work, done, "重新加载外部修改失败")
+    
     def import_file(self):
-        """导入Excel文件"""
+        """导入Excel文件（可同时选择多个文件）"""
         # 打开文件选择对话框
-        filetypes = [("Excel文件", "*.xlsx;*.xls"), ("所有文件", "*.*")]
-        filepath = filedialog.askopenfilename(title="导入Excel文件", filetypes=filetypes)
+        filetypes = [("Excel文件", "*.xlsx;*.xls"), ("CSV文件", "*.csv;*.tsv"), ("Parquet文件", "*.parquet"),
+                     ("所有文件", "*.*")]
+        filepaths = list(filedialog.askopenfilenames(title="导入Excel文件", filetypes=filetypes))
         
-        if filepath:
+        if filepaths and self.check_idle():
             try:
-                self.status_var.set(f"正在导入文件: {filepath}")
+                self.status_var.set(f"正在导入文件: {filepaths[0]}" if len(filepaths) == 1
+                                    else f"正在导入{len(filepaths)}个文件")
                 self.root.update_idletasks()
                 
-                # 读取要导入的Excel文件
-                xl = pd.ExcelFile(filepath)
-                import_sheets = xl.sheet_names
-                
-                # 让用户选择要导入的工作表
-                if import_sheets:
-                    # 创建导入选项对话框
-                    self.import_window = tk.Toplevel(self.root)
-                    self.import_window.title("导入选项")
-                    self.import_window.geometry("300x200")
-                    self.import_window.resizable(False, False)
-                    self.import_window.transient(self.root)
-                    self.import_window.grab_set()
-                    
-                    # 工作表选择
-                    ttk.Label(self.import_window, text="选择要导入的工作表:").pack(pady=10)
-                    self.import_sheet_var = tk.StringVar()
-                    self.import_sheet_var.set(import_sheets[0])
-                    sheet_combo = ttk.Combobox(self.import_window, textvariable=self.import_sheet_var, values=import_sheets, state="readonly")
-                    sheet_combo.pack(pady=5, padx=10, fill=tk.X)
-                    
-                    # 导入方式选择
-                    ttk.Label(self.import_window, text="导入方式:").pack(pady=10)
-                    self.import_mode_var = tk.StringVar()
-                    self.import_mode_var.set("merge")
-                    
-                    mode_frame = ttk.Frame(self.import_window)
-                    mode_frame.pack(pady=5)
-                    
-                    ttk.Radiobutton(mode_frame, text="合并到当前工作表", variable=self.import_mode_var, value="merge").pack(anchor=tk.W)
-                    ttk.Radiobutton(mode_frame, text="创建新工作表", variable=self.import_mode_var, value="new").pack(anchor=tk.W)
-                    
-                    # 按钮框架
-                    button_frame = ttk.Frame(self.import_window)
-                    button_frame.pack(fill=tk.X, padx=10, pady=10)
-                    
-                    ttk.Button(button_frame, text="确定", command=lambda: self.perform_import(filepath)).pack(side=tk.RIGHT, padx=5)
-                    ttk.Button(button_frame, text="取消", command=self.import_window.destroy).pack(side=tk.RIGHT, padx=5)
+                # 读取第一个文件的工作表列表；选择多个文件时可以导入每个文件的第一个工作表
+                import_sheets = sheet_names(filepaths[0])
+                if len(filepaths) > 1 or not import_sheets:
+                    import_sheets = [FIRST_SHEET_LABEL] + import_sheets
+                
+                # 创建导入选项对话框
+                self.import_window = tk.Toplevel(self.root)
+                self.import_window.title("导入选项")
+                self.import_window.geometry("320x480")
+                self.import_window.resizable(False, False)
+                self.import_window.transient(self.root)
+                self.import_window.grab_set()
+                
+                # 工作表选择
+                ttk.Label(self.import_window, text="选择要导入的工作表:").pack(pady=10)
+                self.import_sheet_var = tk.StringVar()
+                self.import_sheet_var.set(import_sheets[0])
+                sheet_combo = ttk.Combobox(self.import_window, textvariable=self.import_sheet_var, values=import_sheets, state="readonly")
+                sheet_combo.pack(pady=5, padx=10, fill=tk.X)
+                
+                # 导入方式选择
+                ttk.Label(self.import_window, text="导入方式:").pack(pady=10)
+                self.import_mode_var = tk.StringVar()
+                self.import_mode_var.set("merge")
+                
+                mode_frame = ttk.Frame(self.import_window)
+                mode_frame.pack(pady=5)
+                
+                ttk.Radiobutton(mode_frame, text="合并到当前工作表", variable=self.import_mode_var, value="merge").pack(anchor=tk.W)
+                ttk.Radiobutton(mode_frame, text="按键合并到当前工作表（更新已有记录）", variable=self.import_mode_var,
+                                value="upsert").pack(anchor=tk.W)
+                ttk.Radiobutton(mode_frame, text="创建新工作表", variable=self.import_mode_var, value="new").pack(anchor=tk.W)
+                
+                # 按键合并的键列（可多选）和是否删除导入的数据中没有的记录
+                ttk.Label(self.import_window, text="键列:").pack()
+                self.import_key_listbox = tk.Listbox(self.import_window, selectmode=tk.MULTIPLE, height=4,
+                                                     exportselection=False)
+                for col in (self.model.columns if self.model is not None else []):
+                    self.import_key_listbox.insert(tk.END, str(col))
+                self.import_key_listbox.pack(padx=10, fill=tk.X)
+                self.import_key_listbox.bind("<<ListboxSelect>>", lambda e: self.import_mode_var.set("upsert"))
+                self.import_delete_var = tk.BooleanVar(value=False)
+                ttk.Checkbutton(self.import_window, text="删除导入的数据中没有的记录",
+                                variable=self.import_delete_var).pack(pady=5)
+                
+                # 列不一致时的对齐方式：按列名对齐后取并集或交集
+                align_frame = ttk.Frame(self.import_window)
+                align_frame.pack(pady=5)
+                ttk.Label(align_frame, text="列对齐:").pack(side=tk.LEFT)
+                self.import_align_var = tk.StringVar(value=ALIGN_UNION)
+                for how, name in ALIGN_NAMES.items():
+                    ttk.Radiobutton(align_frame, text=name, variable=self.import_align_var, value=how).pack(side=tk.LEFT)
+                
+                # 按钮框架
+                button_frame = ttk.Frame(self.import_window)
+                button_frame.pack(fill=tk.X, padx=10, pady=10)
+                
+                ttk.Button(button_frame, text="确定", command=lambda: self.perform_import(filepaths)).pack(side=tk.RIGHT, padx=5)
+                ttk.Button(button_frame, text="取消", command=self.import_window.destroy).pack(side=tk.RIGHT, padx=5)
                 
             except Exception as e:
                 messagebox.showerror("错误", f"导入文件失败: {str(e)}")
                 self.status_var.set("导入文件失败")
     
-    def perform_import(self, filepath):
-        """执行导入操作"""
-        try:
-            # 获取选择的工作表和导入方式
-            sheet_name = self.import_sheet_var.get()
-            import_mode = self.import_mode_var.get()
-            
-            # 关闭导入选项对话框
+    def perform_import(self, filepaths):
+        """执行导入操作：在子进程中并行读取各文件，按列名对齐后一次合并"""
+        # 获取选择的工作表和导入方式
+        sheet_name = self.import_sheet_var.get()
+        import_mode = self.import_mode_var.get()
+        how = self.import_align_var.get()
+        merging = import_mode in ("merge", "upsert")
+        keys = []
+        delete_missing = False
+        if import_mode == "upsert" and self.model is not None:
+            columns = list(self.model.columns)
+            keys = [columns[i] for i in self.import_key_listbox.curselection() if i < len(columns)]
+            delete_missing = self.import_delete_var.get()
+        
+        if merging and self.model is None:
             self.import_window.destroy()
-            
+            messagebox.showwarning("警告", "请先打开一个Excel文件")
+            return
+        if import_mode == "upsert" and not keys:
+            messagebox.showwarning("警告", "请选择按键合并的键列")
+            return
+        
+        # 关闭导入选项对话框
+        self.import_window.destroy()
+        
+        sources = [(filepath, None if sheet_name == FIRST_SHEET_LABEL else sheet_name) for filepath in filepaths]
+        # 合并时按当前工作表的列对齐，并按当前工作表的校验规则一次校验全部导入的数据
+        reference = list(self.model.columns) if merging else None
+        schema = self.current_schema() if merging else None
+        
+        def work(job):
             # 读取要导入的数据
-            df_import = pd.read_excel(filepath, sheet_name=sheet_name)
-            
+            return self.engine.read_imports(sources, how, reference, schema, progress=job.report,
+                                            mp_context=gui_pool_context())
+        
+        def done(result):
+            df_import, report = result
+            if import_mode == "upsert":
+                # 按键列用哈希索引一次匹配：已有的键更新，新的键追加
+                try:
+                    changes, upserted = self.engine.upsert(df_import, keys, delete_missing)
+                except ValueError as e:
+                    messagebox.showerror("错误", f"按键合并失败: {str(e)}")
+                    self.status_var.set("按键合并失败")
+                    return
+                self.apply_changes(changes)
+                details = report.summary()
+                failed = f"，{len(report.failures)}个文件读取失败" if report.failures else ""
+                self.status_var.set(f"已按键合并{len(df_import)}条记录: {upserted.describe()}{failed}，当前共{len(self.model)}条记录")
+                messagebox.showinfo("成功", f"按键合并完成: {upserted.describe()}" + self.describe_dtype_changes(changes)
+                                    + (f"\n\n{details}" if details else ""))
+                return
             if import_mode == "merge":
-                # 合并到当前工作表
-                if self.df is not None:
-                    # 检查列名是否匹配
-                    if list(df_import.columns) == list(self.df.columns):
-                        # 合并数据
-                        self.df = pd.concat([self.df, df_import], ignore_index=True)
-                        self.update_treeview()
-                        self.status_var.set(f"已导入{len(df_import)}条记录，当前共{len(self.df)}条记录")
-                        messagebox.showinfo("成功", f"成功导入{len(df_import)}条记录")
-                    else:
-                        messagebox.showerror("错误", "导入文件的列名与当前工作表不匹配")
-                else:
-                    messagebox.showwarning("警告", "请先打开一个Excel文件")
+                # 只插入导入的行，导入的数据无法保持列类型时允许改变列类型并在提示中说明
+                changes = self.engine.merge(df_import)
+                self.apply_changes(changes)
+            else:
+                self.apply_changes(self.engine.replace(df_import))
+            details = report.summary()
+            failed = f"，{len(report.failures)}个文件读取失败" if report.failures else ""
+            if import_mode == "merge":
+                self.status_var.set(f"已从{len(report.sources)}个文件导入{len(df_import)}条记录{failed}，当前共{len(self.model)}条记录")
+                messagebox.showinfo("成功", f"成功导入{len(df_import)}条记录" + self.describe_dtype_changes(changes)
+                                    + (f"\n\n{details}" if details else ""))
             else:
                 # 创建新工作表（暂时只支持替换当前工作表，完整功能需要更复杂的ExcelWriter操作）
-                self.df = df_import
-                self.update_treeview()
-                self.status_var.set(f"已创建新工作表，共{len(df_import)}条记录")
-                messagebox.showinfo("成功", "成功创建新工作表")
-                
-        except Exception as e:
-            messagebox.showerror("错误", f"导入失败: {str(e)}")
-            self.status_var.set("导入失败")
+                self.status_var.set(f"已创建新工作表，共{len(df_import)}条记录{failed}")
+                messagebox.showinfo("成功", "成功创建新工作表" + (f"\n\n{details}" if details else ""))
+        
+        self.submit_job(self.engine.file_path or filepaths[0], "导入", work, done, "导入失败")
     
     def export_file(self):
-        """导出Excel文件"""
-        if self.df is not None:
-            # 打开文件保存对话框
-            filetypes = [("Excel文件", "*.xlsx"), ("Excel 97-2003文件", "*.xls"), ("所有文件", "*.*")]
-            filepath = filedialog.asksaveasfilename(title="导出Excel文件", filetypes=filetypes, defaultextension=".xlsx")
-            
-            if filepath:
-                try:
-                    self.status_var.set(f"正在导出文件: {filepath}")
-                    self.root.update_idletasks()
-                    
-                    # 导出当前工作表数据
-                    self.df.to_excel(filepath, sheet_name=self.current_sheet, index=False)
-                    
-                    self.status_var.set(f"文件已导出: {os.path.basename(filepath)}")
-                    messagebox.showinfo("成功", "文件导出成功")
-                except Exception as e:
-                    messagebox.showerror("错误", f"导出文件失败: {str(e)}")
-                    self.status_var.set("导出文件失败")
-        else:
+        """导出文件：选择导出范围（当前工作表、当前视图、全部或选择的工作表）和文件格式"""
+        if self.model is None:
             messagebox.showwarning("警告", "没有可导出的数据")
+            return
+        if not self.check_idle():
+            return
+        self.export_window = tk.Toplevel(self.root)
+        self.export_window.title("导出选项")
+        self.export_window.geometry("320x380")
+        self.export_window.resizable(False, False)
+        self.export_window.transient(self.root)
+        self.export_window.grab_set()
+        
+        # 导出范围
+        ttk.Label(self.export_window, text="导出范围:").pack(pady=10)
+        self.export_scope_var = tk.StringVar(value="sheet")
+        scope_frame = ttk.Frame(self.export_window)
+        scope_frame.pack(pady=5, padx=10, fill=tk.X)
+        scopes = [("sheet", f"当前工作表（{len(self.model)}条记录）"),
+                  ("view", f"当前视图（筛选和排序后的{len(self.model.view)}条记录）"),
+                  ("all", f"全部工作表（{len(self.engine.sheets)}个）"),
+                  ("selected", "选择的工作表:")]
+        for value, text in scopes:
+            ttk.Radiobutton(scope_frame, text=text, variable=self.export_scope_var, value=value).pack(anchor=tk.W)
+        
+        self.export_listbox = tk.Listbox(self.export_window, selectmode=tk.MULTIPLE, height=6, exportselection=False)
+        for sheet in self.engine.sheets:
+            self.export_listbox.insert(tk.END, sheet)
+        self.export_listbox.pack(pady=5, padx=10, fill=tk.BOTH, expand=True)
+        self.export_listbox.bind("<<ListboxSelect>>", lambda e: self.export_scope_var.set("selected"))
+        ttk.Label(self.export_window, text="CSV/TSV/Parquet格式导出多个工作表时每个工作表一个文件",
+                  wraplength=300).pack(padx=10)
+        
+        button_frame = ttk.Frame(self.export_window)
+        button_frame.pack(fill=tk.X, padx=10, pady=10)
+        ttk.Button(button_frame, text="确定", command=self.perform_export).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="取消", command=self.export_window.destroy).pack(side=tk.RIGHT, padx=5)
+    
+    def perform_export(self):
+        """执行导出：各工作表在后台逐个加载并按块写入，写入临时文件后替换，取消时不留下不完整的文件"""
+        scope = self.export_scope_var.get()
+        sheets = None
+        if scope == "all":
+            sheets = self.engine.sheets
+        elif scope == "selected":
+            sheets = [self.export_listbox.get(i) for i in self.export_listbox.curselection()]
+            if not sheets:
+                messagebox.showwarning("警告", "请选择要导出的工作表")
+                return
+        self.export_window.destroy()
+        
+        filetypes = [("Excel文件", "*.xlsx"), ("Excel 97-2003文件", "*.xls"), ("CSV文件", "*.csv"),
+                     ("TSV文件", "*.tsv"), ("Parquet文件", "*.parquet"), ("所有文件", "*.*")]
+        filepath = filedialog.asksaveasfilename(title="导出文件", filetypes=filetypes, defaultextension=".xlsx")
+        if not filepath:
+            return
+        
+        self.status_var.set(f"正在导出文件: {filepath}")
+        self.engine.flush()
+        
+        def work(job):
+            job.report(f"正在导出: {os.path.basename(filepath)}")
+            return self.engine.export(filepath, sheets, view=scope == "view", before_replace=job.check_cancelled,
+                                      progress=job.report)
+        
+        def done(rows):
+            self.status_var.set(f"文件已导出: {os.path.basename(filepath)}，共{rows}条记录")
+            messagebox.showinfo("成功", "文件导出成功")
+        
+        self.submit_job(self.engine.file_path, "导出文件", work, done, "导出文件失败")
         
     def add_record(self):
         """新增记录"""
-        if self.df is not None:
+        if self.model is not None:
+            if not self.check_idle():
+                return
             # 创建新增记录对话框
             self.add_window = tk.Toplevel(self.root)
             self.add_window.title("新增记录")
@@ -341,7 +722,7 @@ class ExcelManager:
             self.entry_vars = {}
             
             # 为每个字段创建标签和输入框
-            for i, column in enumerate(self.df.columns):
+            for i, column in enumerate(self.model.columns):
                 ttk.Label(scrollable_frame, text=column).grid(row=i, column=0, padx=5, pady=5, sticky=tk.W)
                 var = tk.StringVar()
                 entry = ttk.Entry(scrollable_frame, textvariable=var, width=30)
@@ -367,8 +748,7 @@ class ExcelManager:
                 value = var.get()
                 
                 # 数据验证
-                if not self.validate_data(column, value):
-                    messagebox.showerror("错误", f"数据类型不匹配！列 '{column}' 应输入{self.df[column].dtype}类型的数据")
+                if not self.validate_value(column, value):
                     return
                 
                 new_record[column] = value
@@ -376,43 +756,94 @@ class ExcelManager:
             # 创建新的DataFrame行
             new_row = pd.DataFrame([new_record])
             
-            # 将新行添加到原DataFrame
-            self.df = pd.concat([self.df, new_row], ignore_index=True)
-            
-            # 更新Treeview
-            self.update_treeview()
+            # 将新行按各列的类型添加到原DataFrame，并只在Treeview中插入该行
+            changes = self.apply_edit(lambda allow: self.engine.add_rows(new_row, allow))
+            if changes is None:
+                return
             
             # 关闭对话框
             self.add_window.destroy()
             
-            self.status_var.set(f"已新增一条记录，共{len(self.df)}条记录")
+            self.status_var.set(f"已新增一条记录，共{len(self.model)}条记录" + self.describe_dtype_changes(changes))
         except Exception as e:
             messagebox.showerror("错误", f"新增记录失败: {str(e)}")
             self.status_var.set("新增记录失败")
         
+    def paste_records(self):
+        """把剪贴板中的多行数据（如从Excel复制的单元格区域）一次新增为记录"""
+        if self.model is None:
+            messagebox.showwarning("警告", "请先打开一个Excel文件")
+            return
+        if self.editing_cell or not self.check_idle():
+            return
+        try:
+            text = self.root.clipboard_get()
+        except tk.TclError:
+            messagebox.showwarning("警告", "剪贴板中没有文本数据")
+            return
+        self.add_text_records(text, "\t", "粘贴")
+    
+    def add_records_from_file(self):
+        """从TSV/CSV文件一次新增多条记录（首行为列名时按列名对应）"""
+        if self.model is None:
+            messagebox.showwarning("警告", "请先打开一个Excel文件")
+            return
+        if not self.check_idle():
+            return
+        filetypes = [("文本文件", "*.tsv *.txt *.csv"), ("所有文件", "*.*")]
+        filepath = filedialog.askopenfilename(title="选择要添加的记录", filetypes=filetypes)
+        if not filepath:
+            return
+        try:
+            with open(filepath, encoding="utf-8-sig") as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            messagebox.showerror("错误", f"读取文件失败: {str(e)}")
+            return
+        self.add_text_records(text, TEXT_SEPARATORS.get(os.path.splitext(filepath)[1].lower(), "\t"), "添加")
+    
+    def add_text_records(self, text, sep, action):
+        """解析分隔文本并校验后，作为新记录一次追加到当前工作表"""
+        try:
+            rows = parse_records(text, self.model.columns, sep)
+        except (ValueError, pd.errors.ParserError) as e:
+            messagebox.showerror("错误", f"无法解析要{action}的数据: {str(e)}")
+            return
+        if rows.empty:
+            messagebox.showwarning("警告", f"没有可{action}的记录")
+            return
+        report = self.current_schema().validate(rows)
+        if not report.ok:
+            messagebox.showerror("错误", f"要{action}的数据有{report.error_count}个问题，未{action}：\n{report.summary()}")
+            return
+        try:
+            changes = self.apply_edit(lambda allow: self.engine.add_rows(rows, allow))
+        except Exception as e:
+            messagebox.showerror("错误", f"{action}记录失败: {str(e)}")
+            self.status_var.set(f"{action}记录失败")
+            return
+        if changes is not None:
+            self.status_var.set(f"已{action}{len(rows)}条记录，共{len(self.model)}条记录"
+                                + self.describe_dtype_changes(changes))
+    
     def delete_record(self):
         """删除记录"""
-        if self.df is not None:
-            # 获取选中的记录
-            selected_items = self.tree.selection()
+        if self.model is not None:
+            if not self.check_idle():
+                return
+            # 获取选中的记录（DataFrame行位置）
+            selected_rows = self.get_selected_rows()
             
-            if selected_items:
+            if selected_rows:
                 # 弹出确认对话框
-                confirm = messagebox.askyesno("确认删除", f"确定要删除选中的{len(selected_items)}条记录吗？")
+                confirm = messagebox.askyesno("确认删除", f"确定要删除选中的{len(selected_rows)}条记录吗？")
                 
                 if confirm:
                     try:
-                        # 获取选中记录的索引
-                        selected_indices = [int(item_id) for item_id in selected_items]
+                        # 从DataFrame中删除记录，行ID保持不变，Treeview只删除对应的项
+                        self.apply_changes(self.engine.delete_rows(self.model.row_ids(selected_rows)))
                         
-                        # 从DataFrame中删除记录
-                        self.df = self.df.drop(selected_indices)
-                        self.df = self.df.reset_index(drop=True)
-                        
-                        # 更新Treeview
-                        self.update_treeview()
-                        
-                        self.status_var.set(f"已删除{len(selected_items)}条记录，剩余{len(self.df)}条记录")
+                        self.status_var.set(f"已删除{len(selected_rows)}条记录，剩余{len(self.model)}条记录")
                     except Exception as e:
                         messagebox.showerror("错误", f"删除记录失败: {str(e)}")
                         self.status_var.set("删除记录失败")
@@ -423,13 +854,15 @@ class ExcelManager:
         
     def modify_record(self):
         """修改记录"""
-        if self.df is not None:
-            # 获取选中的记录
-            selected_items = self.tree.selection()
+        if self.model is not None:
+            if not self.check_idle():
+                return
+            # 获取选中的记录（DataFrame行位置）
+            selected_rows = self.get_selected_rows()
             
-            if len(selected_items) == 1:
-                item_id = selected_items[0]
-                row_index = int(item_id)
+            if len(selected_rows) == 1:
+                row_index = selected_rows[0]
+                row_id = self.model.row_id(row_index)
                 
                 # 创建修改记录对话框
                 self.modify_window = tk.Toplevel(self.root)
@@ -467,7 +900,7 @@ class ExcelManager:
                 current_row = self.df.iloc[row_index]
                 
                 # 为每个字段创建标签和输入框，并填充当前值
-                for i, column in enumerate(self.df.columns):
+                for i, column in enumerate(self.model.columns):
                     ttk.Label(scrollable_frame, text=column).grid(row=i, column=0, padx=5, pady=5, sticky=tk.W)
                     var = tk.StringVar()
                     var.set(str(current_row[column]))
@@ -479,17 +912,17 @@ class ExcelManager:
                 button_frame = ttk.Frame(self.modify_window)
                 button_frame.pack(fill=tk.X, padx=10, pady=10)
                 
-                # 创建确认和取消按钮，传递row_index参数
-                ttk.Button(button_frame, text="确认", command=lambda: self.save_modified_record(row_index)).pack(side=tk.RIGHT, padx=5)
+                # 创建确认和取消按钮，传递行ID参数
+                ttk.Button(button_frame, text="确认", command=lambda: self.save_modified_record(row_id)).pack(side=tk.RIGHT, padx=5)
                 ttk.Button(button_frame, text="取消", command=self.modify_window.destroy).pack(side=tk.RIGHT, padx=5)
-            elif len(selected_items) > 1:
+            elif len(selected_rows) > 1:
                 messagebox.showwarning("警告", "一次只能修改一条记录")
             else:
                 messagebox.showwarning("警告", "请先选择要修改的记录")
         else:
             messagebox.showwarning("警告", "请先打开一个Excel文件")
     
-    def save_modified_record(self, row_index):
+    def save_modified_record(self, row_id):
         """保存修改后的记录"""
         try:
             # 收集修改后的值并验证
@@ -498,23 +931,20 @@ class ExcelManager:
                 value = var.get()
                 
                 # 数据验证
-                if not self.validate_data(column, value):
-                    messagebox.showerror("错误", f"数据类型不匹配！列 '{column}' 应输入{self.df[column].dtype}类型的数据")
+                if not self.validate_value(column, value):
                     return
                 
                 modified_record[column] = value
             
-            # 更新DataFrame中的记录
-            for column, value in modified_record.items():
-                self.df.at[row_index, column] = value
-            
-            # 更新Treeview
-            self.update_treeview()
+            # 按各列的类型更新DataFrame中的记录，Treeview只更新该行
+            changes = self.apply_edit(lambda allow: self.engine.update_cells(row_id, modified_record, allow))
+            if changes is None:
+                return
             
             # 关闭对话框
             self.modify_window.destroy()
             
-            self.status_var.set(f"已修改第{row_index+1}行记录")
+            self.status_var.set(f"已修改第{self.model.position(row_id)+1}行记录" + self.describe_dtype_changes(changes))
         except Exception as e:
             messagebox.showerror("错误", f"修改记录失败: {str(e)}")
             self.status_var.set("修改记录失败")
@@ -523,46 +953,489 @@ class ExcelManager:
         """显示关于信息"""
         messagebox.showinfo("关于", "Excel文件管理器 v1.0\n\n用于管理本地Excel文件的GUI工具")
         
+    @property
+    def model(self):
+        """当前工作表的数据模型（SheetModel）"""
+        return self.engine.model
+    
+    @property
+    def df(self):
+        """当前工作表的DataFrame"""
+        return self.engine.df
+    
+    @property
+    def current_sheet(self):
+        return self.engine.current_sheet
+    
+    def undo(self):
+        """撤销当前工作表最近一次修改"""
+        self.replay_journal(self.engine.undo, "撤销")
+    
+    def redo(self):
+        """重做当前工作表最近一次撤销的修改"""
+        self.replay_journal(self.engine.redo, "重做")
+    
+    def replay_journal(self, replay, action):
+        """执行撤销或重做，按返回的变更集增量更新视图"""
+        if self.model is None or self.editing_cell or not self.check_idle():
+            return
+        try:
+            result = replay()
+        except Exception as e:
+            messagebox.showerror("错误", f"{action}失败: {str(e)}")
+            return
+        if result is None:
+            self.status_var.set(f"没有可{action}的操作")
+            return
+        delta, changes = result
+        self.apply_changes(changes)
+        self.update_sort_headings()
+        self.status_var.set(f"已{action}: {delta.description}，共{len(self.model)}条记录")
+    
+    def set_memory_budget(self):
+        """设置工作表缓存的内存上限"""
+        value = simpledialog.askinteger("工作表缓存上限", "缓存上限（MB）：", parent=self.root,
+                                        initialvalue=self.engine.memory_budget // (1024 * 1024), minvalue=1)
+        if value:
+            self.engine.set_memory_budget(value * 1024 * 1024)
+            self.status_var.set(f"工作表缓存上限已设置为{value}MB")
+    
+    def set_compact_mode(self):
+        """切换紧凑加载模式，对之后加载的工作表生效"""
+        self.engine.set_compact(self.compact_mode_var.get())
+        if self.compact_mode_var.get():
+            self.status_var.set("已开启紧凑加载：之后加载的工作表将使用更省内存的数据类型")
+        else:
+            self.status_var.set("已关闭紧凑加载")
+    
+    def memory_text(self, sheet_name):
+        """工作表紧凑加载前后的内存占用说明，未使用紧凑加载时为空"""
+        session = self.engine.session
+        if session is None or sheet_name not in session.memory_report:
+            return ""
+        before, after = session.memory_report[sheet_name]
+        return f"，内存 {before / (1024 * 1024):.1f}MB → {after / (1024 * 1024):.1f}MB"
+    
+    def clear_sidecar_cache(self):
+        """清除磁盘缓存"""
+        if not self.check_idle():
+            return
+        size = self.sidecar.total_size()
+        self.sidecar.clear()
+        self.status_var.set(f"已清除磁盘缓存，释放{size / (1024 * 1024):.1f}MB")
+    
+    def update_sheet_list(self):
+        """更新工作表下拉框，每项显示工作表名和记录数、列数"""
+        self.sheet_labels = {}
+        for sheet, size in self.engine.sheet_sizes().items():
+            self.sheet_labels[sheet] = sheet if size is None else f"{sheet}（{size[0]}行 x {size[1]}列）"
+        self.sheet_combobox['values'] = list(self.sheet_labels.values())
+        if self.current_sheet:
+            self.select_sheet_label(self.current_sheet)
+    
+    def select_sheet_label(self, sheet_name):
+        """在下拉框中显示指定工作表"""
+        self.sheet_var.set(self.sheet_labels.get(sheet_name, sheet_name))
+    
     def on_sheet_change(self, event):
         """工作表切换事件处理"""
-        sheet_name = self.sheet_var.get()
+        label = self.sheet_var.get()
+        sheet_name = next((sheet for sheet, text in self.sheet_labels.items() if text == label), label)
         if sheet_name != self.current_sheet:
-            self.current_sheet = sheet_name
+            if not self.check_idle():
+                self.select_sheet_label(self.current_sheet)
+                return
             self.load_sheet_data(sheet_name)
         
     def load_sheet_data(self, sheet_name):
-        """加载指定工作表的数据"""
-        try:
-            self.status_var.set(f"正在加载工作表: {sheet_name}")
-            self.root.update_idletasks()
+        """加载指定工作表的数据（已缓存时立即显示，否则在后台解析）"""
+        session = self.engine.session
+        if session.is_cached(sheet_name) and not session.file_changed():
+            self.show_sheet(sheet_name, self.engine.load(sheet_name))
+            return
+        
+        self.status_var.set(f"正在加载工作表: {sheet_name}")
+        previous = (self.current_sheet, self.model)
+        preview_shown = []
+        # Tk变量只能在主线程中读取
+        streaming = self.stream_mode_var.get()
+        
+        def work(job):
+            if not streaming:
+                return self.engine.load(sheet_name)
             
-            # 读取工作表数据
-            self.df = pd.read_excel(self.file_path, sheet_name=sheet_name)
+            # 流式加载：按批读取，读取的行数每翻一倍把已读取部分送回界面显示
+            next_preview = [0]
             
-            # 更新Treeview显示
-            self.update_treeview()
+            def on_chunk(buffer, total_rows):
+                loaded = max(buffer.rows - 1, 0)
+                fraction = buffer.rows / total_rows if total_rows else None
+                job.report(f"正在加载工作表: {sheet_name}，已读取{loaded}条记录", fraction)
+                if buffer.rows >= next_preview[0]:
+                    job.publish(buffer.preview())
+                    next_preview[0] = buffer.rows * 2
             
-            self.status_var.set(f"已加载工作表: {sheet_name}，共{len(self.df)}条记录")
-        except Exception as e:
+            return self.engine.load(sheet_name, on_chunk=on_chunk)
+        
+        def show_preview(df):
+            # 加载过程中显示已读取的部分（后台任务执行期间禁止编辑）
+            self.show_sheet(sheet_name, df, keep_view=bool(preview_shown))
+            preview_shown.append(True)
+            self.status_var.set(f"正在加载工作表: {sheet_name}，已读取{len(df)}条记录")
+        
+        def done(df):
+            self.show_sheet(sheet_name, df, keep_view=bool(preview_shown))
+        
+        def restore():
+            # 加载失败或取消时恢复为之前的工作表
+            if preview_shown:
+                self.engine.current_sheet, self.engine.model = previous
+                self.update_treeview()
+            self.select_sheet_label(self.current_sheet)
+        
+        def failed(e):
+            restore()
             messagebox.showerror("错误", f"加载工作表失败: {str(e)}")
             self.status_var.set("加载工作表失败")
         
+        self.submit_job(self.engine.file_path, f"加载工作表 {sheet_name}", work, done, failed,
+                        on_cancel=restore, on_data=show_preview)
+    
+    def show_sheet(self, sheet_name, df, keep_view=False):
+        """显示已加载的工作表数据，keep_view为True时保留滚动位置和选中行"""
+        self.engine.show(sheet_name, df)
+        self.update_sheet_list()
+        if not keep_view:
+            self.view_offset = 0
+            self.selected_ids.clear()
+            self.invalidate_column_widths()
+        
+        # 更新Treeview显示
+        self.update_treeview()
+        
+        self.status_var.set(f"已加载工作表: {sheet_name}，共{len(self.model)}条记录" + self.memory_text(sheet_name))
+        self.schedule_summary_refresh(reset=True)
+    
+    def check_idle(self):
+        """有后台任务执行时提示并返回False"""
+        if self.jobs.is_busy():
+            names = "、".join(job.name for job in self.jobs.active_jobs())
+            messagebox.showwarning("警告", f"“{names}”正在执行，请稍后再试")
+            return False
+        return True
+    
+    def submit_job(self, key, name, work, on_done, on_error, on_cancel=None, on_data=None):
+        """提交后台任务，on_error为字符串时按“<消息>: <异常>”显示错误"""
+        if isinstance(on_error, str):
+            message = on_error
+            
+            def on_error(e):
+                messagebox.showerror("错误", f"{message}: {str(e)}")
+                self.status_var.set(message)
+        
+        def cancelled():
+            if on_cancel is not None:
+                on_cancel()
+            self.status_var.set(f"已取消: {name}")
+        
+        try:
+            self.jobs.submit(key, name, work, on_done=on_done, on_error=on_error, on_cancel=cancelled, on_data=on_data)
+        except JobConflict as e:
+            messagebox.showwarning("警告", str(e))
+            return
+        self.progress.config(mode="indeterminate")
+        self.progress.start(15)
+        self.progress.pack(side=tk.LEFT, padx=5)
+        self.btn_cancel.pack(side=tk.LEFT)
+        self.root.config(cursor="watch")
+    
+    def show_progress(self, job, message, fraction):
+        """在状态栏显示后台任务进度"""
+        self.status_var.set(message)
+        if fraction is None:
+            if str(self.progress.cget("mode")) != "indeterminate":
+                self.progress.config(mode="indeterminate")
+                self.progress.start(15)
+        else:
+            if str(self.progress.cget("mode")) != "determinate":
+                self.progress.stop()
+                self.progress.config(mode="determinate")
+            self.progress.config(value=fraction * 100)
+    
+    def on_job_finish(self, job):
+        """后台任务结束后，如无其他任务则隐藏进度条"""
+        if not self.jobs.is_busy():
+            self.progress.stop()
+            self.progress.pack_forget()
+            self.btn_cancel.pack_forget()
+            self.root.config(cursor="")
+        self.refresh_perf()
+    
+    def on_span(self, record):
+        """操作计时完成：在主线程中时稍后刷新状态栏和性能面板（后台线程的记录在任务结束时刷新）"""
+        if threading.current_thread() is threading.main_thread() and not self.perf_refresh_pending:
+            self.perf_refresh_pending = True
+            self.root.after_idle(self.refresh_perf)
+    
+    def refresh_perf(self):
+        """在状态栏显示最近一次操作的耗时，刷新性能面板，并显示新的分析报告"""
+        self.perf_refresh_pending = False
+        if TRACER.version == self.perf_version:
+            return
+        self.perf_version = TRACER.version
+        latest = TRACER.latest()
+        self.perf_var.set(f"上次操作: {latest.describe()}" if latest is not None else "")
+        profiled = next((record for record in reversed(TRACER.spans()) if record.profile), None)
+        if profiled is not None and profiled is not self.shown_profile:
+            self.shown_profile = profiled
+            self.show_performance()
+            self.show_profile(profiled)
+        elif self.perf_window is not None:
+            self.fill_perf_panel()
+    
+    def show_performance(self):
+        """性能面板：最近各操作的耗时和涉及的行列数，选中有分析报告的操作时显示报告"""
+        if self.perf_window is not None:
+            self.fill_perf_panel()
+            self.perf_window.lift()
+            return
+        self.perf_window = tk.Toplevel(self.root)
+        self.perf_window.title("性能")
+        self.perf_window.geometry("800x520")
+        self.perf_window.protocol("WM_DELETE_WINDOW", self.close_performance)
+        
+        toolbar = ttk.Frame(self.perf_window)
+        toolbar.pack(fill=tk.X, padx=10, pady=5)
+        ttk.Button(toolbar, text="分析下一次操作", command=self.profile_next_operation).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(toolbar, text="写入性能日志", variable=self.perf_log_var,
+                        command=self.set_perf_log).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="清空", command=TRACER.clear).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="读写引擎", command=self.show_engines).pack(side=tk.LEFT, padx=5)
+        self.profile_status_var = tk.StringVar()
+        ttk.Label(toolbar, textvariable=self.profile_status_var).pack(side=tk.LEFT, padx=5)
+        
+        columns = ("时间", "操作", "耗时(ms)", "行数", "列数", "线程", "说明")
+        self.perf_tree = ttk.Treeview(self.perf_window, columns=columns, show="headings", height=12)
+        for col, width in zip(columns, (80, 160, 80, 80, 60, 110, 200)):
+            self.perf_tree.heading(col, text=col)
+            self.perf_tree.column(col, width=width, anchor=tk.W if col in ("操作", "说明") else tk.CENTER)
+        self.perf_tree.pack(fill=tk.BOTH, expand=True, padx=10)
+        self.perf_tree.bind("<<TreeviewSelect>>", self.on_perf_select)
+        
+        self.perf_text = tk.Text(self.perf_window, height=12, wrap="none")
+        self.perf_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.perf_spans = []
+        self.fill_perf_panel()
+    
+    def close_performance(self):
+        self.perf_window.destroy()
+        self.perf_window = None
+    
+    def fill_perf_panel(self):
+        """按时间倒序列出最近的操作，嵌套的操作缩进显示"""
+        self.perf_spans = list(reversed(TRACER.spans()))
+        self.perf_tree.delete(*self.perf_tree.get_children())
+        for i, record in enumerate(self.perf_spans):
+            detail = "，".join(f"{key}={value}" for key, value in record.detail.items())
+            if record.error:
+                detail = f"失败: {record.error}" + (f"，{detail}" if detail else "")
+            if record.profile:
+                detail = "[有分析报告] " + detail
+            self.perf_tree.insert('', tk.END, iid=str(i), values=(
+                time.strftime("%H:%M:%S", time.localtime(record.started)), "  " * record.depth + record.name,
+                f"{record.seconds * 1000:.1f}", "" if record.rows is None else record.rows,
+                "" if record.cols is None else record.cols, record.thread, detail))
+        if not TRACER.profile_pending and self.profile_status_var.get().startswith("将分析"):
+            self.profile_status_var.set("")
+    
+    def on_perf_select(self, event):
+        selection = self.perf_tree.selection()
+        if selection and self.perf_spans[int(selection[0])].profile:
+            self.show_profile(self.perf_spans[int(selection[0])])
+    
+    def show_profile(self, record):
+        """在性能面板中显示操作的分析报告"""
+        self.perf_text.delete("1.0", tk.END)
+        self.perf_text.insert("1.0", record.profile)
+        self.profile_status_var.set(f"分析报告: {record.name}")
+
+    def show_engines(self):
+        """在性能面板中列出各文件类型可用的读写引擎（按速度排序，实际使用的引擎见各操作的说明）"""
+        self.perf_text.delete("1.0", tk.END)
+        self.perf_text.insert("1.0", engine_summary())
+        self.profile_status_var.set("读写引擎")
+
+    def profile_next_operation(self):
+        """对下一次操作进行cProfile和tracemalloc分析，完成后在性能面板中显示报告"""
+        TRACER.profile_next()
+        self.show_performance()
+        self.profile_status_var.set("将分析下一次操作……")
+    
+    def set_perf_log(self):
+        """开关性能日志（每个操作一行JSON，文件过大时轮转）"""
+        TRACER.set_log(DEFAULT_PERF_LOG if self.perf_log_var.get() else None)
+        self.status_var.set(f"性能日志: {DEFAULT_PERF_LOG}" if self.perf_log_var.get() else "已停止写入性能日志")
+    
+    def show_summary(self):
+        """汇总面板：当前工作表各列的统计和按分组列的数据透视（求和、平均值、计数、最小值、最大值）"""
+        if self.model is None:
+            messagebox.showwarning("警告", "请先打开一个Excel文件")
+            return
+        if self.summary_window is not None:
+            self.refresh_summary()
+            self.summary_window.lift()
+            return
+        self.summary_window = tk.Toplevel(self.root)
+        self.summary_window.title("汇总")
+        self.summary_window.geometry("800x600")
+        self.summary_window.protocol("WM_DELETE_WINDOW", self.close_summary)
+        
+        self.summary_status_var = tk.StringVar()
+        ttk.Label(self.summary_window, textvariable=self.summary_status_var).pack(fill=tk.X, padx=10, pady=5)
+        
+        # 各列的统计（全部记录，不受筛选影响）
+        columns = ("列", "类型") + STAT_NAMES
+        self.stats_tree = ttk.Treeview(self.summary_window, columns=columns, show="headings", height=8)
+        for col in columns:
+            self.stats_tree.heading(col, text=col)
+            self.stats_tree.column(col, width=90, anchor=tk.W if col == "列" else tk.CENTER)
+        self.stats_tree.pack(fill=tk.BOTH, expand=True, padx=10)
+        
+        # 数据透视：分组列（可多选） x 汇总列 x 汇总方式
+        pivot_frame = ttk.Frame(self.summary_window)
+        pivot_frame.pack(fill=tk.X, padx=10, pady=5)
+        ttk.Label(pivot_frame, text="分组列:").pack(side=tk.LEFT)
+        self.group_listbox = tk.Listbox(pivot_frame, selectmode=tk.MULTIPLE, height=4, exportselection=False)
+        self.group_listbox.pack(side=tk.LEFT, padx=5)
+        ttk.Label(pivot_frame, text="汇总列:").pack(side=tk.LEFT)
+        self.pivot_value_var = tk.StringVar()
+        self.pivot_value_combobox = ttk.Combobox(pivot_frame, textvariable=self.pivot_value_var, state="readonly", width=15)
+        self.pivot_value_combobox.pack(side=tk.LEFT, padx=5)
+        self.pivot_how_var = tk.StringVar(value=AGGREGATIONS["sum"])
+        ttk.Combobox(pivot_frame, textvariable=self.pivot_how_var, values=list(AGGREGATIONS.values()),
+                     state="readonly", width=8).pack(side=tk.LEFT, padx=5)
+        ttk.Button(pivot_frame, text="计算", command=self.refresh_summary).pack(side=tk.LEFT, padx=5)
+        
+        self.pivot_tree = ttk.Treeview(self.summary_window, show="headings", height=10)
+        self.pivot_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.summary_columns = None
+        self.refresh_summary()
+    
+    def close_summary(self):
+        if self.summary_pending is not None:
+            self.root.after_cancel(self.summary_pending)
+            self.summary_pending = None
+        self.summary_window.destroy()
+        self.summary_window = None
+    
+    def schedule_summary_refresh(self, reset=False):
+        """数据修改后延迟刷新打开的汇总面板（连续修改只刷新一次），reset为True时重新列出列"""
+        if self.summary_window is None:
+            return
+        if reset:
+            self.summary_columns = None
+        if self.summary_pending is not None:
+            self.root.after_cancel(self.summary_pending)
+        self.summary_pending = self.root.after(SUMMARY_DELAY_MS, self.refresh_summary)
+    
+    def pivot_request(self):
+        """面板中选择的数据透视条件(分组列, 汇总列, 汇总方式)，未选择分组列或汇总列时分组列为空"""
+        columns = list(self.model.columns)
+        group_by = tuple(columns[i] for i in self.group_listbox.curselection() if i < len(columns))
+        value = next((col for col in columns if str(col) == self.pivot_value_var.get()), None)
+        how = next(key for key, name in AGGREGATIONS.items() if name == self.pivot_how_var.get())
+        return (group_by, value, how) if value is not None else ((), None, how)
+    
+    def refresh_summary(self):
+        """计算并显示汇总（只计算未缓存的部分），记录数多且需要计算时在后台执行"""
+        self.summary_pending = None
+        if self.summary_window is None or self.model is None:
+            return
+        if self.jobs.is_busy():
+            # 后台任务结束后再刷新
+            self.schedule_summary_refresh()
+            return
+        columns = list(self.model.columns)
+        if self.summary_columns != columns:
+            # 工作表或其列改变：重新列出可选的列
+            self.summary_columns = columns
+            self.group_listbox.delete(0, tk.END)
+            for col in columns:
+                self.group_listbox.insert(tk.END, str(col))
+            self.pivot_value_combobox['values'] = [str(col) for col in columns]
+            if self.pivot_value_var.get() not in self.pivot_value_combobox['values']:
+                self.pivot_value_var.set("")
+        self.engine.flush()
+        group_by, value, how = self.pivot_request()
+        sheet = self.current_sheet
+        
+        def work(job=None):
+            if job is not None:
+                job.report(f"正在汇总工作表 {sheet} 的{len(self.model)}条记录")
+            stats = self.engine.column_stats()
+            return stats, self.engine.pivot(group_by, value, how) if group_by else None
+        
+        def done(result):
+            if self.summary_window is not None and self.current_sheet == sheet:
+                self.show_summary_result(*result)
+        
+        def failed(e):
+            if self.summary_window is not None:
+                self.summary_status_var.set(f"汇总失败: {str(e)}")
+        
+        if len(self.model) > SUMMARY_BACKGROUND_ROWS and not self.engine.summary.is_cached(columns, group_by, value, how):
+            self.summary_status_var.set("正在汇总……")
+            self.submit_job(self.engine.file_path, "汇总", work, done, failed)
+            return
+        try:
+            result = work()
+        except (ValueError, TypeError) as e:
+            failed(e)
+            return
+        done(result)
+    
+    def show_summary_result(self, stats, pivot):
+        """在汇总面板中显示列统计表和数据透视结果"""
+        self.stats_tree.delete(*self.stats_tree.get_children())
+        for i, (col, row) in enumerate(stats.iterrows()):
+            values = ["" if pd.isna(value) else f"{value:.6g}" if isinstance(value, float) else str(value)
+                      for value in row]
+            self.stats_tree.insert('', tk.END, iid=str(i), values=[str(col), str(self.model.df[col].dtype), *values])
+        self.pivot_tree.delete(*self.pivot_tree.get_children())
+        message = f"工作表 {self.current_sheet}: {len(self.model)}条记录，{len(stats)}列"
+        if pivot is not None:
+            self.pivot_tree['columns'] = [str(col) for col in pivot.columns]
+            for col in self.pivot_tree['columns']:
+                self.pivot_tree.heading(col, text=col)
+                self.pivot_tree.column(col, width=120, anchor=tk.CENTER)
+            for i, values in enumerate(format_rows(pivot.head(SUMMARY_MAX_GROUPS))):
+                self.pivot_tree.insert('', tk.END, iid=str(i), values=values)
+            message += f"；数据透视{len(pivot)}个分组"
+            if len(pivot) > SUMMARY_MAX_GROUPS:
+                message += f"（显示前{SUMMARY_MAX_GROUPS}个）"
+        self.summary_status_var.set(message)
+    
+    def cancel_jobs(self):
+        """取消正在执行的后台任务"""
+        self.jobs.cancel()
+        self.status_var.set("正在取消...")
+        
     def on_cell_double_click(self, event):
         """双击单元格事件处理，显示编辑框"""
         # 获取双击位置
         region = self.tree.identify_region(event.x, event.y)
-        if region == "cell":
+        if region == "cell" and not self.jobs.is_busy():
             # 获取选中的项和列
             item_id = self.tree.identify_row(event.y)
             column = self.tree.identify_column(event.x)
             
             if item_id and column:
                 # 隐藏之前的编辑框
-                self.edit_entry.pack_forget()
+                self.edit_entry.place_forget()
                 
                 # 获取列索引（从1开始）
                 col_index = int(column.replace('#', '')) - 1
-                if col_index < len(self.df.columns):
+                if col_index < len(self.model.columns):
                     # 获取单元格值
                     current_value = self.tree.item(item_id, 'values')[col_index]
                     
@@ -576,8 +1449,8 @@ class ExcelManager:
                     self.edit_entry.focus_set()
                     self.edit_entry.select_range(0, tk.END)
                     
-                    # 记录当前编辑的单元格
-                    self.editing_cell = (item_id, self.df.columns[col_index])
+                    # 记录当前编辑的单元格（行ID，即Treeview项ID；行位置会因增删记录而改变）
+                    self.editing_cell = (int(item_id), self.model.columns[col_index])
         
     def on_edit_focus_out(self, event):
         """编辑框失去焦点事件处理，保存修改"""
@@ -589,114 +1462,515 @@ class ExcelManager:
         
     def on_edit_escape(self, event):
         """编辑框ESC键事件处理，取消编辑"""
-        self.edit_entry.pack_forget()
+        self.edit_entry.place_forget()
         self.editing_cell = None
         
-    def validate_data(self, column, value):
-        """验证数据类型是否匹配"""
-        if pd.isna(value) or value == '':
-            return True  # 允许空值
+    def apply_edit(self, edit):
+        """执行修改数据的操作edit(allow_dtype_change)并更新视图，返回变更集
         
+        修改的值无法以列当前的类型保存时先询问是否改变列的类型，取消时返回None。
+        """
         try:
-            # 获取原数据类型
-            original_type = self.df[column].dtype
-            
-            # 尝试转换数据类型
-            if original_type == 'int64' or original_type == 'float64':
-                float(value)  # 尝试转换为数字
-            elif original_type == 'datetime64[ns]':
-                pd.to_datetime(value)  # 尝试转换为日期时间
-            
-            return True
-        except:
+            changes = edit(False)
+        except DtypeChangeError as e:
+            if not messagebox.askyesno("列类型变化", f"{e}，列的内存占用可能增加。\n是否仍然修改？"):
+                return None
+            changes = edit(True)
+        self.apply_changes(changes)
+        return changes
+    
+    def describe_dtype_changes(self, changes):
+        """变更集中列类型变化的说明文字"""
+        return "".join(f"；列 '{column}' 的类型已从{old}变为{new}"
+                       for column, (old, new) in changes.dtype_changes.items())
+    
+    def current_schema(self):
+        """当前工作表的校验规则，首次使用或列变化时按列的类型生成（保留同名列已设置的规则）"""
+        return self.engine.schema()
+    
+    def validate_value(self, column, value):
+        """按校验规则验证单个值，不通过时提示错误并返回False"""
+        error = self.current_schema().check(column, value)
+        if error is not None:
+            messagebox.showerror("错误", f"列 '{column}' 的数据无效：{error}")
             return False
+        return True
+    
+    def validate_sheet(self):
+        """按校验规则一次校验当前工作表的全部数据"""
+        if self.model is None:
+            messagebox.showwarning("警告", "请先打开一个Excel文件")
+            return
+        if not self.check_idle():
+            return
+        df, sheet, schema = self.df, self.current_sheet, self.current_schema()
+        
+        def work(job):
+            job.report(f"正在校验工作表 {sheet} 的{len(df)}条记录")
+            return schema.validate(df)
+        
+        def done(report):
+            if report.ok:
+                self.status_var.set(f"校验通过: {sheet}，共{len(df)}条记录")
+                messagebox.showinfo("校验通过", f"工作表 {sheet} 的全部数据符合校验规则")
+            else:
+                self.status_var.set(f"校验发现{report.error_count}个问题: {sheet}")
+                messagebox.showwarning("校验结果", report.summary())
+        
+        self.submit_job(self.engine.file_path, "校验数据", work, done, "校验失败")
+    
+    def edit_validation_rules(self):
+        """编辑当前工作表各列的校验规则"""
+        if self.model is None:
+            messagebox.showwarning("警告", "请先打开一个Excel文件")
+            return
+        schema = self.current_schema()
+        type_names = {name: kind for kind, name in TYPE_NAMES.items()}
+        
+        rule_window = tk.Toplevel(self.root)
+        rule_window.title("校验规则")
+        rule_window.geometry("420x320")
+        rule_window.resizable(False, False)
+        rule_window.transient(self.root)
+        rule_window.grab_set()
+        
+        form = ttk.Frame(rule_window)
+        form.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        column_var = tk.StringVar(value=schema.columns[0])
+        type_var = tk.StringVar()
+        nullable_var = tk.BooleanVar()
+        minimum_var = tk.StringVar()
+        maximum_var = tk.StringVar()
+        pattern_var = tk.StringVar()
+        allowed_var = tk.StringVar()
+        
+        ttk.Label(form, text="列：").grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
+        column_combobox = ttk.Combobox(form, textvariable=column_var, values=schema.columns, state="readonly", width=28)
+        column_combobox.grid(row=0, column=1, padx=5, pady=5, sticky=tk.EW)
+        ttk.Label(form, text="类型：").grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
+        ttk.Combobox(form, textvariable=type_var, values=list(type_names), state="readonly",
+                     width=28).grid(row=1, column=1, padx=5, pady=5, sticky=tk.EW)
+        ttk.Checkbutton(form, text="允许为空", variable=nullable_var).grid(row=2, column=1, padx=5, pady=5, sticky=tk.W)
+        for row, (label, var) in enumerate([("最小值：", minimum_var), ("最大值：", maximum_var),
+                                            ("正则表达式：", pattern_var), ("允许值（逗号分隔）：", allowed_var)], start=3):
+            ttk.Label(form, text=label).grid(row=row, column=0, padx=5, pady=5, sticky=tk.W)
+            ttk.Entry(form, textvariable=var, width=30).grid(row=row, column=1, padx=5, pady=5, sticky=tk.EW)
+        
+        def show_rule(event=None):
+            rule = schema.rules[column_var.get()]
+            type_var.set(TYPE_NAMES[rule.kind])
+            nullable_var.set(rule.nullable)
+            minimum_var.set("" if rule.minimum is None else str(rule.minimum))
+            maximum_var.set("" if rule.maximum is None else str(rule.maximum))
+            pattern_var.set("" if rule.pattern is None else rule.pattern.pattern)
+            allowed_var.set(",".join(sorted(rule.allowed)))
+        
+        def apply_rule():
+            allowed = [value.strip() for value in allowed_var.get().split(",") if value.strip()]
+            try:
+                rule = ColumnRule(column_var.get(), type_names[type_var.get()], nullable_var.get(),
+                                  minimum_var.get(), maximum_var.get(), pattern_var.get(), allowed)
+            except ValueError as e:
+                messagebox.showerror("错误", str(e), parent=rule_window)
+                return
+            schema.set_rule(rule)
+            self.status_var.set(f"已更新列 '{rule.column}' 的校验规则")
+        
+        column_combobox.bind("<<ComboboxSelected>>", show_rule)
+        show_rule()
+        
+        button_frame = ttk.Frame(rule_window)
+        button_frame.pack(fill=tk.X, padx=10, pady=10)
+        ttk.Button(button_frame, text="关闭", command=rule_window.destroy).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="应用", command=apply_rule).pack(side=tk.RIGHT, padx=5)
     
     def save_edit(self):
         """保存编辑内容"""
         if self.editing_cell:
-            item_id, column = self.editing_cell
+            row_id, column = self.editing_cell
             new_value = self.edit_entry.get()
             
             # 数据验证
-            if not self.validate_data(column, new_value):
-                messagebox.showerror("错误", f"数据类型不匹配！列 '{column}' 应输入{self.df[column].dtype}类型的数据")
+            if not self.validate_value(column, new_value):
                 return
             
-            # 更新Treeview显示
-            col_index = list(self.df.columns).index(column)
-            values = list(self.tree.item(item_id, 'values'))
-            values[col_index] = new_value
-            self.tree.item(item_id, values=values)
-            
-            # 更新DataFrame
-            row_index = int(item_id)
-            self.df.at[row_index, column] = new_value
-            
             # 隐藏编辑框
-            self.edit_entry.pack_forget()
+            self.edit_entry.place_forget()
             self.editing_cell = None
             
-            self.status_var.set(f"已修改单元格: 行{row_index+1}, 列{column}")
+            # 按列的类型更新DataFrame和Treeview显示（虚拟滚动时该行可能已不在渲染窗口内）
+            changes = self.apply_edit(lambda allow: self.engine.update_cells(row_id, {column: new_value}, allow))
+            if changes is None:
+                self.status_var.set("已取消修改")
+                return
+            
+            self.status_var.set(f"已修改单元格: 行{self.model.position(row_id)+1}, 列{column}"
+                                + self.describe_dtype_changes(changes))
         
     def update_treeview(self):
         """更新Treeview数据"""
-        # 清空Treeview
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # 清空列
-        self.tree['columns'] = []
-        for col in self.tree['columns']:
-            self.tree.heading(col, text='')
-            self.tree.column(col, width=0)
-        
-        if self.df is not None and not self.df.empty:
-            # 设置列
-            self.tree['columns'] = list(self.df.columns)
-            
-            # 设置列标题和排序功能
-            for col in self.df.columns:
-                self.tree.heading(col, text=col, command=lambda _col=col: self.sort_column(_col, False))
-                
-                # 自动调整列宽
-                max_width = 100  # 最小宽度
-                # 检查列名长度
-                if len(col) > max_width // 8:  # 假设每个字符宽度为8像素
-                    max_width = len(col) * 8 + 20  # 20像素边距
-                # 检查数据宽度
-                for index, row in self.df.iterrows():
-                    cell_value = str(row[col])
-                    if len(cell_value) > max_width // 8:
-                        max_width = len(cell_value) * 8 + 20
-                
-                self.tree.column(col, width=min(max_width, 300), anchor=tk.CENTER, stretch=True)
-            
-            # 添加数据行
-            for index, row in self.df.iterrows():
-                values = [str(row[col]) for col in self.df.columns]
-                self.tree.insert('', tk.END, values=values, iid=str(index))
-            
-            # 更新状态栏显示
-            self.status_var.set(f"已加载工作表: {self.current_sheet}，共{len(self.df)}条记录")
-    
-    def sort_column(self, column, reverse):
-        """排序列"""
-        if self.df is not None and not self.df.empty:
-            # 对DataFrame进行排序
-            self.df = self.df.sort_values(by=column, ascending=not reverse)
-            self.df = self.df.reset_index(drop=True)
+        with span("重建表格", self.display_count(), 0 if self.model is None else len(self.model.columns)):
+            # 清空Treeview
+            self.tree.delete(*self.tree.get_children())
+            self.window_rows = []
             
-            # 更新Treeview
-            self.update_treeview()
+            # 清空列
+            self.tree['columns'] = []
+            for col in self.tree['columns']:
+                self.tree.heading(col, text='')
+                self.tree.column(col, width=0)
             
-            # 更新列标题的排序指示
-            for col in self.df.columns:
-                if col == column:
-                    self.tree.heading(col, text=f"{col} {'↑' if reverse else '↓'}", 
-                                     command=lambda _col=col: self.sort_column(_col, not reverse))
+            self.virtual = False
+            if self.model is not None and len(self.model):
+                # 设置列
+                self.tree['columns'] = list(self.model.columns)
+                
+                # 设置列标题和排序功能
+                sample = None
+                for col in self.model.columns:
+                    # 自动调整列宽（仅重新计算数据有变化的列）
+                    if col not in self.column_widths:
+                        if sample is None:
+                            sample = sample_positions(len(self.model))
+                        self.column_widths[col] = compute_column_width(col, self.df[col].iloc[sample])
+                    self.tree.column(col, width=self.column_widths[col], anchor=tk.CENTER, stretch=True)
+                self.update_sort_headings()
+                self.filter_column_combobox['values'] = list(self.model.columns)
+                
+                if self.virtual_mode_var.get() and len(self.model) > VIRTUAL_ROW_THRESHOLD:
+                    # 大表只渲染可见窗口内的行
+                    self.virtual = True
+                    self.scroll_to(self.view_offset)
+                else:
+                    # 添加数据行
+                    self.insert_rows(self.display_rows(0, self.display_count()))
+                    self.restore_selection()
+                
+                # 更新状态栏显示
+                self.status_var.set(f"已加载工作表: {self.current_sheet}，共{len(self.model)}条记录")
+            self.update_filter_label()
+    
+    def insert_rows(self, rows, index=tk.END):
+        """将指定的DataFrame行插入Treeview（项ID为行ID）"""
+        for row_id, values in zip(self.model.row_ids(rows), format_rows(self.model.take(rows))):
+            self.tree.insert('', index, values=values, iid=str(row_id))
+    
+    def apply_changes(self, changes):
+        """根据变更集增量更新Treeview（修改已由engine记录）"""
+        if changes.data_changed:
+            self.schedule_summary_refresh(reset=changes.reset)
+        if changes.reset or changes.inserted or changes.removed:
+            self.update_sheet_list()
+        if changes.reset:
+            self.selected_ids.clear()
+            self.invalidate_column_widths()
+            self.update_treeview()
+            return
+        
+        self.selected_ids.difference_update(changes.removed)
+        if not len(self.model) or not self.tree['columns']:
+            self.update_treeview()
+            return
+        
+        # 只为有新数据的列增大列宽，不重新采样
+        if changes.inserted or changes.updated:
+            window = self.model.take(self.model.positions(list(changes.inserted) + list(changes.updated)))
+            columns = self.model.columns if changes.inserted else list(changes.columns)
+            for col in columns:
+                width = compute_column_width(col, window[col])
+                if width > self.column_widths.get(col, 0):
+                    self.column_widths[col] = width
+                    self.tree.column(col, width=width)
+        
+        if self.virtual:
+            # 虚拟滚动时只需重新渲染可见窗口
+            self.scroll_to(self.view_offset)
+            return
+        
+        if changes.reordered:
+            self.sync_tree_order()
+        
+        removed = [str(row_id) for row_id in changes.removed if self.tree.exists(str(row_id))]
+        if removed:
+            self.tree.delete(*removed)
+        if changes.inserted and not changes.reordered:
+            # 顺序改变时新增的行已由sync_tree_order插入到对应位置
+            self.insert_rows(self.model.positions(changes.inserted))
+        for row_id in changes.updated:
+            item_id = str(row_id)
+            if self.tree.exists(item_id):
+                self.tree.item(item_id, values=format_rows(self.model.take([self.model.position(row_id)]))[0])
+        
+        if self.virtual_mode_var.get() and len(self.model) > VIRTUAL_ROW_THRESHOLD:
+            # 行数超过阈值后切换到虚拟滚动
+            self.update_treeview()
+    
+    def invalidate_column_widths(self, columns=None):
+        """使列宽缓存失效，columns为None时清空全部"""
+        if columns is None:
+            self.column_widths.clear()
+        else:
+            for col in columns:
+                self.column_widths.pop(col, None)
+    
+    def sync_tree_order(self):
+        """按显示顺序移动已有的项（不重新插入数据），删除被筛选掉的项，插入新显示的项"""
+        view = self.model.view
+        items = [str(row_id) for row_id in self.model.row_ids(view)]
+        hidden = set(self.tree.get_children()).difference(items)
+        if hidden:
+            self.tree.delete(*hidden)
+        missing = [row for row, item_id in zip(view, items) if not self.tree.exists(item_id)]
+        if missing:
+            self.insert_rows(missing)
+        for index, item_id in enumerate(items):
+            self.tree.move(item_id, '', index)
+    
+    def item_to_row(self, item_id):
+        """将Treeview项ID（行ID）转换为DataFrame行位置"""
+        return self.model.position(int(item_id))
+    
+    def display_count(self):
+        """返回当前显示的总行数"""
+        return 0 if self.model is None else len(self.model.view)
+    
+    def display_rows(self, start, stop):
+        """返回显示行号[start, stop)对应的DataFrame行位置（model.view的一段）"""
+        return self.model.view[start:stop]
+    
+    def get_selected_rows(self):
+        """返回选中记录的DataFrame行位置（升序）"""
+        if self.virtual:
+            return sorted(self.model.position(row_id) for row_id in self.selected_ids)
+        return sorted(self.item_to_row(item_id) for item_id in self.tree.selection())
+    
+    def restore_selection(self):
+        """将记录的选中行恢复到已渲染的项上"""
+        items = [str(row_id) for row_id in self.selected_ids if self.tree.exists(str(row_id))]
+        self.tree.selection_set(items)
+    
+    def visible_row_count(self):
+        """根据Treeview高度估算可见行数"""
+        try:
+            row_height = int(ttk.Style().lookup("Treeview", "rowheight") or DEFAULT_ROW_HEIGHT)
+        except (tk.TclError, ValueError):
+            row_height = DEFAULT_ROW_HEIGHT
+        height = self.tree.winfo_height()
+        if height <= 1:
+            # 控件尚未显示时按配置的行数估算
+            return int(self.tree.cget("height") or 10)
+        return max(1, height // row_height)
+    
+    def scroll_to(self, offset):
+        """虚拟滚动到指定显示行号并重新渲染可见窗口"""
+        total = self.display_count()
+        visible = self.visible_row_count()
+        self.view_offset = max(0, min(int(offset), total - visible))
+        self.render_window()
+    
+    def render_window(self):
+        """渲染可见窗口（含上下预留行）内的记录"""
+        self.render_pending = False
+        if not self.virtual:
+            return
+        
+        # 滚动时隐藏编辑框，避免其停留在错误的单元格上
+        if self.editing_cell:
+            self.save_edit()
+        
+        total = self.display_count()
+        visible = self.visible_row_count()
+        start = max(0, self.view_offset - VIRTUAL_OVERSCAN)
+        stop = min(total, self.view_offset + visible + VIRTUAL_OVERSCAN)
+        rows = self.display_rows(start, stop)
+        
+        # 替换已渲染的项
+        self.tree.delete(*self.tree.get_children())
+        self.insert_rows(rows)
+        self.window_start = start
+        self.window_rows = list(rows)
+        self.restore_selection()
+        
+        # 将可见区域定位到view_offset
+        self.tree.yview_moveto(0)
+        self.tree.yview_scroll(self.view_offset - start, "units")
+        self.update_vsb()
+    
+    def update_vsb(self):
+        """按整表行数设置纵向滚动条位置"""
+        total = self.display_count()
+        if total <= 0:
+            self.vsb.set(0, 1)
+            return
+        visible = self.visible_row_count()
+        self.vsb.set(self.view_offset / total, min(1.0, (self.view_offset + visible) / total))
+    
+    def on_vscroll(self, *args):
+        """纵向滚动条事件处理"""
+        if not self.virtual:
+            self.tree.yview(*args)
+            return
+        
+        total = self.display_count()
+        visible = self.visible_row_count()
+        if args[0] == "moveto":
+            offset = int(float(args[1]) * total)
+        elif args[0] == "scroll":
+            step = int(args[1])
+            offset = self.view_offset + (step * visible if args[2] == "pages" else step)
+        else:
+            return
+        self.scroll_to(offset)
+    
+    def on_tree_yscroll(self, first, last):
+        """Treeview自身滚动（滚轮、方向键）时同步虚拟滚动位置"""
+        if not self.virtual:
+            self.vsb.set(first, last)
+            return
+        
+        rendered = len(self.window_rows)
+        if rendered == 0:
+            return
+        top = self.window_start + int(round(float(first) * rendered))
+        if top == self.view_offset:
+            return
+        self.view_offset = top
+        self.update_vsb()
+        
+        # 接近已渲染窗口边缘时重新渲染
+        total = self.display_count()
+        visible = self.visible_row_count()
+        stop = self.window_start + rendered
+        near_top = self.window_start > 0 and top - self.window_start < VIRTUAL_OVERSCAN // 2
+        near_bottom = stop < total and stop - (top + visible) < VIRTUAL_OVERSCAN // 2
+        if (near_top or near_bottom) and not self.render_pending:
+            self.render_pending = True
+            self.root.after_idle(self.render_window)
+    
+    def on_tree_configure(self, event):
+        """Treeview尺寸变化时重新渲染可见窗口"""
+        if self.virtual and not self.render_pending:
+            self.render_pending = True
+            self.root.after_idle(self.render_window)
+    
+    def on_tree_click(self, event):
+        """单击记录时，未按Ctrl/Shift则清除窗口外的选中行；单击列标题时记录是否按住Shift（多列排序）"""
+        if self.tree.identify_region(event.x, event.y) == "heading":
+            self.sort_append = bool(event.state & 0x0001)
+            return
+        if self.virtual and not event.state & 0x0005:
+            self.selected_ids.clear()
+    
+    def on_tree_select(self, event):
+        """选择变化时记录选中记录的行ID"""
+        if not self.virtual:
+            return
+        window = {int(item_id) for item_id in self.tree.get_children()}
+        self.selected_ids = {row_id for row_id in self.selected_ids if row_id not in window}
+        self.selected_ids.update(int(item_id) for item_id in self.tree.selection())
+    
+    def on_filter_key(self, event):
+        """输入筛选文本时延迟自动筛选（包含和等于）"""
+        if FILTER_KINDS.get(self.filter_kind_var.get()) not in (FILTER_CONTAINS, FILTER_EQUALS):
+            return
+        if self.filter_pending is not None:
+            self.root.after_cancel(self.filter_pending)
+        self.filter_pending = self.root.after(FILTER_DELAY_MS, self.apply_filter)
+    
+    def apply_filter(self):
+        """按筛选栏的条件筛选当前列，各列的条件同时生效；条件为空时取消该列的筛选"""
+        self.filter_pending = None
+        if self.model is None:
+            return
+        column = self.filter_column_var.get()
+        if column not in self.model.columns:
+            self.status_var.set("请选择要筛选的列")
+            return
+        kind = FILTER_KINDS[self.filter_kind_var.get()]
+        value = self.filter_value_var.get()
+        upper = self.filter_upper_var.get() if kind in (FILTER_NUMBER_RANGE, FILTER_DATE_RANGE) else ""
+        
+        start = time.perf_counter()
+        try:
+            if not value and not upper.strip():
+                changes = self.model.remove_filter(column)
+            else:
+                changes = self.model.set_filter(RowFilter(column, kind, value, upper))
+        except ValueError as e:
+            self.status_var.set(f"筛选条件无效: {str(e)}")
+            return
+        self.show_filter_result(changes, time.perf_counter() - start)
+    
+    def clear_filters(self):
+        """取消全部筛选条件"""
+        self.filter_value_var.set("")
+        self.filter_upper_var.set("")
+        if self.model is not None and self.model.filters:
+            self.show_filter_result(self.model.clear_filters())
+    
+    def show_filter_result(self, changes, elapsed=None):
+        """显示筛选后的记录并在状态栏报告结果"""
+        self.view_offset = 0
+        self.apply_changes(changes)
+        self.update_filter_label()
+        message = f"筛选结果: {self.display_count()}/{len(self.model)}条记录"
+        if elapsed is not None:
+            message += f"（{elapsed * 1000:.0f} ms）"
+        self.status_var.set(message)
+    
+    def update_filter_label(self):
+        """显示当前生效的筛选条件"""
+        filters = self.model.filters.values() if self.model is not None else []
+        self.filter_label_var.set("；".join(row_filter.describe() for row_filter in filters))
+    
+    def sort_column(self, column, reverse):
+        """排序列，按住Shift单击列标题时把该列追加为次要排序列"""
+        if self.model is not None and len(self.model):
+            if not self.check_idle():
+                return
+            spec = list(self.model.sort_spec)
+            columns = [col for col, _ in spec]
+            if self.sort_append and spec:
+                if column in columns:
+                    spec[columns.index(column)] = (column, not reverse)
                 else:
-                    self.tree.heading(col, text=col, 
-                                     command=lambda _col=col: self.sort_column(_col, False))
+                    spec.append((column, not reverse))
+            else:
+                spec = [(column, not reverse)]
+            self.sort_append = False
+            
+            # 只改变显示顺序，DataFrame保持原顺序
+            try:
+                changes = self.engine.sort(spec)
+            except TypeError as e:
+                messagebox.showerror("错误", f"排序失败: {str(e)}")
+                return
+            self.apply_changes(changes)
+            self.update_sort_headings()
+    
+    def clear_sort(self):
+        """取消排序，恢复原始顺序"""
+        if self.model is not None and self.model.sort_spec:
+            self.apply_changes(self.engine.sort([]))
+            self.update_sort_headings()
+    
+    def update_sort_headings(self):
+        """更新列标题的排序指示"""
+        spec = self.model.sort_spec
+        columns = [col for col, _ in spec]
+        for col in self.model.columns:
+            if col in columns:
+                priority = columns.index(col)
+                ascending = spec[priority][1]
+                text = f"{col} {'↓' if ascending else '↑'}"
+                if len(spec) > 1:
+                    text += str(priority + 1)
+                self.tree.heading(col, text=text,
+                                 command=lambda _col=col, _reverse=ascending: self.sort_column(_col, _reverse))
+            else:
+                self.tree.heading(col, text=col, 
+                                 command=lambda _col=col: self.sort_column(_col, False))
 
 if __name__ == "__main__":
     root = tk.Tk()
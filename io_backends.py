@@ -0,0 +1,387 @@
+import datetime
+import importlib.util
+import os
+from collections.abc import Mapping
+
+import pandas as pd
+
+from perf_trace import span
+
+# 按扩展名区分的文本文件格式（分隔符）
+TEXT_SEPARATORS = {".csv": ",", ".tsv": "\t"}
+# 只能保存一个工作表的文件格式
+SINGLE_SHEET_EXTENSIONS = (".csv", ".tsv", ".parquet")
+EXCEL_EXTENSIONS = (".xlsx", ".xlsm", ".xls")
+# 逐块转换写入的行数
+WRITE_CHUNK_ROWS = 10000
+# .xls文件的行数和列数上限
+XLS_MAX_ROWS = 65536
+XLS_MAX_COLUMNS = 256
+
+
+class Backend:
+    """一种读取或写入引擎：适用的扩展名、依赖的模块和速度排名（越小越快）
+
+    func对读取引擎为func(文件, 工作表名) -> DataFrame，对写入引擎为
+    func(文件, {工作表名: DataFrame}, progress)。excel_engine为读取时传给pd.ExcelFile的引擎名。
+    """
+
+    def __init__(self, name, extensions, modules, rank, func, excel_engine=None):
+        self.name = name
+        self.extensions = extensions
+        self.modules = modules
+        self.rank = rank
+        self.func = func
+        self.excel_engine = excel_engine
+        self._available = None
+
+    @property
+    def available(self):
+        """依赖的模块是否都已安装（结果会缓存）"""
+        if self._available is None:
+            self._available = all(importlib.util.find_spec(module) is not None for module in self.modules)
+        return self._available
+
+
+class SheetRows:
+    """要写出的一个工作表：DataFrame和要写出的行位置（None为全部行，否则按给定顺序只写出这些行）
+
+    写入引擎通过chunks()按块取出数据，导出筛选/排序结果时不复制整个工作表。
+    """
+
+    def __init__(self, df, positions=None):
+        self.df = df
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.df) if self.positions is None else len(self.positions)
+
+    @property
+    def shape(self):
+        return len(self), self.df.shape[1]
+
+    @property
+    def columns(self):
+        return self.df.columns
+
+    def chunks(self, chunk_rows=WRITE_CHUNK_ROWS):
+        """按块返回要写出的行（DataFrame），空工作表返回一个空块"""
+        for start in range(0, max(len(self), 1), chunk_rows):
+            if self.positions is None:
+                yield self.df.iloc[start:start + chunk_rows]
+            else:
+                yield self.df.take(self.positions[start:start + chunk_rows])
+
+    def frame(self):
+        """要写出的全部行（只给出行位置时会复制这些行）"""
+        return self.df if self.positions is None else self.df.take(self.positions)
+
+
+def sheet_rows(data):
+    return data if isinstance(data, SheetRows) else SheetRows(data)
+
+
+class LazyFrames(Mapping):
+    """按需加载的{工作表名: DataFrame或SheetRows}：写入时逐个调用load(工作表名)，不同时持有全部工作表
+
+    rows记录已加载的各工作表要写出的行数。
+    """
+
+    def __init__(self, sheets, load):
+        self.sheets = list(sheets)
+        self.load = load
+        self.rows = {}
+
+    def __getitem__(self, sheet):
+        if sheet not in self.sheets:
+            raise KeyError(sheet)
+        data = self.load(sheet)
+        self.rows[sheet] = len(data)
+        return data
+
+    def __iter__(self):
+        return iter(self.sheets)
+
+    def __len__(self):
+        return len(self.sheets)
+
+
+READERS = []
+WRITERS = []
+
+
+def register(registry, name, extensions, modules=(), rank=1, excel_engine=None):
+    """把被装饰的函数登记为读取或写入引擎"""
+    def decorator(func):
+        registry.append(Backend(name, extensions, modules, rank, func, excel_engine))
+        return func
+    return decorator
+
+
+def extension(file_path):
+    return os.path.splitext(file_path)[1].lower()
+
+
+def candidates(registry, file_path):
+    """适用于该文件的已安装引擎，按速度排序"""
+    ext = extension(file_path)
+    return sorted((backend for backend in registry if ext in backend.extensions and backend.available),
+                  key=lambda backend: backend.rank)
+
+
+def missing_engine_error(registry, file_path, action):
+    ext = extension(file_path)
+    needs = sorted({module for backend in registry if ext in backend.extensions for module in backend.modules})
+    if not needs:
+        return ValueError(f"不支持{action}{ext or '无扩展名的'}文件")
+    return ValueError(f"没有可{action}{ext}文件的引擎，需要安装{'或'.join(needs)}")
+
+
+def run_backends(registry, file_path, action, call):
+    """按速度顺序尝试各引擎执行call(backend)，引擎缺少依赖时换用下一个，返回(结果, 引擎)"""
+    for backend in candidates(registry, file_path):
+        try:
+            return call(backend), backend
+        except ImportError:
+            # pandas检查到依赖的版本过旧等情况，之后不再使用该引擎
+            backend._available = False
+    raise missing_engine_error(registry, file_path, action)
+
+
+def open_excel(file_path):
+    """用最快的可用引擎打开Excel文件，返回pd.ExcelFile"""
+    def call(backend):
+        return pd.ExcelFile(file_path, engine=backend.excel_engine)
+    return run_backends([backend for backend in READERS if backend.excel_engine], file_path, "读取", call)[0]
+
+
+def excel_engine(file_path):
+    """open_excel打开该文件将使用的引擎名（不打开文件），没有可用引擎时返回None"""
+    backends = candidates([backend for backend in READERS if backend.excel_engine], file_path)
+    return backends[0].excel_engine if backends else None
+
+
+def sheet_names(file_path):
+    """文件中的工作表名称列表，CSV/TSV/Parquet等单表文件返回空列表"""
+    if extension(file_path) in SINGLE_SHEET_EXTENSIONS:
+        return []
+    with open_excel(file_path) as excel:
+        return list(excel.sheet_names)
+
+
+def read_frame(file_path, sheet_name=0):
+    """用最快的可用引擎读取一个工作表（CSV/TSV/Parquet文件读取整个文件）"""
+    with span("读取文件", file=os.path.basename(file_path)) as record:
+        df, backend = run_backends(READERS, file_path, "读取", lambda backend: backend.func(file_path, sheet_name))
+        record.rows, record.cols = df.shape
+        record.detail["engine"] = backend.name
+    return df
+
+
+def write_frames(file_path, frames, progress=None):
+    """用最快的可用引擎把{工作表名: DataFrame或SheetRows}写入文件，返回使用的引擎名
+
+    Excel文件每项一个工作表，CSV/TSV/Parquet只能写入一个。各工作表按顺序逐个取出并按块写出，
+    frames可以是LazyFrames。progress(message, fraction)用于报告写入进度。
+    """
+    if extension(file_path) in SINGLE_SHEET_EXTENSIONS and len(frames) != 1:
+        raise ValueError(f"{extension(file_path)[1:].upper()}文件只能导出一个工作表")
+    rows = sum(len(data) for data in frames.values()) if isinstance(frames, dict) else None
+    with span("写入文件", rows, file=os.path.basename(file_path), sheets=len(frames)) as record:
+        backend = run_backends(WRITERS, file_path, "写入",
+                               lambda backend: backend.func(file_path, frames, progress))[1]
+        record.detail["engine"] = backend.name
+    return backend.name
+
+
+def engine_summary():
+    """各文件类型可用的读写引擎（按速度排序）说明，用于界面显示"""
+    lines = []
+    for ext in EXCEL_EXTENSIONS + SINGLE_SHEET_EXTENSIONS:
+        parts = []
+        for action, registry in (("读取", READERS), ("写入", WRITERS)):
+            names = [backend.name for backend in candidates(registry, "file" + ext)]
+            parts.append(f"{action}: {' > '.join(names) if names else '无可用引擎'}")
+        lines.append(f"{ext}  " + "；".join(parts))
+    return "\n".join(lines)
+
+
+def sheet_steps(frames, progress):
+    """逐个返回(工作表名, SheetRows)，并在开始写入每个工作表前报告进度"""
+    for i, (sheet, data) in enumerate(frames.items()):
+        if progress is not None:
+            progress(f"正在写入工作表 {sheet} ({i + 1}/{len(frames)})", i / len(frames))
+        yield sheet, sheet_rows(data)
+
+
+def excel_header(df):
+    return [column if isinstance(column, (str, int, float)) else str(column) for column in df.columns]
+
+
+def excel_rows(rows):
+    """逐行返回可写入单元格的Python值列表，空值为None；按块转换，不一次复制整个工作表"""
+    for block in rows.chunks():
+        columns = []
+        for i in range(block.shape[1]):
+            column = block.iloc[:, i]
+            if isinstance(column.dtype, pd.DatetimeTZDtype):
+                raise ValueError(f"Excel不支持带时区的时间（列{block.columns[i]}），请先去掉时区")
+            columns.append(column.astype(object).where(column.notna(), None).tolist())
+        yield from zip(*columns)
+
+
+# ---- 读取引擎 ----
+
+@register(READERS, "calamine", EXCEL_EXTENSIONS, ("python_calamine",), rank=0, excel_engine="calamine")
+def read_calamine(file_path, sheet_name):
+    """Rust实现的calamine，读取速度比openpyxl快一个数量级"""
+    return pd.read_excel(file_path, sheet_name=sheet_name, engine="calamine")
+
+
+@register(READERS, "openpyxl", (".xlsx", ".xlsm"), ("openpyxl",), rank=2, excel_engine="openpyxl")
+def read_openpyxl(file_path, sheet_name):
+    """openpyxl只读模式"""
+    return pd.read_excel(file_path, sheet_name=sheet_name, engine="openpyxl")
+
+
+@register(READERS, "xlrd", (".xls",), ("xlrd",), rank=1, excel_engine="xlrd")
+def read_xlrd(file_path, sheet_name):
+    return pd.read_excel(file_path, sheet_name=sheet_name, engine="xlrd")
+
+
+@register(READERS, "csv", tuple(TEXT_SEPARATORS), rank=1)
+def read_text(file_path, sheet_name):
+    return pd.read_csv(file_path, sep=TEXT_SEPARATORS[extension(file_path)])
+
+
+@register(READERS, "pyarrow", (".parquet",), ("pyarrow",), rank=0)
+def read_parquet_pyarrow(file_path, sheet_name):
+    return pd.read_parquet(file_path, engine="pyarrow")
+
+
+@register(READERS, "fastparquet", (".parquet",), ("fastparquet",), rank=1)
+def read_parquet_fastparquet(file_path, sheet_name):
+    return pd.read_parquet(file_path, engine="fastparquet")
+
+
+# ---- 写入引擎 ----
+
+def write_pandas_excel(file_path, frames, progress, engine):
+    """用pd.ExcelWriter的指定引擎写入各工作表"""
+    with pd.ExcelWriter(file_path, engine=engine) as writer:
+        for sheet, rows in sheet_steps(frames, progress):
+            with span("写入工作表", *rows.shape, sheet=sheet, engine=engine):
+                rows.frame().to_excel(writer, sheet_name=sheet, index=False)
+
+
+@register(WRITERS, "xlsx-stream", (".xlsx",), rank=0)
+def write_xlsx_stream(file_path, frames, progress):
+    """直接生成xlsx包，工作表XML按块流式写出（与局部保存使用同一写入器）"""
+    from xlsx_package import write_new_workbook
+
+    write_new_workbook(file_path, frames, progress)
+
+
+@register(WRITERS, "xlsxwriter", (".xlsx", ".xlsm"), ("xlsxwriter",), rank=1)
+def write_xlsxwriter(file_path, frames, progress):
+    write_pandas_excel(file_path, frames, progress, "xlsxwriter")
+
+
+@register(WRITERS, "openpyxl-write-only", (".xlsx", ".xlsm"), ("openpyxl",), rank=2)
+def write_openpyxl_write_only(file_path, frames, progress):
+    """openpyxl只写模式：逐行追加，不在内存中保留单元格对象"""
+    from openpyxl import Workbook
+
+    book = Workbook(write_only=True)
+    for sheet, rows in sheet_steps(frames, progress):
+        with span("写入工作表", *rows.shape, sheet=sheet, engine="openpyxl-write-only"):
+            worksheet = book.create_sheet(sheet)
+            worksheet.append(excel_header(rows))
+            for row in excel_rows(rows):
+                worksheet.append(row)
+    book.save(file_path)
+
+
+@register(WRITERS, "openpyxl", (".xlsx", ".xlsm"), ("openpyxl",), rank=3)
+def write_openpyxl(file_path, frames, progress):
+    """openpyxl普通模式（pandas默认的写入方式）"""
+    write_pandas_excel(file_path, frames, progress, "openpyxl")
+
+
+@register(WRITERS, "xlwt", (".xls",), ("xlwt",), rank=1)
+def write_xlwt(file_path, frames, progress):
+    """Excel 97-2003格式，pandas已不再支持，直接使用xlwt写入"""
+    import xlwt
+
+    book = xlwt.Workbook(encoding="utf-8")
+    date_style = xlwt.easyxf(num_format_str="YYYY-MM-DD HH:MM:SS")
+    for sheet, rows in sheet_steps(frames, progress):
+        if len(rows) >= XLS_MAX_ROWS or rows.shape[1] > XLS_MAX_COLUMNS:
+            raise ValueError(f"工作表{sheet}有{len(rows)}行 x {rows.shape[1]}列，超过.xls文件的上限"
+                             f"（{XLS_MAX_ROWS - 1}行 x {XLS_MAX_COLUMNS}列），请保存为.xlsx文件")
+        with span("写入工作表", *rows.shape, sheet=sheet, engine="xlwt"):
+            worksheet = book.add_sheet(sheet)
+            for c, value in enumerate(excel_header(rows)):
+                worksheet.write(0, c, value)
+            for r, row in enumerate(excel_rows(rows), start=1):
+                for c, value in enumerate(row):
+                    if value is None:
+                        continue
+                    if isinstance(value, datetime.date):
+                        worksheet.write(r, c, value, date_style)
+                    else:
+                        worksheet.write(r, c, value)
+    book.save(file_path)
+
+
+@register(WRITERS, "csv", tuple(TEXT_SEPARATORS), rank=1)
+def write_text(file_path, frames, progress):
+    separator = TEXT_SEPARATORS[extension(file_path)]
+    sheet, rows = next(sheet_steps(frames, progress))
+    with span("写入工作表", *rows.shape, sheet=sheet, engine="csv"), \
+            open(file_path, "w", encoding="utf-8", newline="") as fp:
+        for i, chunk in enumerate(rows.chunks()):
+            chunk.to_csv(fp, sep=separator, index=False, header=i == 0)
+
+
+@register(WRITERS, "pyarrow", (".parquet",), ("pyarrow",), rank=0)
+def write_parquet_pyarrow(file_path, frames, progress):
+    """按块写入行组，列类型按第一块推断，使各行组一致"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sheet, rows = next(sheet_steps(frames, progress))
+    with span("写入工作表", *rows.shape, sheet=sheet, engine="pyarrow"):
+        chunks = rows.chunks()
+        first = next(chunks).rename(columns=str)
+        schema = parquet_schema(first, rows.df)
+        with pq.ParquetWriter(file_path, schema) as writer:
+            writer.write_table(pa.Table.from_pandas(first, schema=schema, preserve_index=False))
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pandas(chunk.rename(columns=str), schema=schema,
+                                                        preserve_index=False))
+
+
+def parquet_schema(first, df):
+    """按第一块推断Parquet列类型；第一块中全为空值的列从该列第一个非空值起取一块推断"""
+    import pyarrow as pa
+
+    schema = pa.Schema.from_pandas(first, preserve_index=False)
+    for i in range(len(first.columns)):
+        field = schema.field(i)
+        if not pa.types.is_null(field.type):
+            continue
+        column = df.iloc[:, i]
+        valid = column.notna().to_numpy()
+        if valid.any():
+            start = int(valid.argmax())
+            sample = pa.Array.from_pandas(column.iloc[start:start + WRITE_CHUNK_ROWS])
+            schema = schema.set(i, field.with_type(sample.type))
+    return schema
+
+
+@register(WRITERS, "fastparquet", (".parquet",), ("fastparquet",), rank=1)
+def write_parquet_fastparquet(file_path, frames, progress):
+    sheet, rows = next(sheet_steps(frames, progress))
+    with span("写入工作表", *rows.shape, sheet=sheet, engine="fastparquet"):
+        rows.frame().rename(columns=str).to_parquet(file_path, engine="fastparquet", index=False)
@@ -0,0 +1,168 @@
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 后台任务默认的工作线程数
+DEFAULT_MAX_WORKERS = 2
+# 主线程轮询任务结果的间隔（毫秒）
+POLL_INTERVAL_MS = 50
+
+
+class JobCancelled(Exception):
+    """后台任务被用户取消"""
+
+
+class JobConflict(Exception):
+    """同一工作簿上已有后台任务在执行"""
+
+
+class Job:
+    """后台任务句柄，工作线程通过它报告进度并检查取消请求"""
+
+    def __init__(self, scheduler, key, name):
+        self.scheduler = scheduler
+        self.key = key
+        self.name = name
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        """是否已请求取消"""
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        """请求取消任务，工作线程在下一个检查点退出"""
+        self._cancel_event.set()
+
+    def check_cancelled(self):
+        """已请求取消时抛出JobCancelled"""
+        if self._cancel_event.is_set():
+            raise JobCancelled(self.name)
+
+    def report(self, message, fraction=None):
+        """报告进度（在工作线程中调用），同时作为取消检查点"""
+        self.check_cancelled()
+        self.scheduler._queue.put((self, "progress", (message, fraction)))
+
+    def publish(self, data):
+        """把中间结果（如已加载的部分数据）送回主线程，由提交时的on_data回调处理"""
+        self.check_cancelled()
+        self.scheduler._queue.put((self, "data", data))
+
+
+class JobScheduler:
+    """在线程池中执行耗时操作，并通过root.after把进度和结果送回Tk主线程
+
+    同一个key（通常为工作簿路径）同时只允许一个任务执行，避免互相冲突。
+    """
+
+    def __init__(self, root, on_progress=None, on_finish=None, max_workers=DEFAULT_MAX_WORKERS):
+        self.root = root
+        self.on_progress = on_progress  # 回调(job, message, fraction)
+        self.on_finish = on_finish      # 回调(job)，任务结束（成功、失败或取消）后调用
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="excel-job")
+        self._queue = queue.Queue()
+        self._active = {}     # key -> Job
+        self._callbacks = {}  # Job -> (on_done, on_error, on_cancel, on_data)
+        self._polling = False
+
+    def is_busy(self, key=None):
+        """指定key（为None时为任意key）上是否有任务在执行"""
+        if key is None:
+            return bool(self._active)
+        return key in self._active
+
+    def active_jobs(self):
+        """正在执行的任务列表"""
+        return list(self._active.values())
+
+    def submit(self, key, name, func, on_done=None, on_error=None, on_cancel=None, on_data=None):
+        """提交任务，func(job)在工作线程中执行，回调均在主线程中调用"""
+        if key in self._active:
+            raise JobConflict(f"“{self._active[key].name}”正在执行，请稍后再试")
+        job = Job(self, key, name)
+        self._active[key] = job
+        self._callbacks[job] = (on_done, on_error, on_cancel, on_data)
+        self._executor.submit(self._run, job, func)
+        if not self._polling:
+            self._polling = True
+            self.root.after(POLL_INTERVAL_MS, self._poll)
+        return job
+
+    def cancel(self, key=None):
+        """取消指定key（为None时为全部）的任务"""
+        for job_key, job in list(self._active.items()):
+            if key is None or job_key == key:
+                job.cancel()
+
+    def shutdown(self):
+        """取消全部任务并等待工作线程退出"""
+        self.cancel()
+        self._executor.shutdown(wait=True)
+
+    def _run(self, job, func):
+        try:
+            result = func(job)
+            job.check_cancelled()
+            self._queue.put((job, "done", result))
+        except JobCancelled:
+            self._queue.put((job, "cancelled", None))
+        except Exception as e:
+            self._queue.put((job, "error", e))
+
+    def _poll(self):
+        try:
+            self._dispatch()
+        finally:
+            # 回调出错也继续轮询，否则之后的任务结果不再送达
+            if self._active or not self._queue.empty():
+                self.root.after(POLL_INTERVAL_MS, self._poll)
+            else:
+                self._polling = False
+
+    def _call(self, callback, *args):
+        """在主线程中调用回调，出错时交给Tk报告，不影响其他回调"""
+        try:
+            callback(*args)
+        except Exception:
+            self.root.report_callback_exception(*sys.exc_info())
+
+    def _dispatch(self):
+        # 合并同一任务的多条进度消息和中间结果，只处理最新的一条
+        progress = {}
+        data = {}
+        finished = []
+        while True:
+            try:
+                job, kind, payload = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                progress[job] = payload
+            elif kind == "data":
+                data[job] = payload
+            else:
+                progress.pop(job, None)
+                finished.append((job, kind, payload))
+
+        for job, (message, fraction) in progress.items():
+            if self.on_progress is not None and not job.cancelled:
+                self._call(self.on_progress, job, message, fraction)
+
+        for job, payload in data.items():
+            on_data = self._callbacks[job][3]
+            if on_data is not None and not job.cancelled:
+                self._call(on_data, payload)
+
+        for job, kind, payload in finished:
+            self._active.pop(job.key, None)
+            on_done, on_error, on_cancel, _ = self._callbacks.pop(job)
+            if kind == "done" and on_done is not None:
+                self._call(on_done, payload)
+            elif kind == "error" and on_error is not None:
+                self._call(on_error, payload)
+            elif kind == "cancelled" and on_cancel is not None:
+                self._call(on_cancel)
+            if self.on_finish is not None:
+                self._call(self.on_finish, job)
@@ -0,0 +1,173 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from io_backends import read_frame
+
+# 多个文件的列不一致时的对齐方式
+ALIGN_UNION = "union"          # 保留所有文件中出现过的列，缺少的列为空
+ALIGN_INTERSECT = "intersect"  # 只保留所有文件都有的列
+ALIGN_NAMES = {ALIGN_UNION: "并集", ALIGN_INTERSECT: "交集"}
+# 导入报告中列出的文件数
+REPORT_FILE_LIMIT = 10
+
+
+def read_source(file_path, sheet_name):
+    """读取一个导入源（在子进程中执行），sheet_name为None时读取第一个工作表"""
+    return read_frame(file_path, 0 if sheet_name is None else sheet_name)
+
+
+def source_name(source):
+    file_path, sheet_name = source
+    name = os.path.basename(file_path)
+    return name if sheet_name is None else f"{name} [{sheet_name}]"
+
+
+def read_sources(sources, jobs=None, progress=None, mp_context=None):
+    """在进程池中并行读取多个导入源[(文件, 工作表名)]，返回({源: DataFrame}, {源: 异常})
+
+    progress(message, fraction)在每个源读取完成后调用，可在其中抛出异常以取消尚未开始的读取。
+    单个源读取失败不影响其他源。
+    """
+    progress = progress or (lambda message, fraction=None: None)
+    frames, failures = {}, {}
+    if len(sources) == 1:
+        source = sources[0]
+        progress(f"正在读取 {source_name(source)}", None)
+        try:
+            frames[source] = read_source(*source)
+        except Exception as e:
+            failures[source] = e
+        return frames, failures
+
+    workers = min(jobs or os.cpu_count() or 1, len(sources))
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+    try:
+        futures = {pool.submit(read_source, *source): source for source in sources}
+        for done, future in enumerate(as_completed(futures), start=1):
+            source = futures[future]
+            try:
+                frames[source] = future.result()
+            except Exception as e:
+                failures[source] = e
+            progress(f"已读取{done}/{len(sources)}个文件: {source_name(source)}", done / len(sources))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return frames, failures
+
+
+def aligned_columns(column_lists, how=ALIGN_UNION, reference=None):
+    """对齐后的列：reference（如当前工作表的列）在前，其余按首次出现的顺序"""
+    order = list(dict.fromkeys([*(reference or []), *(column for columns in column_lists for column in columns)]))
+    if how == ALIGN_UNION:
+        return order
+    if how != ALIGN_INTERSECT:
+        raise ValueError(f"未知的列对齐方式: {how}")
+    common = set(order)
+    for columns in column_lists:
+        common.intersection_update(columns)
+    if reference is not None:
+        common.intersection_update(reference)
+    return [column for column in order if column in common]
+
+
+def common_dtype(dtypes, has_missing=False):
+    """多个文件中同一列的类型统一为能容纳全部值的类型，has_missing表示有文件缺少该列"""
+    dtypes = list(dict.fromkeys(dtypes))
+    if len(dtypes) == 1 and not has_missing:
+        return dtypes[0]
+    if all(pd.api.types.is_bool_dtype(dtype) for dtype in dtypes):
+        return pd.BooleanDtype() if has_missing or any(not isinstance(d, np.dtype) for d in dtypes) \
+            else np.dtype(bool)
+    if any(pd.api.types.is_bool_dtype(dtype) for dtype in dtypes):
+        return np.dtype(object)
+    if all(pd.api.types.is_integer_dtype(dtype) for dtype in dtypes):
+        numpy_dtypes = [dtype if isinstance(dtype, np.dtype) else dtype.numpy_dtype for dtype in dtypes]
+        result = np.result_type(*numpy_dtypes)
+        if result.kind == "f":
+            # 有符号与uint64混合时numpy给出浮点，用int64保存
+            result = np.dtype(np.int64)
+        if has_missing or any(not isinstance(dtype, np.dtype) for dtype in dtypes):
+            return pd.api.types.pandas_dtype(result.name.capitalize())
+        return result
+    if all(pd.api.types.is_numeric_dtype(dtype) for dtype in dtypes):
+        return np.dtype(np.float64)
+    if len(dtypes) == 1:
+        # 其余类型（日期、字符串、分类等）可以直接容纳空值
+        return dtypes[0]
+    if all(pd.api.types.is_datetime64_any_dtype(dtype) for dtype in dtypes):
+        zones = {str(getattr(dtype, "tz", None)) for dtype in dtypes}
+        if len(zones) == 1:
+            tz = getattr(dtypes[0], "tz", None)
+            return np.dtype("datetime64[ns]") if tz is None else pd.DatetimeTZDtype("ns", tz)
+    return np.dtype(object)
+
+
+class ImportReport:
+    """多文件导入的结果：各文件读取的记录数、与对齐后的列相比缺少和多出的列，以及读取失败的文件"""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.sources = []   # [(源, 记录数, 缺少的列, 被丢弃的列)]
+        self.failures = []  # [(源, 异常)]
+        self.dtype_changes = {}  # 列名 -> 统一后的类型（文件之间类型不一致的列）
+
+    @property
+    def row_count(self):
+        return sum(rows for _, rows, _, _ in self.sources)
+
+    def summary(self, limit=REPORT_FILE_LIMIT):
+        """报告摘要文本，只列出前limit个有差异的文件和失败的文件"""
+        lines = []
+        for source, rows, missing, dropped in self.sources:
+            if missing or dropped:
+                text = f"{source_name(source)}：{rows}条记录"
+                if missing:
+                    text += f"，缺少列 {', '.join(map(str, missing))}"
+                if dropped:
+                    text += f"，未导入列 {', '.join(map(str, dropped))}"
+                lines.append(text)
+        for column, dtype in self.dtype_changes.items():
+            lines.append(f"列 '{column}' 的类型不一致，统一为{dtype}")
+        lines.extend(f"{source_name(source)}：读取失败：{error}" for source, error in self.failures)
+        if len(lines) > limit:
+            lines = lines[:limit] + [f"……共{len(lines)}项"]
+        return "\n".join(lines)
+
+
+def align_frames(frames, how=ALIGN_UNION, reference=None):
+    """按列名对齐多个DataFrame（{源: DataFrame}，按源的顺序）并统一各列类型，一次合并
+
+    返回(合并后的DataFrame, ImportReport)。reference为当前工作表的列时，这些列排在前面；
+    取交集时只保留当前工作表也有的列。
+    """
+    columns = aligned_columns([list(df.columns) for df in frames.values()], how, reference)
+    report = ImportReport(columns)
+    dtypes = {}
+    for column in columns:
+        present = [df[column].dtype for df in frames.values() if column in df.columns]
+        if not present:
+            # 只在当前工作表中存在的列，导入的记录为空
+            continue
+        dtypes[column] = common_dtype(present, has_missing=len(present) < len(frames))
+        if len(set(map(str, present))) > 1:
+            report.dtype_changes[column] = dtypes[column]
+
+    aligned = []
+    for source, df in frames.items():
+        missing = [column for column in columns if column not in df.columns and column in dtypes]
+        dropped = [column for column in df.columns if column not in columns]
+        report.sources.append((source, len(df), missing, dropped))
+        df = df.reindex(columns=list(dtypes))
+        aligned.append(df.astype({column: dtype for column, dtype in dtypes.items() if df[column].dtype != dtype}))
+    if not aligned:
+        return pd.DataFrame(columns=columns), report
+    return pd.concat(aligned, ignore_index=True), report
+
+
+def gui_pool_context():
+    """在有界面线程的进程中创建子进程时使用spawn，避免fork复制正在运行的线程"""
+    return multiprocessing.get_context("spawn")
@@ -0,0 +1,209 @@
+import cProfile
+import io
+import json
+import logging
+import logging.handlers
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+# 保留的最近操作记录数
+PERF_HISTORY = 500
+# 性能日志默认位置、单个文件大小上限（字节）和保留的旧文件数
+DEFAULT_PERF_LOG = os.path.join(os.path.expanduser("~"), ".excel_manager", "perf.log")
+PERF_LOG_MAX_BYTES = 5 * 1024 * 1024
+PERF_LOG_BACKUPS = 3
+# 分析报告中列出的函数数和内存分配位置数
+PROFILE_FUNCTIONS = 30
+PROFILE_ALLOCATIONS = 15
+
+
+class Span:
+    """一次操作的计时记录：名称、耗时、涉及的行数和列数以及其他说明"""
+
+    def __init__(self, name, rows=None, cols=None, detail=None, depth=0):
+        self.name = name
+        self.rows = rows
+        self.cols = cols
+        self.detail = detail or {}
+        self.depth = depth          # 嵌套层数，0为用户直接触发的操作
+        self.thread = threading.current_thread().name
+        self.started = time.time()
+        self.seconds = None
+        self.error = None
+        self.profile = None         # 分析报告文本（只有被分析的操作才有）
+
+    def describe(self):
+        """状态栏中显示的说明，如“导出 1.23s（10000行 x 5列） [xlsx-stream]”"""
+        size = []
+        if self.rows is not None:
+            size.append(f"{self.rows}行")
+        if self.cols is not None:
+            size.append(f"{self.cols}列")
+        text = f"{self.name} {self.seconds:.3f}s"
+        if size:
+            text += f"（{' x '.join(size)}）"
+        if "engine" in self.detail:
+            text += f" [{self.detail['engine']}]"
+        return text + ("，失败" if self.error else "")
+
+    def as_dict(self):
+        return {"time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)), "name": self.name,
+                "seconds": round(self.seconds, 6), "rows": self.rows, "cols": self.cols, "depth": self.depth,
+                "thread": self.thread, "error": self.error,
+                **{key: value if isinstance(value, (int, float, bool)) or value is None else str(value)
+                   for key, value in self.detail.items()}}
+
+
+class ProfileCapture:
+    """对一次操作同时进行cProfile和tracemalloc分析（只分析执行该操作的线程的函数调用）"""
+
+    def __init__(self):
+        self.error = None
+        self.profiler = cProfile.Profile()
+        self.own_tracing = not tracemalloc.is_tracing()
+        if self.own_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.snapshot = tracemalloc.take_snapshot()
+        try:
+            self.profiler.enable()
+        except ValueError as e:  # 已有其他分析器在运行
+            self.profiler = None
+            self.error = str(e)
+
+    def finish(self, span):
+        """结束分析，返回报告文本"""
+        if self.profiler is not None:
+            self.profiler.disable()
+        current, peak = tracemalloc.get_traced_memory()
+        allocations = tracemalloc.take_snapshot().compare_to(self.snapshot, "lineno")[:PROFILE_ALLOCATIONS]
+        if self.own_tracing:
+            tracemalloc.stop()
+
+        out = io.StringIO()
+        out.write(f"{span.describe()}，线程 {span.thread}\n")
+        out.write(f"内存峰值 {peak / 1e6:.1f}MB（分析期间跟踪的Python分配）\n\n")
+        if self.profiler is not None:
+            out.write(f"耗时最多的{PROFILE_FUNCTIONS}个函数（按累计耗时）:\n")
+            pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_FUNCTIONS)
+        else:
+            out.write(f"无法进行函数分析: {self.error}\n")
+        out.write(f"\n新增内存最多的{PROFILE_ALLOCATIONS}个位置:\n")
+        for stat in allocations:
+            out.write(f"{stat}\n")
+        return out.getvalue()
+
+
+class Tracer:
+    """记录各操作的计时
+
+    span()可以嵌套，也可以在后台线程中使用；最近的记录保存在history中，version在每次
+    记录后加一，界面据此判断是否需要刷新。设置日志文件后每条记录以一行JSON写入，文件
+    达到大小上限时轮转。profile_next()之后开始的第一个顶层操作会被分析，报告保存在其记录中。
+    """
+
+    def __init__(self, history=PERF_HISTORY):
+        self.history = deque(maxlen=history)
+        self.version = 0
+        self.log_path = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profile_armed = False
+        self._listeners = []
+        self._logger = logging.getLogger(f"{__name__}.{id(self)}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+
+    @contextmanager
+    def span(self, name, rows=None, cols=None, **detail):
+        """记录with块的耗时，返回的Span可以在块内补充rows、cols和detail"""
+        stack = self._local.__dict__.setdefault("stack", [])
+        span = Span(name, rows, cols, detail, depth=len(stack))
+        capture = self._take_profile() if not stack else None
+        stack.append(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.seconds = time.perf_counter() - start
+            stack.pop()
+            if capture is not None:
+                span.profile = capture.finish(span)
+            self._record(span)
+
+    def _take_profile(self):
+        with self._lock:
+            if not self._profile_armed:
+                return None
+            self._profile_armed = False
+        return ProfileCapture()
+
+    def _record(self, span):
+        with self._lock:
+            self.history.append(span)
+            self.version += 1
+        if self.log_path is not None:
+            self._logger.info(json.dumps(span.as_dict(), ensure_ascii=False))
+        for listener in list(self._listeners):
+            listener(span)
+
+    def add_listener(self, listener):
+        """每条记录完成后调用listener(span)（在执行该操作的线程中）"""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def profile_next(self, enabled=True):
+        """分析下一个开始的顶层操作（enabled为False时取消）"""
+        with self._lock:
+            self._profile_armed = enabled
+
+    @property
+    def profile_pending(self):
+        return self._profile_armed
+
+    def latest(self, depth=0):
+        """最近完成的指定层数的操作记录"""
+        with self._lock:
+            return next((span for span in reversed(self.history) if span.depth == depth), None)
+
+    def spans(self):
+        with self._lock:
+            return list(self.history)
+
+    def clear(self):
+        with self._lock:
+            self.history.clear()
+            self.version += 1
+
+    def set_log(self, path):
+        """把之后的记录写入轮转日志文件path，None为不写日志"""
+        for handler in list(self._logger.handlers):
+            self._logger.removeHandler(handler)
+            handler.close()
+        self.log_path = path
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes=PERF_LOG_MAX_BYTES,
+                                                           backupCount=PERF_LOG_BACKUPS, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger.addHandler(handler)
+
+
+# 全局的操作计时记录，各模块通过span()记录
+TRACER = Tracer()
+
+
+def span(name, rows=None, cols=None, **detail):
+    """在全局记录中记录一次操作的耗时，用法: with span("排序", rows=n) as s: ..."""
+    return TRACER.span(name, rows, cols, **detail)
@@ -0,0 +1,762 @@
+import numpy as np
+import pandas as pd
+
+from column_index import ColumnIndex
+from edit_journal import BlockDelta, CellDelta, CompoundDelta, DeltaCollector, FrameDelta, OrderDelta, RowsDelta
+from perf_trace import span
+from validation import FALSE_VALUES, TRUE_VALUES
+
+# 按键合并时浮点数值视为相同的相对误差（文本解析为浮点数时末位可能不同）
+FLOAT_MATCH_RTOL = 1e-12
+# 追加缓冲中的行数达到max(APPEND_BUFFER_MIN_ROWS, 已有行数 * APPEND_BUFFER_RATIO)时合并到DataFrame，
+# 使逐条新增记录的总开销与记录数成线性关系
+APPEND_BUFFER_MIN_ROWS = 4096
+APPEND_BUFFER_RATIO = 1 / 16
+
+
+class DtypeChangeError(ValueError):
+    """修改的值无法以列当前的类型保存，需要改变列的类型"""
+
+    def __init__(self, column, old_dtype, new_dtype):
+        self.column = column
+        self.old_dtype = old_dtype
+        self.new_dtype = new_dtype
+        super().__init__(f"列 '{column}' 的类型将从{old_dtype}变为{new_dtype}")
+
+
+def dtype_changed(old, new):
+    """列类型是否改变（分类列只增加类别不算改变）"""
+    if isinstance(old, pd.CategoricalDtype) and isinstance(new, pd.CategoricalDtype):
+        return False
+    return old != new
+
+
+def nullable_integer_dtype(dtype):
+    """NumPy整数类型对应的可空整数类型（如int64 -> Int64）"""
+    return pd.api.types.pandas_dtype(dtype.name.capitalize().replace("Uint", "UInt"))
+
+
+def blank_to_na(series):
+    """把空白字符串视为空值"""
+    if pd.api.types.is_object_dtype(series.dtype) or pd.api.types.is_string_dtype(series.dtype):
+        blank = series.astype(str).str.strip().eq("").to_numpy() & series.notna().to_numpy()
+        return series.mask(blank)
+    return series
+
+
+def coerce_series(series, dtype):
+    """把输入的值（通常为字符串）转换为列的类型dtype，返回(转换后的Series, 实际类型)
+
+    值无法以dtype保存时（如整数列中的小数或空值），实际类型为能容纳这些值的最紧凑类型：
+    整数列有空值时为可空整数，有小数时为浮点数，无法解析时为object。
+    """
+    if series.dtype == dtype:
+        return series, dtype
+    if pd.api.types.is_string_dtype(dtype) and not pd.api.types.is_object_dtype(dtype):
+        return series.astype(dtype), dtype
+    if pd.api.types.is_object_dtype(dtype):
+        return series.astype(object), dtype
+
+    values = blank_to_na(series)
+    present = values.notna().to_numpy()
+    if isinstance(dtype, pd.CategoricalDtype):
+        try:
+            values = values.astype(dtype.categories.dtype)
+        except (TypeError, ValueError):
+            pass
+        new = pd.Index(values[present].unique()).difference(dtype.categories)
+        if len(new):
+            # 新的值作为新类别追加，列仍保持分类类型
+            dtype = pd.CategoricalDtype(dtype.categories.append(new), ordered=dtype.ordered)
+        return values.astype(dtype), dtype
+
+    if pd.api.types.is_bool_dtype(dtype):
+        lower = values.astype(str).str.strip().str.lower()
+        true = lower.isin(TRUE_VALUES).to_numpy()
+        false = lower.isin(FALSE_VALUES).to_numpy()
+        if (present & ~(true | false)).any():
+            return series.astype(object), np.dtype(object)
+        result = pd.Series(true, index=series.index)
+        if not present.all():
+            return result.astype("boolean").mask(~present), pd.BooleanDtype()
+        return result.astype(dtype), dtype
+
+    if pd.api.types.is_numeric_dtype(dtype):
+        numbers = pd.to_numeric(values, errors="coerce")
+        if (present & numbers.isna().to_numpy()).any():
+            return series.astype(object), np.dtype(object)
+        if pd.api.types.is_integer_dtype(dtype):
+            valid = numbers[present]
+            if (valid % 1 != 0).any():
+                target = pd.Float64Dtype() if isinstance(dtype, pd.api.extensions.ExtensionDtype) else np.dtype("float64")
+                return numbers.astype(target), target
+            if len(valid):
+                # 超出当前位宽（如紧凑加载后的int8）时改用64位整数，仍超出时改用浮点数
+                info = np.iinfo(dtype.numpy_dtype if not isinstance(dtype, np.dtype) else dtype)
+                if valid.min() < info.min or valid.max() > info.max:
+                    wide = np.iinfo(np.int64)
+                    if valid.min() < wide.min or valid.max() > wide.max:
+                        return numbers.astype("float64"), np.dtype("float64")
+                    dtype = np.dtype("int64") if isinstance(dtype, np.dtype) else pd.Int64Dtype()
+            if not present.all() and isinstance(dtype, np.dtype):
+                dtype = nullable_integer_dtype(dtype)
+        return numbers.astype(dtype), dtype
+
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        dates = pd.to_datetime(values, errors="coerce", format="mixed")
+        if (present & dates.isna().to_numpy()).any():
+            return series.astype(object), np.dtype(object)
+        tz = getattr(dtype, "tz", None)
+        if tz is not None and dates.dt.tz is None:
+            dates = dates.dt.tz_localize(tz)
+        return dates.astype(dtype), dtype
+
+    try:
+        return series.astype(dtype), dtype
+    except (TypeError, ValueError):
+        return series.astype(object), np.dtype(object)
+
+
+class SortKey:
+    """一列的排序键：稳定的升序排列（空值在后）和每行的名次（相同值名次相同，空值为NaN）"""
+
+    def __init__(self, series):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # 分类列按类别顺序排序
+            codes = series.cat.codes.to_numpy()
+            null = codes < 0
+            values = codes
+        else:
+            null = series.isna().to_numpy()
+            values = series.to_numpy()
+        valid = np.flatnonzero(~null)
+        valid_values = values[valid]
+        order = np.argsort(valid_values, kind="stable")
+        self.valid_count = len(valid)
+        self.permutation = np.concatenate([valid[order], np.flatnonzero(null)])
+
+        # 排好序的相邻值不同处名次加一
+        sorted_values = valid_values[order]
+        changed = np.empty(len(sorted_values), dtype=np.int64)
+        if len(sorted_values):
+            changed[0] = 0
+            changed[1:] = sorted_values[1:] != sorted_values[:-1]
+        self.ranks = np.full(len(series), np.nan)
+        self.ranks[self.permutation[:self.valid_count]] = np.cumsum(changed)
+
+    def ascending(self):
+        """升序排列"""
+        return self.permutation
+
+    def descending(self):
+        """降序排列：由升序排列按相同值分组后倒转组的顺序得到，组内保持原顺序，空值仍在最后"""
+        count = self.valid_count
+        ranks = self.ranks[self.permutation[:count]]
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(ranks)) + 1]).astype(np.int64)
+        lengths = np.diff(np.append(starts, count))
+        starts, lengths = starts[::-1], lengths[::-1]
+        offsets = np.cumsum(lengths) - lengths
+        index = np.arange(count) + np.repeat(starts - offsets, lengths)
+        return np.concatenate([self.permutation[:count][index], self.permutation[count:]])
+
+
+def coerce_value(value, dtype):
+    """coerce_series的单个值版本，返回(转换后的值, 实际类型)；常见情况不构造Series"""
+    if isinstance(value, str) and value.strip():
+        text = value.strip()
+        if isinstance(dtype, pd.CategoricalDtype):
+            if value in dtype.categories:
+                return value, dtype
+        elif pd.api.types.is_bool_dtype(dtype):
+            if text.lower() in TRUE_VALUES:
+                return True, dtype
+            if text.lower() in FALSE_VALUES:
+                return False, dtype
+        elif pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_float_dtype(dtype):
+            try:
+                number = float(text) if pd.api.types.is_float_dtype(dtype) else int(text)
+            except ValueError:
+                pass
+            else:
+                if pd.api.types.is_float_dtype(dtype):
+                    return number, dtype
+                info = np.iinfo(dtype.numpy_dtype if not isinstance(dtype, np.dtype) else dtype)
+                if info.min <= number <= info.max:
+                    return number, dtype
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            try:
+                timestamp = pd.Timestamp(text)
+            except ValueError:
+                pass
+            else:
+                tz = getattr(dtype, "tz", None)
+                if tz is not None and timestamp.tz is None:
+                    timestamp = timestamp.tz_localize(tz)
+                return timestamp, dtype
+    if isinstance(value, str) and pd.api.types.is_string_dtype(dtype):
+        return value, dtype
+    series, dtype = coerce_series(pd.Series([value], dtype=object), dtype)
+    return series.iloc[0], dtype
+
+
+class ChangeSet:
+    """一次数据修改的变更集：新增的行、删除的行和修改的单元格（均以行ID表示）
+
+    reset为True表示数据整体被替换（如导入为新工作表），视图需要完全重建。
+    """
+
+    def __init__(self, inserted=(), removed=(), updated=None, reordered=False, reset=False, dtype_changes=None):
+        self.inserted = list(inserted)  # 新增行ID，按显示顺序
+        self.removed = list(removed)    # 删除行ID
+        self.updated = updated or {}    # 行ID -> 修改的列名列表
+        self.reordered = reordered      # 显示的行或其顺序改变（排序、筛选）
+        self.reset = reset
+        self.dtype_changes = dtype_changes or {}  # 列名 -> (原类型, 新类型)
+
+    @property
+    def columns(self):
+        """被修改单元格所在的列"""
+        columns = set()
+        for cols in self.updated.values():
+            columns.update(cols)
+        return columns
+
+    @property
+    def data_changed(self):
+        """是否修改了数据（只改变显示顺序时为False，改变了列类型时为True）"""
+        return bool(self.inserted or self.removed or self.updated or self.reset or self.dtype_changes)
+
+    def is_empty(self):
+        """变更集是否为空"""
+        return not (self.data_changed or self.reordered)
+
+    @classmethod
+    def combine(cls, changesets):
+        """合并依次进行的几次修改（行互不重叠）的变更集"""
+        combined = cls()
+        for changes in changesets:
+            combined.inserted.extend(changes.inserted)
+            combined.removed.extend(changes.removed)
+            combined.updated.update(changes.updated)
+            combined.reordered = combined.reordered or changes.reordered
+            combined.reset = combined.reset or changes.reset
+            combined.dtype_changes.update(changes.dtype_changes)
+        return combined
+
+    def __repr__(self):
+        return (f"ChangeSet(inserted={len(self.inserted)}, removed={len(self.removed)}, "
+                f"updated={len(self.updated)}, reordered={self.reordered}, reset={self.reset})")
+
+
+def key_index(df, keys):
+    """键列的值作为索引（多个键列时为MultiIndex），用于按键的哈希查找"""
+    if len(keys) == 1:
+        return pd.Index(df[keys[0]])
+    return pd.MultiIndex.from_frame(df[list(keys)])
+
+
+def same_values(old, new):
+    """两列等长的值是否逐个相等（空值与空值相等，浮点数按FLOAT_MATCH_RTOL比较），返回布尔数组"""
+    old = old.reset_index(drop=True)
+    new = new.reset_index(drop=True)
+    if pd.api.types.is_float_dtype(old.dtype) and pd.api.types.is_float_dtype(new.dtype):
+        return np.isclose(old.to_numpy(dtype=float, na_value=np.nan), new.to_numpy(dtype=float, na_value=np.nan),
+                          rtol=FLOAT_MATCH_RTOL, atol=0, equal_nan=True)
+    try:
+        equal = (old == new).to_numpy(dtype=bool, na_value=False)
+    except TypeError:  # 类型不可比较（如不同类别的分类列）
+        equal = (old.astype(object) == new.astype(object)).to_numpy(dtype=bool, na_value=False)
+    return equal | (old.isna().to_numpy() & new.isna().to_numpy())
+
+
+class UpsertResult:
+    """按键合并的结果：新增、更新、未变和删除的记录数"""
+
+    def __init__(self, inserted=0, updated=0, unchanged=0, deleted=0):
+        self.inserted = inserted
+        self.updated = updated
+        self.unchanged = unchanged
+        self.deleted = deleted
+
+    def describe(self):
+        text = f"新增{self.inserted}条，更新{self.updated}条，未变{self.unchanged}条"
+        return text + (f"，删除{self.deleted}条" if self.deleted else "")
+
+
+def frame_from_columns(columns, dtypes, index):
+    """由各列的值列表按指定类型构造DataFrame"""
+    df = pd.DataFrame({column: pd.Series(values, dtype=dtypes[column]) for column, values in columns.items()})
+    df.index = index
+    return df
+
+
+class AppendBuffer:
+    """新增行的追加缓冲：按列保存已转换为列类型的值，行ID从first_id起连续
+
+    逐条新增记录时不必每次复制整个DataFrame，缓冲的行在需要时一次合并。
+    """
+
+    def __init__(self, dtypes, first_id):
+        self.dtypes = dtypes  # 列名 -> 类型，与DataFrame的列相同
+        self.first_id = first_id
+        self.columns = {column: [] for column in dtypes}
+        self.count = 0
+
+    def extend(self, columns, count):
+        """追加count行，columns为{列名: 值列表}"""
+        for column, values in columns.items():
+            self.columns[column].extend(values)
+        self.count += count
+
+    def frame(self, offsets=None):
+        """缓冲的行（或其中第offsets行）构成的DataFrame，索引为行ID"""
+        if offsets is None:
+            columns = self.columns
+            offsets = np.arange(self.count)
+        else:
+            columns = {column: [values[offset] for offset in offsets] for column, values in self.columns.items()}
+        return frame_from_columns(columns, self.dtypes, pd.Index(self.first_id + np.asarray(offsets, dtype=np.int64)))
+
+
+class SheetModel:
+    """工作表数据模型
+
+    DataFrame的索引作为稳定的行ID：删除记录后不再重新编号，新增记录分配新的ID，
+    因此视图中的项ID在增删后保持不变。所有修改都通过返回ChangeSet的方法进行，
+    视图据此只做最少的更新。排序和筛选只改变显示的行及其顺序，DataFrame保持原样。
+    设置了journal（EditJournal）时，每次修改和排序都记录可以还原它的差异。
+
+    新增的少量记录先放在追加缓冲中，访问df（排序、筛选、修改、保存等）或缓冲达到阈值时
+    才合并到DataFrame，合并后调用on_flush。行数、显示顺序、行ID和take不需要合并。
+    """
+
+    def __init__(self, df, journal=None):
+        self.journal = journal
+        self.on_flush = None  # 追加缓冲合并到DataFrame后调用
+        self._buffer = None
+        self._set_frame(df)
+
+    @property
+    def df(self):
+        """工作表的DataFrame（先合并追加缓冲中的行）"""
+        if self._buffer is not None:
+            self.flush()
+        return self._df
+
+    @df.setter
+    def df(self, df):
+        self._df = df
+
+    @property
+    def columns(self):
+        return self._df.columns
+
+    @property
+    def pending(self):
+        """追加缓冲中尚未合并的行数"""
+        return 0 if self._buffer is None else self._buffer.count
+
+    def flush(self):
+        """把追加缓冲中的行一次合并到DataFrame"""
+        if self._buffer is None:
+            return
+        buffer, self._buffer = self._buffer, None
+        self._df = pd.concat([self._df, buffer.frame()])
+        if self.on_flush is not None:
+            self.on_flush()
+
+    def _set_frame(self, df):
+        if not (df.index.is_unique and pd.api.types.is_integer_dtype(df.index.dtype)):
+            df = df.reset_index(drop=True)
+        self._buffer = None
+        self.df = df
+        self.next_id = int(df.index.max()) + 1 if len(df) else 0
+        self.order = None      # 显示顺序（DataFrame行位置的排列），None为原始顺序
+        self.sort_spec = []    # 当前排序 [(列名, 是否升序)]，第一项优先
+        self.filters = {}      # 列名 -> RowFilter
+        self.mask = None       # 筛选结果（按行位置的布尔数组），None为不筛选
+        self._sort_keys = {}   # 列名 -> SortKey
+        self._indexes = {}     # 列名 -> ColumnIndex
+        self._view = None
+
+    @property
+    def view(self):
+        """按显示顺序排列的、通过筛选的DataFrame行位置"""
+        if self._view is None:
+            view = np.arange(len(self)) if self.order is None else self.order
+            if self.mask is not None:
+                view = view[self.mask[view]]
+            self._view = view
+        return self._view
+
+    def column_index(self, column):
+        """列的筛选索引，按需构建并缓存，单元格修改时增量更新"""
+        index = self._indexes.get(column)
+        if index is None:
+            index = self._indexes[column] = ColumnIndex(lambda: self.df[column])
+        return index
+
+    def set_filter(self, row_filter):
+        """设置（替换）一列的筛选条件，返回变更集"""
+        self.filters[row_filter.column] = row_filter
+        return self.apply_filters()
+
+    def remove_filter(self, column):
+        """取消一列的筛选条件，返回变更集"""
+        self.filters.pop(column, None)
+        return self.apply_filters()
+
+    def clear_filters(self):
+        """取消全部筛选条件，返回变更集"""
+        self.filters.clear()
+        return self.apply_filters()
+
+    def apply_filters(self):
+        """按当前条件重新计算筛选结果（各列条件同时满足），返回变更集"""
+        mask = None
+        with span("筛选", len(self), len(self.filters)):
+            for row_filter in self.filters.values():
+                column_mask = self.column_index(row_filter.column).match(row_filter)
+                mask = column_mask if mask is None else mask & column_mask
+        self.mask = mask
+        self._view = None
+        return ChangeSet(reordered=True)
+
+    def sort_key(self, column):
+        """列的排序键，按需计算并缓存，该列被修改时失效"""
+        key = self._sort_keys.get(column)
+        if key is None:
+            key = self._sort_keys[column] = SortKey(self.df[column])
+        return key
+
+    @property
+    def recording(self):
+        """修改是否需要记录到撤销记录中"""
+        return self.journal is not None and not self.journal.replaying
+
+    def sort(self, spec):
+        """按[(列名, 是否升序)]稳定排序显示顺序（不改动DataFrame），返回变更集"""
+        spec = list(spec)
+        old = (self.order, self.sort_spec)
+        if not spec:
+            order = None
+        elif len(spec) == 1:
+            column, ascending = spec[0]
+            key = self.sort_key(column)
+            order = key.ascending() if ascending else key.descending()
+        else:
+            # 多列排序：np.lexsort以最后一个键为主键，降序时名次取负，空值仍在最后
+            keys = [self.sort_key(column).ranks * (1 if ascending else -1) for column, ascending in reversed(spec)]
+            order = np.lexsort(keys)
+        if self.recording:
+            self.journal.record(OrderDelta(old, (order, spec)))
+        return self.set_order(order, spec)
+
+    def set_order(self, order, spec):
+        """直接设置显示顺序和对应的排序条件（用于撤销排序），返回变更集"""
+        self.order = order
+        self.sort_spec = list(spec)
+        self._view = None
+        return ChangeSet(reordered=True)
+
+    def __len__(self):
+        return len(self._df) + self.pending
+
+    def position(self, row_id):
+        """行ID对应的DataFrame行位置"""
+        if self._buffer is not None and row_id >= self._buffer.first_id:
+            return len(self._df) + int(row_id) - self._buffer.first_id
+        return self._df.index.get_loc(row_id)
+
+    def positions(self, row_ids):
+        """一组行ID对应的行位置数组，不存在的行ID为-1"""
+        positions = self._df.index.get_indexer(row_ids)
+        if self._buffer is not None:
+            row_ids = np.asarray(row_ids, dtype=np.int64)
+            offsets = row_ids - self._buffer.first_id
+            pending = (offsets >= 0) & (offsets < self._buffer.count)
+            positions[pending] = len(self._df) + offsets[pending]
+        return positions
+
+    def row_id(self, position):
+        """DataFrame行位置对应的行ID"""
+        return int(self.row_ids([position])[0])
+
+    def row_ids(self, positions):
+        """一组行位置对应的行ID数组"""
+        if self._buffer is None:
+            return self._df.index.to_numpy()[positions]
+        positions = np.asarray(positions, dtype=np.int64)
+        pending = positions >= len(self._df)
+        ids = np.empty(len(positions), dtype=np.int64)
+        ids[~pending] = self._df.index.to_numpy()[positions[~pending]]
+        ids[pending] = self._buffer.first_id + positions[pending] - len(self._df)
+        return ids
+
+    def take(self, positions):
+        """按行位置取出若干行（DataFrame），不合并追加缓冲"""
+        positions = np.asarray(positions, dtype=np.int64)
+        base = len(self._df)
+        pending = positions >= base
+        if self._buffer is None or not pending.any():
+            return self._df.iloc[positions]
+        rows = pd.concat([self._df.iloc[positions[~pending]], self._buffer.frame(positions[pending] - base)])
+        # 恢复positions的顺序
+        order = np.concatenate([np.flatnonzero(~pending), np.flatnonzero(pending)])
+        return rows.iloc[np.argsort(order, kind="stable")]
+
+    def allocate_ids(self, count):
+        """为新增的行分配行ID"""
+        ids = pd.RangeIndex(self.next_id, self.next_id + count)
+        self.next_id += count
+        return ids
+
+    def coerce_columns(self, values, allow_dtype_change):
+        """把各列的新值（Series或单个值）转换为列的类型，返回(转换后的values, 类型变化)
+
+        需要改变列类型时，allow_dtype_change为False则不做任何修改并抛出DtypeChangeError，否则先转换整列。
+        """
+        converted = {}
+        targets = {}
+        for column, value in values.items():
+            if column not in self.columns:
+                converted[column] = value
+                continue
+            old = self._df[column].dtype
+            coerce = coerce_series if isinstance(value, pd.Series) else coerce_value
+            converted[column], new = coerce(value, old)
+            if new != old:
+                if dtype_changed(old, new) and not allow_dtype_change:
+                    raise DtypeChangeError(column, old, new)
+                targets[column] = new
+
+        changes = {}
+        for column, new in targets.items():
+            old = self.df[column].dtype
+            if dtype_changed(old, new):
+                changes[column] = (old, new)
+            self.df[column] = self.df[column].astype(new)
+            self._indexes.pop(column, None)
+        return converted, changes
+
+    def append_rows(self, rows, allow_dtype_change=False):
+        """在末尾追加行（DataFrame），各列转换为已有列的类型，返回变更集
+
+        rows缺少的列为空；rows中已有行没有的列添加到最后，此时变更集要求重建视图。
+        不改变列和列类型的少量行放入追加缓冲，稍后一次合并。
+        """
+        added = [column for column in rows.columns if column not in self.columns]
+        if len(rows) == 1:
+            # 单条记录逐个值转换，不为每列构造Series
+            record = rows.to_dict("records")[0]
+            values = {column: record.get(column, np.nan) for column in [*self.columns, *added]}
+        else:
+            rows = rows.reindex(columns=[*self.columns, *added])
+            values = {column: rows[column] for column in rows.columns}
+        count = len(rows)
+        columns, dtype_changes = self.coerce_columns(values, allow_dtype_change)
+        start = len(self)
+        ids = self.allocate_ids(count)
+        if not added and not dtype_changes and 0 < count < APPEND_BUFFER_MIN_ROWS:
+            if self._buffer is None:
+                self._buffer = AppendBuffer(self._df.dtypes.to_dict(), ids[0])
+            self._buffer.extend({column: [value] if count == 1 else value.tolist()
+                                 for column, value in columns.items()}, count)
+            rows = None  # 撤销时再从缓冲或DataFrame中取出
+        else:
+            if count == 1:
+                dtypes = {column: self._df[column].dtype if column in self.columns else None for column in columns}
+                rows = frame_from_columns({column: [value] for column, value in columns.items()}, dtypes, ids)
+            else:
+                rows = pd.DataFrame(columns)
+                rows.index = ids
+            self.df = pd.concat([self.df, rows])
+        self._sort_keys.clear()
+        self._indexes.clear()
+        self._view = None
+        positions = np.arange(start, start + len(ids))
+        if self.order is not None:
+            # 新增的行显示在最后，直到再次排序
+            self.order = np.concatenate([self.order, positions])
+        if self.mask is not None:
+            # 新增的行总是显示，直到再次筛选
+            self.mask = np.concatenate([self.mask, np.ones(len(ids), dtype=bool)])
+        if self.recording:
+            self.journal.record(RowsDelta(rows, positions, True, dtype_changes, added, row_ids=ids))
+        if self.pending >= max(APPEND_BUFFER_MIN_ROWS, len(self._df) * APPEND_BUFFER_RATIO):
+            self.flush()
+        return ChangeSet(inserted=ids, dtype_changes=dtype_changes, reset=bool(added))
+
+    def restore_rows(self, rows, positions):
+        """把删除的行（索引为原来的行ID）放回DataFrame中的原位置（升序），返回变更集"""
+        added = [column for column in rows.columns if column not in self.df.columns]
+        total = len(self.df) + len(rows)
+        restored = np.zeros(total, dtype=bool)
+        restored[positions] = True
+        take = np.empty(total, dtype=np.int64)
+        take[~restored] = np.arange(len(self.df))
+        take[restored] = np.arange(len(self.df), total)
+        self.df = pd.concat([self.df, rows]).iloc[take]
+        self.next_id = max(self.next_id, int(rows.index.max()) + 1 if len(rows) else 0)
+        self._sort_keys.clear()
+        self._indexes.clear()
+        self._view = None
+        if self.mask is not None:
+            # 放回的行总是显示，直到再次筛选
+            mask = np.ones(total, dtype=bool)
+            mask[~restored] = self.mask
+            self.mask = mask
+        if self.order is not None:
+            # 已排序时按当前排序条件重新排序，放回的行回到排序后的位置
+            self.sort(self.sort_spec)
+        return ChangeSet(inserted=rows.index, reordered=True, reset=bool(added))
+
+    def delete_rows(self, row_ids):
+        """删除指定行，返回变更集"""
+        row_ids = list(row_ids)
+        positions = self.df.index.get_indexer(row_ids)
+        if self.recording:
+            positions = np.sort(positions)
+            self.journal.record(RowsDelta(self.df.iloc[positions], positions, False))
+        removed = np.zeros(len(self.df), dtype=bool)
+        removed[positions] = True
+        self.df = self.df.drop(index=row_ids)
+        self._sort_keys.clear()
+        self._indexes.clear()
+        self._view = None
+        if self.mask is not None:
+            self.mask = self.mask[~removed]
+        if self.order is not None:
+            # 去掉被删除的行位置，其余位置减去前面被删除的行数
+            kept = self.order[~removed[self.order]]
+            self.order = kept - np.cumsum(removed)[kept]
+        return ChangeSet(removed=row_ids)
+
+    def update_cells(self, row_id, values, allow_dtype_change=False):
+        """修改一行中的若干单元格（{列名: 值}），值转换为列的类型后写入，返回变更集"""
+        position = self.position(row_id)
+        old = {column: self.df.iat[position, self.df.columns.get_loc(column)] for column in values} \
+            if self.recording else None
+        converted, dtype_changes = self.coerce_columns(values, allow_dtype_change)
+        new = {}
+        for column, value in converted.items():
+            col_index = self.df.columns.get_loc(column)
+            self.df.iat[position, col_index] = value
+            new[column] = self.df.iat[position, col_index]
+            self._sort_keys.pop(column, None)
+            if column in self._indexes:
+                self._indexes[column].update(position)
+        if old is not None:
+            self.journal.record(CellDelta(row_id, old, new, dtype_changes))
+        return ChangeSet(updated={row_id: list(values)}, dtype_changes=dtype_changes)
+
+    def update_rows(self, values, allow_dtype_change=False):
+        """一次修改多行的若干单元格（索引为行ID、列为要修改的列的DataFrame），返回变更集"""
+        positions = self.positions(values.index)
+        columns = list(values.columns)
+        old = self.take(positions)[columns] if self.recording else None
+        converted, dtype_changes = self.coerce_columns({column: values[column] for column in columns},
+                                                       allow_dtype_change)
+        for column, series in converted.items():
+            self.df.iloc[positions, self.df.columns.get_loc(column)] = series.array
+            self._sort_keys.pop(column, None)
+            self._indexes.pop(column, None)
+        if old is not None:
+            self.journal.record(BlockDelta(old, pd.DataFrame(converted, index=values.index), dtype_changes))
+        return ChangeSet(updated=dict.fromkeys(values.index, columns), dtype_changes=dtype_changes)
+
+    def upsert(self, rows, keys, delete_missing=False, allow_dtype_change=False):
+        """按键列合并导入的记录（DataFrame），返回(变更集, UpsertResult)
+
+        导入记录的键在工作表中已存在时更新该记录（值都相同的记录不修改），否则追加到末尾；
+        delete_missing为True时删除导入的数据中没有的键的记录。键的查找使用哈希索引，
+        比较和写入按列向量化进行。整个合并作为一步记录到撤销记录中。
+        """
+        keys = list(keys)
+        if not keys:
+            raise ValueError("请选择键列")
+        missing = [key for key in keys if key not in self.columns or key not in rows.columns]
+        if missing:
+            raise ValueError(f"键列 {', '.join(map(str, missing))} 不在工作表或导入的数据中")
+        rows = rows.reset_index(drop=True)
+        # 先把导入的各列转换为工作表的列类型，键才能按值比较
+        converted, dtype_changes = self.coerce_columns(
+            {column: rows[column] for column in rows.columns if column in self.columns}, allow_dtype_change)
+        rows = pd.DataFrame({column: converted.get(column, rows[column]) for column in rows.columns})
+        existing = key_index(self.df, keys)
+        incoming = key_index(rows, keys)
+        if existing.has_duplicates:
+            raise ValueError(f"工作表中键列的值有{int(existing.duplicated().sum())}个重复，无法按键合并")
+        if incoming.has_duplicates:
+            raise ValueError(f"导入的数据中键列的值有{int(incoming.duplicated().sum())}个重复，无法按键合并")
+
+        positions = existing.get_indexer(incoming)
+        matched = positions >= 0
+        columns = [column for column in rows.columns if column in self.columns and column not in keys]
+        changed = np.zeros(int(matched.sum()), dtype=bool)
+        changed_columns = []
+        for column in columns:
+            differs = ~same_values(self.df[column].iloc[positions[matched]], rows[column][matched])
+            if differs.any():
+                changed |= differs
+                changed_columns.append(column)
+        updates = rows.loc[matched, changed_columns][changed]
+        updates.index = self.df.index[positions[matched][changed]]
+        deleted = self.df.index[~existing.isin(incoming)] if delete_missing else self.df.index[:0]
+
+        journal = self.journal
+        collector = DeltaCollector() if self.recording else None
+        if collector is not None:
+            self.journal = collector
+        try:
+            steps = []
+            if len(updates):
+                steps.append(self.update_rows(updates, allow_dtype_change))
+            if len(deleted):
+                steps.append(self.delete_rows(deleted))
+            if not matched.all():
+                steps.append(self.append_rows(rows[~matched], allow_dtype_change))
+        finally:
+            self.journal = journal
+        # 只改变了列类型（导入的值与已有的相同）时也要记录，撤销时转换回原类型
+        if collector is not None and (collector.deltas or dtype_changes):
+            self.journal.record(CompoundDelta(collector.deltas, "按键合并", dtype_changes))
+        changes = ChangeSet.combine(steps)
+        changes.dtype_changes = {**dtype_changes, **changes.dtype_changes}
+        result = UpsertResult(int((~matched).sum()), len(updates), int(matched.sum()) - len(updates), len(deleted))
+        return changes, result
+
+    def drop_columns(self, columns):
+        """删除列（用于撤销追加行时新增的列），返回需要重建视图的变更集"""
+        self.df = self.df.drop(columns=columns)
+        for column in columns:
+            self.filters.pop(column, None)
+            self._sort_keys.pop(column, None)
+            self._indexes.pop(column, None)
+        if any(column in columns for column, _ in self.sort_spec):
+            self.sort([(column, ascending) for column, ascending in self.sort_spec if column not in columns])
+        self.apply_filters()
+        return ChangeSet(reset=True)
+
+    def restore_dtypes(self, dtypes):
+        """把被改变类型的列（{列名: 原类型}）转换回原类型，无法无损转换的列保持不变，返回变更集"""
+        changes = {}
+        for column, dtype in dtypes.items():
+            old = self.df[column].dtype
+            try:
+                self.df[column] = self.df[column].astype(dtype)
+            except (TypeError, ValueError):
+                continue
+            if dtype_changed(old, self.df[column].dtype):
+                changes[column] = (old, self.df[column].dtype)
+            self._sort_keys.pop(column, None)
+            self._indexes.pop(column, None)
+        return ChangeSet(dtype_changes=changes)
+
+    def replace(self, df):
+        """整体替换数据，返回需要完全重建视图的变更集"""
+        old = self.df
+        self._set_frame(df)
+        if self.recording:
+            self.journal.record(FrameDelta(old, self.df))
+        return ChangeSet(reset=True)
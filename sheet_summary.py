@@ -0,0 +1,181 @@
+import pandas as pd
+
+from perf_trace import span
+
+# 汇总方式及其名称
+AGGREGATIONS = {"sum": "求和", "mean": "平均值", "count": "计数", "min": "最小值", "max": "最大值"}
+# 新增记录的汇总结果与已有结果合并的方式（平均值由求和与计数得出，不单独缓存）
+MERGE_FUNCTIONS = {"sum": "sum", "count": "sum", "min": "min", "max": "max"}
+# 列统计的项目
+STAT_NAMES = ("非空", "空值", "唯一值", "求和", "平均值", "最小值", "最大值")
+
+
+def is_numeric(series):
+    return pd.api.types.is_numeric_dtype(series.dtype)
+
+
+def column_stats(series):
+    """一列的统计：非空数、空值数、唯一值数，数值列的求和、平均值、最小值和最大值，日期列的最小值和最大值"""
+    count = int(series.count())
+    stats = {"非空": count, "空值": len(series) - count, "唯一值": int(series.nunique())}
+    if is_numeric(series):
+        stats.update({"求和": series.sum(), "平均值": series.mean(), "最小值": series.min(), "最大值": series.max()})
+    elif pd.api.types.is_datetime64_any_dtype(series.dtype):
+        stats.update({"最小值": series.min(), "最大值": series.max()})
+    return stats
+
+
+def group_sizes(df, group_by):
+    """各分组的记录数，以分组值为索引（空值作为一个分组）"""
+    return df.groupby(list(group_by), dropna=False, observed=True, sort=False).size()
+
+
+def group_aggregate(df, group_by, value, how):
+    """按分组列对汇总列做一次向量化汇总，返回以分组值为索引的Series（不排序）"""
+    if how in ("sum", "mean") and not is_numeric(df[value]):
+        raise ValueError(f"列 '{value}' 不是数值列，不能{AGGREGATIONS[how]}")
+    return df.groupby(list(group_by), dropna=False, observed=True, sort=False)[value].agg(how)
+
+
+def merge_aggregates(old, new, how):
+    """合并两部分记录的同一汇总结果（用于新增记录）"""
+    merged = pd.concat([old, new])
+    return merged.groupby(level=list(range(merged.index.nlevels)), dropna=False, sort=False).agg(how)
+
+
+class SheetSummary:
+    """一个工作表的汇总结果缓存：各列的统计和数据透视（分组列 x 汇总列 x 汇总方式）
+
+    结果按需计算后缓存；数据修改后由apply按变更集只更新受影响的结果：修改单元格只丢弃
+    涉及这些列的结果；新增的记录先暂存，到下次使用结果或其他修改前一次汇总，再与已有的求和、
+    计数、最小值和最大值合并；删除记录时从求和与计数中减去被删除记录的汇总。
+    平均值总是由缓存的求和与计数得出。
+    """
+
+    def __init__(self):
+        self.stats = {}      # 列名 -> 统计结果（dict）
+        self.pivots = {}     # (分组列元组, 汇总列, 汇总方式) -> Series
+        self.sizes = {}      # 分组列元组 -> 各分组的记录数，用于去掉记录全部被删除的分组
+        self.appended = []   # 尚未合并到数据透视结果的新增记录的行ID（pd.Index列表）
+        self.frame = None    # 缓存对应的DataFrame的弱引用
+
+    @staticmethod
+    def parts(how):
+        """汇总方式需要缓存的基本汇总"""
+        return ("sum", "count") if how == "mean" else (how,)
+
+    def is_cached(self, columns=(), group_by=(), value=None, how=None):
+        """所需的列统计和数据透视结果是否都已缓存"""
+        if any(column not in self.stats for column in columns):
+            return False
+        return not group_by or all((tuple(group_by), value, part) in self.pivots for part in self.parts(how))
+
+    def column_stats(self, df, columns=None):
+        """各列的统计表（行为列名，列为统计项目），只计算未缓存的列"""
+        columns = list(df.columns if columns is None else columns)
+        missing = [column for column in columns if column not in self.stats]
+        if missing:
+            with span("列统计", len(df), len(missing)):
+                for column in missing:
+                    self.stats[column] = column_stats(df[column])
+        table = pd.DataFrame([self.stats[column] for column in columns], index=columns, columns=list(STAT_NAMES))
+        table.index.name = "列"
+        return table
+
+    def pivot(self, df, group_by, value, how):
+        """数据透视结果（DataFrame：分组列和“汇总列(汇总方式)”，按分组值排序），只计算未缓存的基本汇总"""
+        group_by = tuple(group_by)
+        if not group_by:
+            raise ValueError("请选择分组列")
+        if value in group_by:
+            raise ValueError(f"汇总列 '{value}' 不能同时是分组列")
+        # 先合并暂存的新增记录，之后新计算的结果已包含这些记录
+        self.merge_appended(df)
+        results = {}
+        for part in self.parts(how):
+            key = (group_by, value, part)
+            if key not in self.pivots:
+                with span("数据透视", len(df), len(group_by) + 1, how=part):
+                    self.pivots[key] = group_aggregate(df, group_by, value, part)
+                    if group_by not in self.sizes:
+                        self.sizes[group_by] = group_sizes(df, group_by)
+            results[part] = self.pivots[key]
+        result = results["sum"] / results["count"] if how == "mean" else results[how]
+        try:
+            result = result.sort_index()
+        except TypeError:  # 分组值的类型混杂，无法排序
+            pass
+        return result.rename(f"{value}({AGGREGATIONS[how]})").reset_index()
+
+    def apply(self, changes, removed=None):
+        """按变更集更新缓存；removed为被删除的记录（为None时若需要则丢弃全部数据透视结果）"""
+        if changes.reset:
+            self.clear()
+            return
+        columns = changes.columns | set(changes.dtype_changes)
+        for column in columns:
+            self.stats.pop(column, None)
+        # 修改的列不影响其余结果，暂存的新增记录以后再取出也不影响其余结果的合并
+        self._drop(lambda group_by, value: columns & {*group_by, value})
+        if not (changes.inserted or changes.removed):
+            return
+        self.stats.clear()
+        if changes.removed:
+            # 尚未合并的新增记录被删除时直接去掉，其余被删除的记录从结果中减去
+            removed_ids = pd.Index(changes.removed)
+            if self.appended:
+                appended = self.appended[0].append(self.appended[1:])
+                pending = appended.isin(removed_ids)
+                self.appended = [appended[~pending]]
+                removed_ids = removed_ids.difference(appended[pending])
+            if self.pivots and len(removed_ids):
+                if removed is None:
+                    self.pivots.clear()
+                    self.sizes.clear()
+                else:
+                    self._update_pivots(removed.loc[removed.index.isin(removed_ids)], subtract=True)
+        if changes.inserted and self.sizes:
+            # 新增记录（如逐条新增）暂存行ID，下次使用结果时一次合并
+            self.appended.append(pd.Index(changes.inserted))
+
+    def merge_appended(self, df):
+        """把暂存的新增记录一次合并到数据透视结果"""
+        ids = self.appended[0].append(self.appended[1:]) if self.appended else None
+        self.appended = []
+        if ids is not None and len(ids):
+            self._update_pivots(df.loc[ids], subtract=False)
+
+    def _update_pivots(self, rows, subtract):
+        """新增记录时合并所有基本汇总；删除记录时减去求和与计数（最小值和最大值丢弃），去掉已经没有记录的分组"""
+        for group_by, sizes in list(self.sizes.items()):
+            delta = group_sizes(rows, group_by)
+            if subtract:
+                sizes = sizes.sub(delta, fill_value=0).astype(sizes.dtype)
+                empty = sizes.index[sizes.eq(0)]
+                sizes = sizes.drop(index=empty)
+            else:
+                sizes = merge_aggregates(sizes, delta, "sum")
+            self.sizes[group_by] = sizes
+            for key in [key for key in self.pivots if key[0] == group_by]:
+                old, how = self.pivots[key], key[2]
+                if subtract and how in ("min", "max"):
+                    del self.pivots[key]
+                    continue
+                delta = group_aggregate(rows, group_by, key[1], how)
+                if subtract:
+                    self.pivots[key] = old.sub(delta, fill_value=0).astype(old.dtype).drop(index=empty)
+                else:
+                    self.pivots[key] = merge_aggregates(old, delta, MERGE_FUNCTIONS[how])
+
+    def _drop(self, affected):
+        """丢弃affected(分组列元组, 汇总列)为真的数据透视结果"""
+        for key in [key for key in self.pivots if affected(key[0], key[1])]:
+            del self.pivots[key]
+        for group_by in [group_by for group_by in self.sizes if affected(group_by, None)]:
+            del self.sizes[group_by]
+
+    def clear(self):
+        self.stats.clear()
+        self.pivots.clear()
+        self.sizes.clear()
+        self.appended = []
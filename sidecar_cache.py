@@ -0,0 +1,201 @@
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+# 磁盘缓存默认目录和大小上限（字节）
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".excel_manager", "cache")
+DEFAULT_CACHE_LIMIT = 2 * 1024 * 1024 * 1024
+# 计算文件内容哈希时的读取块大小
+HASH_BLOCK_SIZE = 4 * 1024 * 1024
+# 缓存格式版本，格式变化时旧缓存自动失效
+CACHE_VERSION = 2
+# 记录各文件大小、修改时间和内容哈希的索引文件，文件未改变时不重新计算哈希
+DIGEST_INDEX = "digests.pkl"
+
+
+def file_digest(file_path):
+    """计算文件内容的哈希值"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def directory_size(path):
+    """统计目录下所有文件的大小（字节）"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class SidecarCache:
+    """工作表的磁盘列式缓存，避免重复打开同一工作簿时重新解析XML
+
+    每个工作表按列保存：NumPy数值/布尔/日期列保存为.npy并以内存映射方式加载，
+    其余列（字符串、混合类型）保存为pickle。缓存以格式版本、读取引擎、文件路径、大小、修改时间
+    和内容哈希为键，超过大小上限时按最近使用时间淘汰。
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, size_limit=DEFAULT_CACHE_LIMIT):
+        self.cache_dir = cache_dir
+        self.size_limit = size_limit
+        self.digests = None  # 文件路径 -> ((大小, 修改时间), 内容哈希)，首次使用时从索引文件读取
+        self._lock = threading.Lock()
+
+    def workbook_key(self, file_path, engine):
+        """根据格式版本、读取引擎名、文件路径、大小、修改时间和内容哈希生成缓存键"""
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        digest = self.file_digest(path, (stat.st_size, stat.st_mtime_ns))
+        identity = f"{CACHE_VERSION}|{engine}|{path}|{stat.st_size}|{stat.st_mtime_ns}|{digest}"
+        return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+    def file_digest(self, path, stamp):
+        """文件内容哈希；大小和修改时间与索引中记录的相同时直接使用记录的哈希，不重新读取文件"""
+        with self._lock:
+            if self.digests is None:
+                self.digests = self._load_digests()
+            entry = self.digests.get(path)
+            if entry is not None and entry[0] == stamp:
+                return entry[1]
+            digest = file_digest(path)
+            self.digests[path] = (stamp, digest)
+            self._save_digests()
+            return digest
+
+    def _load_digests(self):
+        try:
+            with open(os.path.join(self.cache_dir, DIGEST_INDEX), "rb") as f:
+                digests = pickle.load(f)
+            return digests if isinstance(digests, dict) else {}
+        except Exception:
+            return {}
+
+    def _save_digests(self):
+        """写入哈希索引（去掉已不存在的文件）；写入失败时只是下次重新计算哈希"""
+        self.digests = {path: entry for path, entry in self.digests.items() if os.path.exists(path)}
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=self.cache_dir)
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(self.digests, f)
+            os.replace(tmp_path, os.path.join(self.cache_dir, DIGEST_INDEX))
+        except OSError:
+            pass
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _sheet_dir(self, key, sheet):
+        name = hashlib.sha1(str(sheet).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self._entry_dir(key), name)
+
+    def load(self, key, sheet):
+        """从缓存加载工作表，未命中或缓存损坏时返回None"""
+        sheet_dir = self._sheet_dir(key, sheet)
+        meta_path = os.path.join(sheet_dir, "meta.pkl")
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, "rb") as f:
+                meta = pickle.load(f)
+            if meta["sheet"] != sheet:
+                return None
+            data = {}
+            for i, kind in enumerate(meta["kinds"]):
+                if kind == "npy":
+                    # 写时复制的内存映射，编辑单元格不会改动缓存文件
+                    values = np.load(os.path.join(sheet_dir, f"c{i}.npy"), mmap_mode="c").view(np.ndarray)
+                else:
+                    values = pd.read_pickle(os.path.join(sheet_dir, f"c{i}.pkl"))
+                if len(values) != meta["rows"]:
+                    raise ValueError("缓存行数不一致")
+                data[i] = values
+            df = pd.DataFrame(data, index=pd.RangeIndex(meta["rows"]), copy=False)
+            df.columns = meta["columns"]
+        except Exception:
+            # 缓存损坏或格式不符，删除后按普通方式解析
+            shutil.rmtree(sheet_dir, ignore_errors=True)
+            return None
+        self._touch(key)
+        return df
+
+    def store(self, key, sheet, df):
+        """把解析得到的工作表写入缓存"""
+        sheet_dir = self._sheet_dir(key, sheet)
+        if os.path.exists(sheet_dir):
+            return
+        entry_dir = self._entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=entry_dir)
+        try:
+            kinds = []
+            for i in range(df.shape[1]):
+                column = df.iloc[:, i]
+                if isinstance(column.dtype, np.dtype) and column.dtype.kind in "iufbM":
+                    np.save(os.path.join(tmp_dir, f"c{i}.npy"), column.to_numpy())
+                    kinds.append("npy")
+                else:
+                    column.reset_index(drop=True).to_pickle(os.path.join(tmp_dir, f"c{i}.pkl"))
+                    kinds.append("pkl")
+            meta = {"sheet": sheet, "columns": df.columns, "kinds": kinds, "rows": len(df)}
+            with open(os.path.join(tmp_dir, "meta.pkl"), "wb") as f:
+                pickle.dump(meta, f)
+            os.replace(tmp_dir, sheet_dir)
+        except Exception:
+            # 缓存只是加速手段，写入失败（磁盘已满、无法序列化的值等）时放弃即可
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        self._touch(key)
+        self.evict(keep=key)
+
+    def _touch(self, key):
+        """记录缓存项的最近使用时间"""
+        try:
+            os.utime(self._entry_dir(key), None)
+        except OSError:
+            pass
+
+    def entries(self):
+        """返回[(最近使用时间, 缓存键, 大小)]"""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        result = []
+        for key in os.listdir(self.cache_dir):
+            path = self._entry_dir(key)
+            if os.path.isdir(path):
+                result.append((os.path.getmtime(path), key, directory_size(path)))
+        return result
+
+    def total_size(self):
+        """缓存占用的磁盘空间（字节）"""
+        return sum(size for _, _, size in self.entries())
+
+    def evict(self, keep=None):
+        """按最近使用时间淘汰缓存项，直到总大小不超过上限"""
+        entries = sorted(self.entries())
+        total = sum(size for _, _, size in entries)
+        for _, key, size in entries:
+            if total <= self.size_limit:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """删除全部缓存"""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self.digests = None
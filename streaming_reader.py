@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from pandas._libs import lib, ops as libops, parsers as libparsers
+from pandas._libs.parsers import STR_NA_VALUES
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+
+# 流式加载时每批读取的行数
+STREAM_CHUNK_ROWS = 5000
+# 第一批读取的行数，较小以便尽快显示第一屏
+FIRST_CHUNK_ROWS = 200
+# 未知工作表尺寸时列缓冲区的初始容量
+INITIAL_CAPACITY = 1024
+
+
+def convert_cell(cell):
+    """按pandas openpyxl读取器的规则转换单元格的值"""
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        if value == cell.value:
+            return value
+        return float(cell.value)
+    return cell.value
+
+
+def infer_column(values):
+    """按pandas文本解析器（read_excel使用）的规则转换一列的值（对象数组），不修改传入的数组
+
+    能转换为数值或布尔时转换，否则保留对象，并把空字符串、"NA"等空值标记替换为NaN。
+    """
+    try:
+        result = lib.maybe_convert_numeric(values, STR_NA_VALUES, False)[0]
+    except (ValueError, TypeError):
+        values = values.copy()
+        libparsers.sanitize_objects(values, STR_NA_VALUES)
+        result = values
+    # 与解析器一致，布尔转换针对原始的值而不是数值转换的结果
+    if result.dtype == object and (len(result) == 0 or not isinstance(result[0], int)):
+        result = libops.maybe_convert_bool(values, true_values=None, false_values=None)[0]
+    return result
+
+
+class ColumnarBuffer:
+    """按列存放已读取行的缓冲区，按工作表尺寸预分配，容量不足时倍增"""
+
+    def __init__(self, capacity=None, width=0):
+        self.capacity = max(capacity or INITIAL_CAPACITY, 1)
+        self.columns = [self._new_column() for _ in range(width)]
+        self.rows = 0               # 已写入的行数（含表头行）
+        self.last_row_with_data = -1
+        self.width = 0              # 有数据的最大列数
+
+    def _new_column(self):
+        column = np.empty(self.capacity, dtype=object)
+        column[:] = ""
+        return column
+
+    def _grow(self, capacity):
+        for i, column in enumerate(self.columns):
+            grown = np.empty(capacity, dtype=object)
+            grown[:self.capacity] = column
+            grown[self.capacity:] = ""
+            self.columns[i] = grown
+        self.capacity = capacity
+
+    def append(self, rows):
+        """追加一批已转换的行"""
+        needed = self.rows + len(rows)
+        if needed > self.capacity:
+            self._grow(max(needed, self.capacity * 2))
+        for offset, row in enumerate(rows):
+            # 去掉行尾的空单元格
+            length = len(row)
+            while length and row[length - 1] == "":
+                length -= 1
+            if not length:
+                continue
+            while len(self.columns) < length:
+                self.columns.append(self._new_column())
+            row_number = self.rows + offset
+            for i in range(length):
+                self.columns[i][row_number] = row[i]
+            self.last_row_with_data = row_number
+            self.width = max(self.width, length)
+        self.rows = needed
+
+    def preview(self):
+        """用已读取的行构造预览DataFrame（首行作为列名，值为原始对象）"""
+        stop = self.last_row_with_data + 1
+        if stop < 1:
+            return pd.DataFrame()
+        header = [str(self.columns[i][0]) for i in range(self.width)]
+        data = {i: self.columns[i][1:stop] for i in range(self.width)}
+        df = pd.DataFrame(data, copy=False)
+        df.columns = header
+        return df
+
+    def to_frame(self):
+        """构造最终的DataFrame，与pd.read_excel的解析结果一致
+
+        列名由表头行按解析器的规则生成（空列名、重复列名），各列直接从列数组转换类型，
+        不再按行重新组织数据。
+        """
+        stop = self.last_row_with_data + 1
+        if stop < 1:
+            return pd.DataFrame()
+        header = [self.columns[i][0] for i in range(self.width)]
+        try:
+            empty = TextParser([header], header=0, skip_blank_lines=False).read()
+        except EmptyDataError:
+            return pd.DataFrame()
+        if stop == 1:
+            return empty
+        data = {i: infer_column(self.columns[i][1:stop]) for i in range(self.width)}
+        df = pd.DataFrame(data, index=pd.RangeIndex(stop - 1), copy=False)
+        df.columns = empty.columns
+        return df
+
+
+def stream_sheet(worksheet, on_chunk=None, chunk_rows=STREAM_CHUNK_ROWS, first_chunk_rows=FIRST_CHUNK_ROWS):
+    """按批读取只读模式的openpyxl工作表，返回DataFrame
+
+    on_chunk(buffer, total_rows)在每批读取后调用，total_rows为按工作表尺寸估计的总行数（未知时为None）。
+    """
+    total_rows = worksheet.max_row
+    width = worksheet.max_column or 0
+    # 与pandas一致，按实际数据读取而不信任工作表记录的尺寸
+    worksheet.reset_dimensions()
+    buffer = ColumnarBuffer(total_rows, width)
+
+    chunk = []
+    limit = first_chunk_rows
+    for row in worksheet.rows:
+        chunk.append([convert_cell(cell) for cell in row])
+        if len(chunk) >= limit:
+            buffer.append(chunk)
+            chunk = []
+            limit = chunk_rows
+            if on_chunk is not None:
+                on_chunk(buffer, total_rows)
+    if chunk:
+        buffer.append(chunk)
+        if on_chunk is not None:
+            on_chunk(buffer, total_rows)
+    return buffer.to_frame()
@@ -0,0 +1,252 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from perf_trace import span
+
+# 列的数据类型
+TYPE_INTEGER = "integer"
+TYPE_NUMBER = "number"
+TYPE_DATETIME = "datetime"
+TYPE_BOOL = "bool"
+TYPE_TEXT = "text"
+TYPE_NAMES = {TYPE_INTEGER: "整数", TYPE_NUMBER: "数字", TYPE_DATETIME: "日期时间",
+              TYPE_BOOL: "布尔值", TYPE_TEXT: "文本"}
+# 可识别的布尔值文本（小写）
+TRUE_VALUES = frozenset(["true", "1", "yes", "y", "是"])
+FALSE_VALUES = frozenset(["false", "0", "no", "n", "否"])
+# 校验报告摘要中列出的问题数
+REPORT_SUMMARY_LIMIT = 20
+
+
+def infer_type(dtype):
+    """根据列的dtype推断数据类型"""
+    if pd.api.types.is_bool_dtype(dtype):
+        return TYPE_BOOL
+    if pd.api.types.is_integer_dtype(dtype):
+        return TYPE_INTEGER
+    if pd.api.types.is_float_dtype(dtype):
+        return TYPE_NUMBER
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return TYPE_DATETIME
+    return TYPE_TEXT
+
+
+def is_empty(value):
+    """值是否为空（None、NaN或空白字符串）"""
+    if isinstance(value, str):
+        return not value.strip()
+    return value is None or (pd.api.types.is_scalar(value) and pd.isna(value))
+
+
+def parse_bound(kind, text):
+    """解析范围边界，空字符串表示不限"""
+    if text is None or str(text).strip() == "":
+        return None
+    if kind == TYPE_DATETIME:
+        return pd.Timestamp(str(text).strip())
+    return float(text)
+
+
+def format_bound(value):
+    """范围边界的显示文本"""
+    if isinstance(value, float):
+        return f"{value:g}"
+    return str(value)
+
+
+class ColumnRule:
+    """一列的校验规则：类型、是否允许为空、取值范围、正则表达式和允许值，创建时编译"""
+
+    def __init__(self, column, kind=TYPE_TEXT, nullable=True, minimum=None, maximum=None, pattern="", allowed=()):
+        self.column = column
+        self.kind = kind
+        self.nullable = nullable
+        try:
+            self.minimum = parse_bound(kind, minimum)
+            self.maximum = parse_bound(kind, maximum)
+        except ValueError:
+            raise ValueError(f"列 '{column}' 的取值范围无效")
+        try:
+            self.pattern = re.compile(pattern) if pattern else None
+        except re.error as e:
+            raise ValueError(f"列 '{column}' 的正则表达式无效: {e}")
+        self.allowed = frozenset(str(value) for value in allowed)
+
+    def convert(self, value):
+        """把单个非空值转换为规则类型的值，无法转换时抛出ValueError"""
+        if self.kind in (TYPE_INTEGER, TYPE_NUMBER):
+            if isinstance(value, (bool, np.bool_)):
+                raise ValueError("应为数字")
+            number = float(value)
+            if self.kind == TYPE_INTEGER and not number.is_integer():
+                raise ValueError("应为整数")
+            return number
+        if self.kind == TYPE_DATETIME:
+            timestamp = pd.Timestamp(value)
+            if pd.isna(timestamp):
+                raise ValueError("应为日期时间")
+            return timestamp
+        if self.kind == TYPE_BOOL:
+            if isinstance(value, (bool, np.bool_)):
+                return bool(value)
+            text = str(value).strip().lower()
+            if text in TRUE_VALUES:
+                return True
+            if text in FALSE_VALUES:
+                return False
+            raise ValueError("应为布尔值")
+        return value
+
+    def check(self, value):
+        """校验单个值，返回问题描述，没有问题时返回None"""
+        if is_empty(value):
+            return None if self.nullable else "不能为空"
+        try:
+            converted = self.convert(value)
+        except (TypeError, ValueError, OverflowError):
+            return f"应为{TYPE_NAMES[self.kind]}"
+        if self.minimum is not None and converted < self.minimum:
+            return f"不能小于{format_bound(self.minimum)}"
+        if self.maximum is not None and converted > self.maximum:
+            return f"不能大于{format_bound(self.maximum)}"
+        if self.pattern is not None and not self.pattern.fullmatch(str(value)):
+            return f"不符合格式 {self.pattern.pattern}"
+        if self.allowed and str(value) not in self.allowed:
+            return "不在允许的取值中"
+        return None
+
+    def validate(self, series):
+        """向量化校验整列，返回[(问题描述, 布尔掩码)]"""
+        problems = []
+        null = series.isna().to_numpy()
+        text = None
+        if not (pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_datetime64_any_dtype(series.dtype)):
+            text = series.astype(str)
+            null = null | (text.str.strip() == "").to_numpy()
+        if not self.nullable:
+            problems.append(("不能为空", null))
+        valid = ~null
+
+        converted = None
+        if self.kind in (TYPE_INTEGER, TYPE_NUMBER):
+            if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+                converted = series.astype(float)
+            else:
+                converted = pd.to_numeric(series.where(~null), errors="coerce")
+            bad = valid & converted.isna().to_numpy()
+            problems.append((f"应为{TYPE_NAMES[self.kind]}", bad))
+            if self.kind == TYPE_INTEGER:
+                fraction = (converted % 1 != 0).to_numpy() & converted.notna().to_numpy()
+                problems.append(("应为整数", valid & ~bad & fraction))
+        elif self.kind == TYPE_DATETIME:
+            if pd.api.types.is_datetime64_any_dtype(series.dtype):
+                converted = series
+            else:
+                converted = pd.to_datetime(series.where(~null), errors="coerce", format="mixed")
+            problems.append((f"应为{TYPE_NAMES[TYPE_DATETIME]}", valid & converted.isna().to_numpy()))
+        elif self.kind == TYPE_BOOL and not pd.api.types.is_bool_dtype(series.dtype):
+            lower = (text if text is not None else series.astype(str)).str.strip().str.lower()
+            known = lower.isin(TRUE_VALUES | FALSE_VALUES).to_numpy()
+            problems.append((f"应为{TYPE_NAMES[TYPE_BOOL]}", valid & ~known))
+
+        if converted is not None:
+            comparable = converted.notna().to_numpy()
+            if self.minimum is not None:
+                problems.append((f"不能小于{format_bound(self.minimum)}", valid & comparable & (converted < self.minimum).to_numpy()))
+            if self.maximum is not None:
+                problems.append((f"不能大于{format_bound(self.maximum)}", valid & comparable & (converted > self.maximum).to_numpy()))
+        if self.pattern is not None or self.allowed:
+            if text is None:
+                text = series.astype(str)
+            if self.pattern is not None:
+                matched = text.str.fullmatch(self.pattern).fillna(False).to_numpy(dtype=bool)
+                problems.append((f"不符合格式 {self.pattern.pattern}", valid & ~matched))
+            if self.allowed:
+                problems.append(("不在允许的取值中", valid & ~text.isin(self.allowed).to_numpy()))
+        return [(message, mask) for message, mask in problems if mask.any()]
+
+
+class ValidationReport:
+    """批量校验的结果：按列和问题记录出错的行位置"""
+
+    def __init__(self):
+        self.problems = []  # [(列名, 问题描述, 行位置数组, 值数组)]
+
+    def add(self, column, message, positions, values):
+        self.problems.append((column, message, positions, values))
+
+    @property
+    def error_count(self):
+        """出错的单元格数"""
+        return sum(len(positions) for _, _, positions, _ in self.problems)
+
+    @property
+    def ok(self):
+        return not self.problems
+
+    def to_frame(self):
+        """逐个单元格的问题列表（按行位置排序）"""
+        if not self.problems:
+            return pd.DataFrame(columns=["行", "列", "值", "问题"])
+        frames = [pd.DataFrame({"行": positions, "列": column, "值": values, "问题": message})
+                  for column, message, positions, values in self.problems]
+        return pd.concat(frames, ignore_index=True).sort_values("行", kind="stable", ignore_index=True)
+
+    def summary(self, limit=REPORT_SUMMARY_LIMIT):
+        """问题摘要文本，只列出前limit个单元格"""
+        report = self.to_frame().head(limit)
+        lines = [f"第{row + 1}条记录，列 '{column}'：“{'' if is_empty(value) else value}” {message}"
+                 for row, column, value, message in report.itertuples(index=False)]
+        if self.error_count > limit:
+            lines.append(f"……共{self.error_count}个问题")
+        return "\n".join(lines)
+
+
+class Schema:
+    """工作表的校验规则集合，每列一条ColumnRule
+
+    单个值用check校验；整个DataFrame（如导入的数据）用validate一次向量化校验。
+    """
+
+    def __init__(self, rules=()):
+        self.rules = {rule.column: rule for rule in rules}
+
+    @classmethod
+    def infer(cls, df, previous=None):
+        """按DataFrame各列的dtype生成规则；previous中同名列的规则保留"""
+        rules = []
+        for column in df.columns:
+            if previous is not None and column in previous.rules:
+                rules.append(previous.rules[column])
+            else:
+                rules.append(ColumnRule(column, infer_type(df[column].dtype)))
+        return cls(rules)
+
+    @property
+    def columns(self):
+        return list(self.rules)
+
+    def set_rule(self, rule):
+        self.rules[rule.column] = rule
+
+    def check(self, column, value):
+        """校验单个值，返回问题描述，没有问题时返回None"""
+        rule = self.rules.get(column)
+        return None if rule is None else rule.check(value)
+
+    def validate(self, df, columns=None):
+        """向量化校验DataFrame的各列，返回ValidationReport"""
+        report = ValidationReport()
+        columns = list(columns if columns is not None else df.columns)
+        with span("校验", len(df), len(columns)):
+            for column in columns:
+                rule = self.rules.get(column)
+                if rule is None:
+                    continue
+                series = df[column]
+                for message, mask in rule.validate(series):
+                    positions = np.flatnonzero(mask)
+                    report.add(column, message, positions, series.to_numpy()[positions])
+        return report
@@ -0,0 +1,382 @@
+import io
+import os
+import weakref
+
+import pandas as pd
+
+from edit_journal import EditJournal
+from io_backends import SINGLE_SHEET_EXTENSIONS, LazyFrames, SheetRows, extension, write_frames
+from multi_import import ALIGN_UNION, align_frames, read_sources, source_name
+from perf_trace import span
+from sheet_model import ChangeSet, SheetModel
+from sheet_summary import SheetSummary
+from validation import Schema
+from workbook_session import DEFAULT_MEMORY_BUDGET, WorkbookSession
+from xlsx_package import atomic_write
+
+# 没有打开工作簿时导入为新工作表所用的工作表名
+DEFAULT_SHEET_NAME = "Sheet1"
+
+
+def parse_records(text, columns, sep="\t"):
+    """把分隔文本（如从Excel复制的单元格区域）解析为要新增的记录（值为字符串的DataFrame）
+
+    首行的值都是工作表的列名时作为表头按列名对应，否则各列按位置对应工作表的前几列。
+    """
+    rows = pd.read_csv(io.StringIO(text), sep=sep, header=None, dtype=str, keep_default_na=False)
+    names = [str(column) for column in columns]
+    header = [value.strip() for value in rows.iloc[0]] if len(rows) else []
+    if header and all(name in names for name in header):
+        rows = rows.iloc[1:]
+        rows.columns = [columns[names.index(name)] for name in header]
+    elif rows.shape[1] > len(columns):
+        raise ValueError(f"数据有{rows.shape[1]}列，工作表只有{len(columns)}列")
+    else:
+        rows.columns = list(columns[:rows.shape[1]])
+    return rows.reset_index(drop=True)
+
+
+class WorkbookEngine:
+    """不依赖界面的工作簿操作：打开、加载工作表、增删改记录、导入合并、排序、校验、保存和导出
+
+    ExcelManager和命令行工具都通过它操作数据。修改数据的方法返回ChangeSet，并记录工作表有
+    未保存的修改。open_session、load、read_imports、reload_changed、save和export不改变当前
+    工作表，可以在后台线程中执行；其余方法只在主线程中调用。
+    """
+
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, sidecar=None, compact=False):
+        self.memory_budget = memory_budget
+        self.sidecar = sidecar    # 磁盘列式缓存（SidecarCache），None为不使用
+        self.compact = compact    # 是否紧凑加载
+        self.session = None       # 工作簿会话，缓存已解析的工作表
+        self.file_path = ""
+        self.current_sheet = ""
+        self.model = None         # 当前工作表的数据模型（SheetModel）
+        self.schemas = {}         # 工作表名 -> 校验规则（Schema）
+        self.journals = {}        # 工作表名 -> 撤销记录（EditJournal）
+        self.summaries = {}       # 工作表名 -> 汇总结果缓存（SheetSummary）
+
+    @property
+    def df(self):
+        """当前工作表的DataFrame"""
+        return None if self.model is None else self.model.df
+
+    @property
+    def sheets(self):
+        return [] if self.session is None else self.session.sheet_names
+
+    def sheet_sizes(self):
+        """{工作表名: (记录数, 列数)}，未加载的工作表为清单中记录的大小，未知时为None"""
+        sizes = {sheet: self.session.sheet_size(sheet) for sheet in self.sheets}
+        if self.model is not None and self.current_sheet in sizes:
+            sizes[self.current_sheet] = (len(self.model), len(self.model.columns))
+        return sizes
+
+    def open_session(self, file_path):
+        """打开工作簿会话（只读取工作表列表和大小），不改变引擎状态"""
+        with span("打开文件", file=os.path.basename(file_path)) as record:
+            session = WorkbookSession(file_path, self.memory_budget, sidecar=self.sidecar, compact=self.compact)
+            record.detail["sheets"] = len(session.sheet_names)
+            record.detail["engine"] = "xlsx清单" if session.dimensions is not None else session.engine
+        return session
+
+    def attach(self, session):
+        """切换到已打开的工作簿会话，清空上一个文件的数据"""
+        if self.session is not None:
+            self.session.close()
+        self.session = session
+        self.file_path = session.file_path
+        self.current_sheet = ""
+        self.model = None
+        self.schemas = {}
+        self.journals = {}
+        self.summaries = {}
+
+    def open(self, file_path):
+        """打开工作簿，返回工作表名列表"""
+        self.attach(self.open_session(file_path))
+        return self.sheets
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+    def detect_changes(self):
+        """文件被其他程序修改时返回SheetChanges（conflicts为有未保存修改的受影响工作表），否则返回None"""
+        if self.session is None:
+            return None
+        changes = self.session.detect_changes()
+        if changes is not None:
+            dirty = set(self.session.dirty)
+            if self.model is not None and self.model.pending:
+                dirty.add(self.current_sheet)
+            changes.conflicts = dirty & changes.affected
+        return changes
+
+    def reload_changed(self, changes, discard=False):
+        """按外部修改更新缓存，返回内容确实有变化的已加载工作表集合，不改变当前工作表
+
+        discard为True时放弃有冲突的工作表的未保存修改，否则保留这些修改（保存时覆盖外部修改）。
+        当前工作表也会重新解析并与显示的数据比较，内容相同时继续使用原DataFrame。
+        """
+        verify = {self.current_sheet: self.df} if self.model is not None else None
+        with span("重新加载外部修改", file=os.path.basename(self.file_path), sheets=len(changes.affected)) as record:
+            reloaded = self.session.apply_changes(changes, verify=verify,
+                                                  discard=changes.conflicts if discard else ())
+            record.detail["reloaded"] = len(reloaded)
+        for sheet in reloaded:
+            self.journals.pop(sheet, None)
+            self.summaries.pop(sheet, None)
+        return reloaded
+
+    def reshow(self, sheet_name):
+        """重新加载并显示工作表，保留仍然有效的排序和筛选条件，返回其数据模型"""
+        old = self.model
+        model = self.select(sheet_name)
+        if old is not None and model is not None:
+            columns = set(model.columns)
+            model.filters = {column: row_filter for column, row_filter in old.filters.items() if column in columns}
+            if model.filters:
+                model.apply_filters()
+            spec = [(column, ascending) for column, ascending in old.sort_spec if column in columns]
+            if spec:
+                model.sort(spec)
+                model.journal.clear()  # 恢复原来的排序不是一次修改，不能撤销
+        return model
+
+    def set_memory_budget(self, memory_budget):
+        self.memory_budget = memory_budget
+        if self.session is not None:
+            self.session.memory_budget = memory_budget
+            self.session.evict()
+
+    def set_compact(self, compact):
+        self.compact = compact
+        if self.session is not None:
+            self.session.compact = compact
+
+    def load(self, sheet_name, on_chunk=None):
+        """读取工作表数据（已缓存时直接返回），不改变当前工作表"""
+        return self.session.get(sheet_name, on_chunk=on_chunk)
+
+    def show(self, sheet_name, df):
+        """把已读取的数据设为当前工作表，返回其数据模型"""
+        self.flush()
+        self.current_sheet = sheet_name
+        if df is None:
+            self.model = None
+            return None
+        self.model = SheetModel(df, self.sheet_journal(sheet_name, df))
+        self.model.journal.frame = weakref.ref(self.model.df)
+        self.sheet_summary(sheet_name, df).frame = self.model.journal.frame
+        self.model.on_flush = self.mark_dirty
+        return self.model
+
+    def select(self, sheet_name):
+        """读取并切换到指定工作表，返回其数据模型"""
+        return self.show(sheet_name, self.load(sheet_name))
+
+    def sheet_journal(self, sheet_name, df):
+        """工作表的撤销记录；工作表数据已重新加载（不是记录对应的DataFrame）时重新开始记录"""
+        journal = self.journals.get(sheet_name)
+        if journal is None or journal.frame is None or journal.frame() is not df:
+            journal = self.journals[sheet_name] = EditJournal()
+        return journal
+
+    def sheet_summary(self, sheet_name, df):
+        """工作表的汇总结果缓存；工作表数据已重新加载时重新开始缓存"""
+        summary = self.summaries.get(sheet_name)
+        if summary is None or summary.frame is None or summary.frame() is not df:
+            summary = self.summaries[sheet_name] = SheetSummary()
+        return summary
+
+    @property
+    def summary(self):
+        """当前工作表的汇总结果缓存"""
+        return self.summaries.get(self.current_sheet) if self.model is not None else None
+
+    def column_stats(self):
+        """当前工作表各列的统计表（已缓存的列不再计算），可在后台线程中执行"""
+        return self.summary.column_stats(self.df)
+
+    def pivot(self, group_by, value, how):
+        """按分组列汇总当前工作表的汇总列（how为AGGREGATIONS中的汇总方式），可在后台线程中执行"""
+        return self.summary.pivot(self.df, group_by, value, how)
+
+    def mark_dirty(self):
+        """记录当前工作表有未保存的修改，切换工作表时不会丢失
+
+        追加缓冲中还有未合并的行时推迟到合并后（模型的on_flush）再记录。
+        """
+        if self.model.pending:
+            return
+        self.model.journal.frame = self.summary.frame = weakref.ref(self.df)
+        if self.session is not None and self.current_sheet:
+            self.session.mark_dirty(self.current_sheet, self.df)
+
+    def flush(self):
+        """把当前工作表追加缓冲中的行合并到DataFrame（在主线程中调用，之后可在后台保存或导出）"""
+        if self.model is not None:
+            self.model.flush()
+
+    def commit(self, changes, removed=None):
+        """数据有修改时记录工作表已修改并更新汇总结果缓存（removed为被删除的记录），返回变更集"""
+        if changes.data_changed:
+            self.summary.apply(changes, removed)
+            self.mark_dirty()
+        return changes
+
+    def add_rows(self, rows, allow_dtype_change=False):
+        """在末尾追加记录（DataFrame），返回变更集"""
+        return self.commit(self.model.append_rows(rows, allow_dtype_change))
+
+    def delete_rows(self, row_ids):
+        """删除指定行ID的记录，返回变更集"""
+        # 有数据透视结果时先取出要删除的记录，从求和与计数中减去
+        removed = self.model.take(self.model.positions(row_ids)) if self.summary.sizes else None
+        return self.commit(self.model.delete_rows(row_ids), removed)
+
+    def update_cells(self, row_id, values, allow_dtype_change=False):
+        """修改一条记录的若干单元格（{列名: 值}），返回变更集"""
+        return self.commit(self.model.update_cells(row_id, values, allow_dtype_change))
+
+    def replace(self, df):
+        """用新数据替换当前工作表，返回变更集；没有打开工作表时把新数据作为当前工作表"""
+        if self.model is None:
+            self.show(self.current_sheet or DEFAULT_SHEET_NAME, df)
+            return self.commit(ChangeSet(reset=True))
+        return self.commit(self.model.replace(df))
+
+    def sort(self, spec):
+        """按[(列名, 是否升序)]排序显示顺序，返回变更集"""
+        with span("排序", len(self.model), len(spec), sheet=self.current_sheet):
+            return self.model.sort(spec)
+
+    def undo(self):
+        """撤销当前工作表最近一次修改，返回(记录, 变更集)，没有可撤销的修改时返回None"""
+        return self._replay(self.model.journal.undo)
+
+    def redo(self):
+        """重做当前工作表最近一次撤销的修改，返回(记录, 变更集)，没有可重做的修改时返回None"""
+        return self._replay(self.model.journal.redo)
+
+    def _replay(self, replay):
+        result = replay(self.model)
+        if result is not None:
+            self.commit(result[1])
+        return result
+
+    def schema(self, sheet_name=None):
+        """工作表的校验规则，首次使用或列变化时按列的类型生成（保留同名列已设置的规则）"""
+        sheet_name = sheet_name or self.current_sheet
+        current = sheet_name == self.current_sheet
+        columns = list(self.model.columns if current else self.load(sheet_name).columns)
+        schema = self.schemas.get(sheet_name)
+        if schema is None or schema.columns != columns:
+            schema = self.schemas[sheet_name] = Schema.infer(self.df if current else self.load(sheet_name), schema)
+        return schema
+
+    def set_schema(self, sheet_name, schema):
+        self.schemas[sheet_name] = schema
+
+    def validate(self, columns=None):
+        """按校验规则一次校验当前工作表的全部数据，返回ValidationReport"""
+        return self.schema().validate(self.df, columns)
+
+    @staticmethod
+    def read_imports(sources, how=ALIGN_UNION, reference=None, schema=None, jobs=None, progress=None,
+                     mp_context=None):
+        """并行读取导入源[(文件, 工作表名)]，按列名对齐并统一列类型后一次合并，返回(DataFrame, ImportReport)
+
+        reference为合并到的工作表的列；指定schema时先校验全部数据。progress(message, fraction)
+        用于报告进度。读取失败的源记录在报告中，全部失败或校验不通过时抛出ValueError。
+        """
+        progress = progress or (lambda message, fraction=None: None)
+        with span("读取导入文件", files=len(sources)) as record:
+            frames, failures = read_sources(sources, jobs, progress, mp_context)
+            if not frames:
+                raise ValueError("\n".join(f"{source_name(source)}：{error}" for source, error in failures.items()))
+            df_import, report = align_frames({source: frames[source] for source in sources if source in frames},
+                                             how, reference)
+            record.rows, record.cols = df_import.shape
+        report.failures = [(source, failures[source]) for source in sources if source in failures]
+        progress(f"已读取{len(frames)}个文件，共{len(df_import)}条记录", None)
+        if schema is not None:
+            progress(f"正在校验{len(df_import)}条导入的记录", None)
+            validation = schema.validate(df_import)
+            if not validation.ok:
+                raise ValueError(f"导入的数据有{validation.error_count}个问题，未导入：\n{validation.summary()}")
+        return df_import, report
+
+    def merge(self, df_import):
+        """把导入的数据追加到当前工作表，无法保持列类型时改变列类型，返回变更集"""
+        return self.add_rows(df_import, allow_dtype_change=True)
+
+    def upsert(self, df_import, keys, delete_missing=False):
+        """按键列把导入的数据合并到当前工作表（已有的键更新，新的键追加，delete_missing时删除导入中没有的键），
+        无法保持列类型时改变列类型，返回(变更集, UpsertResult)"""
+        with span("按键合并", len(df_import), len(keys), sheet=self.current_sheet) as record:
+            changes, result = self.model.upsert(df_import, keys, delete_missing, allow_dtype_change=True)
+            record.detail["result"] = result.describe()
+        return self.commit(changes), result
+
+    def import_files(self, sources, mode="merge", how=ALIGN_UNION, jobs=None, progress=None, keys=(),
+                     delete_missing=False):
+        """导入多个源：merge合并到当前工作表，upsert按键列keys合并到当前工作表（都先校验），
+        其他值替换当前工作表，返回(变更集, ImportReport)"""
+        if mode in ("merge", "upsert"):
+            df_import, report = self.read_imports(sources, how, list(self.df.columns), self.schema(), jobs, progress)
+            if mode == "upsert":
+                return self.upsert(df_import, keys, delete_missing)[0], report
+            return self.merge(df_import), report
+        df_import, report = self.read_imports(sources, how, jobs=jobs, progress=progress)
+        return self.replace(df_import), report
+
+    def save(self, progress=None):
+        """只写入有修改的工作表并原子替换文件，返回是否使用了局部替换；没有修改时返回None"""
+        self.flush()
+        with span("保存文件", file=os.path.basename(self.file_path), sheets=self.dirty_count):
+            return self.session.save(progress=progress)
+
+    @property
+    def dirty_count(self):
+        """有未保存修改的工作表数（包括追加缓冲中有新增记录的当前工作表）"""
+        if self.session is None:
+            return 0
+        dirty = set(self.session.dirty)
+        if self.model is not None and self.model.pending:
+            dirty.add(self.current_sheet)
+        return len(dirty)
+
+    def export(self, file_path, sheets=None, view=False, before_replace=None, progress=None):
+        """把工作表（默认当前工作表）导出到文件，写入临时文件后原子替换，返回导出的记录数
+
+        view为True时只导出当前工作表筛选后的记录（按当前排序）。各工作表在写入时逐个加载并按块写出；
+        CSV/TSV/Parquet导出多个工作表时每个工作表一个文件（文件名后加“_工作表名”）。
+        """
+        self.flush()
+        sheets = [self.current_sheet] if sheets is None or view else list(sheets)
+        if len(sheets) > 1 and extension(file_path) in SINGLE_SHEET_EXTENSIONS:
+            base, ext = os.path.splitext(file_path)
+            targets = [(f"{base}_{sheet}{ext}", [sheet]) for sheet in sheets]
+        else:
+            targets = [(file_path, sheets)]
+
+        def load(sheet):
+            if sheet != self.current_sheet:
+                return self.load(sheet)
+            if view and (self.model.order is not None or self.model.mask is not None):
+                return SheetRows(self.df, self.model.view)
+            return self.df
+
+        rows = 0
+        with span("导出", file=os.path.basename(file_path), sheets=len(sheets)) as record:
+            for target, names in targets:
+                frames = LazyFrames(names, load)
+
+                def write(tmp_path):
+                    record.detail["engine"] = write_frames(tmp_path, frames, progress)
+                atomic_write(target, write, before_replace=before_replace)
+                rows += sum(frames.rows.values())
+            record.rows = rows
+        return rows
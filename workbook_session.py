@@ -0,0 +1,296 @@
+import functools
+import os
+import threading
+from collections import OrderedDict
+
+from compact_dtypes import compact_frame
+from io_backends import excel_engine, open_excel, sheet_names
+from perf_trace import span
+from streaming_reader import stream_sheet
+from xlsx_package import part_signatures, read_dimensions, save_workbook
+
+# 工作表缓存默认内存上限（字节）
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+
+
+def file_signature(file_path):
+    """返回文件的(修改时间, 大小)，用于检测文件变化"""
+    stat = os.stat(file_path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def frame_memory(df):
+    """估算DataFrame占用的内存（字节）"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def synchronized(method):
+    """在会话锁内执行方法"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class SheetChanges:
+    """文件被其他程序修改后各工作表的变化"""
+
+    def __init__(self, sheets, changed, suspect):
+        self.sheets = sheets      # 修改后的工作表名称列表
+        self.changed = changed    # 工作表部件有变化的工作表（包括新增和删除的）
+        self.suspect = suspect    # 部件未变、但共享字符串或样式有变化的工作表，需要重新解析后比较
+        self.conflicts = set()    # 有未保存修改的受影响工作表（由WorkbookEngine填写）
+
+    @property
+    def affected(self):
+        """内容可能有变化的工作表"""
+        return self.changed | self.suspect
+
+
+class WorkbookSession:
+    """工作簿会话：保持一个打开的ExcelFile句柄，并按工作表缓存解析后的DataFrame
+
+    xlsx文件打开时只读取工作簿清单和各工作表的大小（dimensions），首次解析工作表时才打开ExcelFile。
+
+    缓存按最近使用顺序（LRU）在内存上限内淘汰；有未保存修改的工作表会被固定，
+    永不淘汰；文件的修改时间或大小变化时，按包内各工作表部件的校验值找出有变化的工作表，
+    只有这些工作表的未修改缓存项失效，并重新打开文件。
+    各方法可在后台任务线程中调用，内部以可重入锁串行化。
+    指定sidecar（SidecarCache）时，解析结果同时写入磁盘缓存，再次打开同一文件时直接从缓存加载。
+    compact为True时，新加载的工作表转换为紧凑类型（见compact_dtypes），并在memory_report中记录转换前后的内存占用。
+    """
+
+    def __init__(self, file_path, memory_budget=DEFAULT_MEMORY_BUDGET, sidecar=None, compact=False):
+        self.file_path = file_path
+        self.memory_budget = memory_budget
+        self.sidecar = sidecar
+        self.compact = compact
+        self.memory_report = {}  # 工作表名 -> (转换前, 转换后)内存占用（字节）
+        self._sidecar_key = None
+        self.dirty = set()
+        self._cache = OrderedDict()  # 工作表名 -> DataFrame，按最近使用排序
+        self._sizes = {}             # 工作表名 -> 内存占用
+        self.dimensions = None       # 工作表名 -> 清单中记录的(记录数, 列数)，非xlsx文件为None
+        self._parts = None           # 打开时各部件的签名（见part_signatures），非xlsx文件为None
+        self._excel = None
+        self._signature = None
+        self._lock = threading.RLock()
+        self.reopen()
+
+    @property
+    def sheet_names(self):
+        """工作簿中的工作表名称列表"""
+        if self.dimensions is not None:
+            return list(self.dimensions)
+        return list(self.excel.sheet_names)
+
+    @property
+    def excel(self):
+        """打开的ExcelFile句柄，xlsx文件在首次解析工作表时才打开"""
+        with self._lock:
+            if self._excel is None:
+                self._excel = open_excel(self.file_path)
+            return self._excel
+
+    @property
+    def engine(self):
+        """解析工作表使用的读取引擎名（文件句柄尚未打开时为打开时将使用的引擎，不打开文件）"""
+        with self._lock:
+            return self._excel.engine if self._excel is not None else excel_engine(self.file_path)
+
+    def sheet_size(self, sheet):
+        """工作表的(记录数, 列数)：已加载时为实际大小，否则为清单中记录的大小，未知时为None"""
+        if sheet in self._cache:
+            return self._cache[sheet].shape
+        return (self.dimensions or {}).get(sheet)
+
+    @property
+    def cached_memory(self):
+        """缓存的DataFrame总内存占用（字节）"""
+        return sum(self._sizes.values())
+
+    @synchronized
+    def reopen(self):
+        """重新读取工作簿清单（非xlsx文件直接打开文件句柄）并记录文件签名"""
+        self.close()
+        self._signature = file_signature(self.file_path)
+        self.dimensions = read_dimensions(self.file_path)
+        self._parts = part_signatures(self.file_path)
+        if self.dimensions is None:
+            self._excel = open_excel(self.file_path)
+        self._sidecar_key = None
+
+    @synchronized
+    def close(self):
+        """关闭文件句柄"""
+        if self._excel is not None:
+            self._excel.close()
+            self._excel = None
+
+    def file_changed(self):
+        """检查文件自打开以来是否被修改"""
+        try:
+            return file_signature(self.file_path) != self._signature
+        except OSError:
+            return True
+
+    @synchronized
+    def detect_changes(self):
+        """文件自打开以来被修改时返回SheetChanges，否则返回None；只读取zip目录，不解析数据"""
+        if not self.file_changed():
+            return None
+        old_sheets = self.sheet_names
+        new = part_signatures(self.file_path)
+        if new is None or self._parts is None:
+            # 不是xlsx包，无法按部件比较，所有工作表都视为有变化
+            sheets = sheet_names(self.file_path)
+            return SheetChanges(sheets, set(old_sheets) | set(sheets), set())
+        old_shared, old_parts = self._parts
+        shared, parts = new
+        changed = {sheet for sheet in set(old_parts) | set(parts) if old_parts.get(sheet) != parts.get(sheet)}
+        suspect = set(parts) - changed if shared != old_shared else set()
+        return SheetChanges(list(parts), changed, suspect)
+
+    @synchronized
+    def apply_changes(self, changes, verify=None, discard=(), compare=True):
+        """按外部修改更新缓存并重新打开文件，返回内容确实有变化（或被删除）的已加载工作表集合
+
+        有未保存修改的工作表保持不变，除非在discard中（放弃其修改）。部件有变化的工作表丢弃缓存，
+        下次访问时重新解析；compare为True时，部件未变但共享部件有变化的已缓存工作表和verify
+        （{工作表名: 正在显示的DataFrame}）中的工作表立即重新解析并与原数据比较，相同时保留原DataFrame。
+        """
+        self.dirty.difference_update(discard)
+        loaded = {sheet: df for sheet, df in self._cache.items() if sheet not in self.dirty}
+        loaded.update({sheet: df for sheet, df in (verify or {}).items() if sheet not in self.dirty})
+        for sheet in loaded:
+            if sheet in changes.affected or sheet not in changes.sheets:
+                self._drop(sheet)
+        self.reopen()
+        reloaded = set()
+        for sheet, old in loaded.items():
+            if sheet not in changes.affected and sheet in changes.sheets:
+                continue
+            if compare and sheet in changes.sheets and (sheet in changes.suspect or sheet in (verify or {})):
+                if self.get(sheet).equals(old):
+                    self.put(sheet, old)
+                    continue
+            reloaded.add(sheet)
+        return reloaded
+
+    @synchronized
+    def refresh_if_changed(self):
+        """文件变化时只丢弃内容可能有变化的未修改工作表的缓存并重新打开，返回是否发生了变化"""
+        changes = self.detect_changes()
+        if changes is None:
+            return False
+        self.apply_changes(changes, compare=False)
+        return True
+
+    def is_cached(self, sheet):
+        """工作表是否已在缓存中"""
+        return sheet in self._cache
+
+    @property
+    def can_stream(self):
+        """文件是否可用只读行迭代器流式读取（openpyxl引擎）"""
+        return self.engine == "openpyxl"
+
+    @synchronized
+    def get(self, sheet, on_chunk=None):
+        """获取工作表数据，已缓存时直接返回，否则从打开的文件句柄解析
+
+        指定on_chunk时按批流式读取，每批读取后调用on_chunk(buffer, total_rows)。
+        """
+        self.refresh_if_changed()
+        if sheet in self._cache:
+            self._cache.move_to_end(sheet)
+            return self._cache[sheet]
+        with span("解析工作表", sheet=sheet) as record:
+            key = self.sidecar_key()
+            df = self.sidecar.load(key, sheet) if key else None
+            record.detail["source"] = "磁盘缓存"
+            if df is None:
+                if on_chunk is not None and self.can_stream:
+                    record.detail["source"] = "流式读取"
+                    df = stream_sheet(self.excel.book[sheet], on_chunk)
+                else:
+                    record.detail["source"] = self.engine
+                    df = self.excel.parse(sheet)
+                if key:
+                    self.sidecar.store(key, sheet, df)
+            if self.compact:
+                before = frame_memory(df)
+                df = compact_frame(df)
+                self.memory_report[sheet] = (before, frame_memory(df))
+            record.rows, record.cols = df.shape
+        self.put(sheet, df)
+        return df
+
+    @synchronized
+    def sidecar_key(self):
+        """当前文件在磁盘缓存中的键（首次使用时计算内容哈希），未启用缓存时返回None"""
+        if self.sidecar is None:
+            return None
+        if self._sidecar_key is None:
+            try:
+                self._sidecar_key = self.sidecar.workbook_key(self.file_path, self.engine)
+            except OSError:
+                return None
+        return self._sidecar_key
+
+    @synchronized
+    def put(self, sheet, df, dirty=False):
+        """放入（或替换）工作表数据，dirty为True时固定该工作表"""
+        self._cache[sheet] = df
+        self._cache.move_to_end(sheet)
+        self._sizes[sheet] = frame_memory(df)
+        if dirty:
+            self.dirty.add(sheet)
+        self.evict()
+
+    @synchronized
+    def mark_dirty(self, sheet, df):
+        """记录工作表的修改，df为修改后的DataFrame"""
+        if self._cache.get(sheet) is df and sheet in self.dirty:
+            self._cache.move_to_end(sheet)
+            return
+        self.put(sheet, df, dirty=True)
+
+    @synchronized
+    def mark_saved(self):
+        """保存完成后清除修改标记，并按新文件重新打开（保留缓存的数据）"""
+        self.dirty.clear()
+        self.reopen()
+        self.evict()
+
+    @synchronized
+    def save(self, progress=None):
+        """只写入有修改的工作表并原子替换文件，返回是否使用了局部替换；没有修改时返回None"""
+        if not self.dirty:
+            return None
+        self.refresh_if_changed()
+        dirty_frames = {sheet: self._cache[sheet] for sheet in self.dirty}
+        try:
+            patched = save_workbook(self.file_path, self.sheet_names, dirty_frames, self.get,
+                                    before_replace=self.close, progress=progress)
+        except Exception:
+            # 保存失败时原文件未被替换，重新打开以便继续使用；成功时由mark_saved按新文件重新打开
+            self.reopen()
+            raise
+        self.mark_saved()
+        return patched
+
+    @synchronized
+    def evict(self):
+        """按LRU顺序淘汰未修改的工作表，直到缓存不超过内存上限"""
+        for sheet in list(self._cache)[:-1]:
+            if self.cached_memory <= self.memory_budget:
+                break
+            if sheet not in self.dirty:
+                self._drop(sheet)
+
+    def _drop(self, sheet):
+        self._cache.pop(sheet, None)
+        self._sizes.pop(sheet, None)
+        self.memory_report.pop(sheet, None)
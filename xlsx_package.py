@@ -0,0 +1,443 @@
+import os
+import posixpath
+import re
+import shutil
+import struct
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+import pandas as pd
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+from io_backends import sheet_rows, write_frames
+from perf_trace import span
+
+# OOXML命名空间
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+# 写工作表XML时每批写入的行数
+XML_CHUNK_ROWS = 5000
+# 复制未修改部件时的缓冲区大小
+COPY_BUFFER_SIZE = 1024 * 1024
+# ZIP本地文件头：签名、固定部分的格式，以及其中文件名长度和扩展字段长度的位置
+LOCAL_HEADER_SIGNATURE = b"PK\003\004"
+LOCAL_HEADER_FORMAT = "<4s2B4HL2L2H"
+LOCAL_HEADER_SIZE = struct.calcsize(LOCAL_HEADER_FORMAT)
+LOCAL_HEADER_NAME_LENGTH = 10
+LOCAL_HEADER_EXTRA_LENGTH = 11
+# 通用标志位中表示数据之后有数据描述符（CRC和大小在数据之后）的位
+FLAG_DATA_DESCRIPTOR = 0x08
+# 日期时间单元格使用的内置数字格式（yyyy-mm-dd h:mm）
+DATETIME_NUMFMT_ID = 22
+# 估算工作表XML大小时每个单元格的字节数，超过ZIP64上限时启用ZIP64
+XML_BYTES_PER_CELL = 40
+# 工作表部件之外影响所有工作表解析结果的共享部件
+SHARED_PARTS = ("xl/sharedStrings.xml", "xl/styles.xml")
+# 查找<dimension>时最多解压的工作表XML开头字节数
+DIMENSION_SCAN_BYTES = 64 * 1024
+DIMENSION_PATTERN = re.compile(rb'<(?:\w+:)?dimension\s+ref="\$?([A-Z]+)\$?(\d+)(?::\$?([A-Z]+)\$?(\d+))?"')
+
+# Excel日期序列号的起点
+EXCEL_EPOCH = pd.Timestamp("1899-12-30")
+# XML 1.0中不允许出现的控制字符
+ILLEGAL_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def atomic_write(file_path, write_func, before_replace=None):
+    """先写入同目录下的临时文件，成功后原子替换目标文件
+
+    before_replace在替换前调用，用于关闭仍打开着目标文件的句柄（Windows下无法替换打开的文件）。
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    suffix = os.path.splitext(file_path)[1]
+    fd, tmp_path = tempfile.mkstemp(prefix=".~", suffix=suffix, dir=directory)
+    os.close(fd)
+    try:
+        write_func(tmp_path)
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, tmp_path)
+        if before_replace is not None:
+            before_replace()
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def sheet_parts(zf):
+    """读取工作簿清单，返回{工作表名: 工作表XML部件路径}"""
+    workbook = ET.fromstring(zf.read("xl/workbook.xml"))
+    rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    targets = {rel.get("Id"): rel.get("Target") for rel in rels.iter(f"{{{PKG_REL_NS}}}Relationship")}
+    parts = {}
+    for sheet in workbook.iter(f"{{{MAIN_NS}}}sheet"):
+        target = targets.get(sheet.get(f"{{{REL_NS}}}id"))
+        if target is None:
+            continue
+        if target.startswith("/"):
+            parts[sheet.get("name")] = target.lstrip("/")
+        else:
+            parts[sheet.get("name")] = posixpath.normpath(posixpath.join("xl", target))
+    return parts
+
+
+def sheet_dimension(zf, part):
+    """从工作表XML开头的<dimension>得到(记录数, 列数)（首行为列名），没有时返回None"""
+    with zf.open(part) as fp:
+        head = fp.read(DIMENSION_SCAN_BYTES)
+    match = DIMENSION_PATTERN.search(head)
+    if match is None:
+        return None
+    first_col, first_row, last_col, last_row = match.groups()
+    if last_col is None:
+        last_col, last_row = first_col, first_row
+    return (int(last_row) - int(first_row),
+            column_index_from_string(last_col.decode()) - column_index_from_string(first_col.decode()) + 1)
+
+
+def read_dimensions(file_path):
+    """只读取工作簿清单和各工作表的大小，返回{工作表名: (记录数, 列数)或None}
+
+    只解压每个工作表XML的开头，不读取共享字符串和单元格数据；文件不是xlsx包时返回None。
+    """
+    if not file_path.lower().endswith((".xlsx", ".xlsm")) or not zipfile.is_zipfile(file_path):
+        return None
+    try:
+        with zipfile.ZipFile(file_path) as zf:
+            names = set(zf.namelist())
+            return {sheet: sheet_dimension(zf, part) if part in names else None
+                    for sheet, part in sheet_parts(zf).items()}
+    except (KeyError, ET.ParseError, zipfile.BadZipFile):
+        return None
+
+
+def part_signatures(file_path):
+    """返回(共享部件的签名, {工作表名: 工作表部件的签名})，文件不是可读取的xlsx包时返回None
+
+    签名为zip目录中记录的部件(CRC-32, 解压后大小)，即部件内容的校验值，不需要解压任何部件。
+    """
+    if not file_path.lower().endswith((".xlsx", ".xlsm")) or not zipfile.is_zipfile(file_path):
+        return None
+    try:
+        with zipfile.ZipFile(file_path) as zf:
+            infos = {info.filename: (info.CRC, info.file_size) for info in zf.infolist()}
+            shared = tuple(infos.get(name) for name in SHARED_PARTS)
+            return shared, {sheet: infos.get(part) for sheet, part in sheet_parts(zf).items()}
+    except (KeyError, ET.ParseError, zipfile.BadZipFile):
+        return None
+
+
+def can_patch(file_path, sheet_names):
+    """判断能否只替换修改过的工作表部件（文件为xlsx包且工作表未增删）"""
+    if not file_path.lower().endswith((".xlsx", ".xlsm")) or not zipfile.is_zipfile(file_path):
+        return False
+    try:
+        with zipfile.ZipFile(file_path) as zf:
+            parts = sheet_parts(zf)
+            names = set(zf.namelist())
+    except (KeyError, ET.ParseError):
+        return False
+    return set(parts) == set(sheet_names) and all(part in names for part in parts.values())
+
+
+def add_datetime_style(styles_xml):
+    """在styles.xml的cellXfs末尾追加日期时间格式，返回(新XML, 样式索引)"""
+    match = re.search(r'<cellXfs count="(\d+)"', styles_xml)
+    if match is None or "</cellXfs>" not in styles_xml:
+        return None, None
+    index = int(match.group(1))
+    xf = f'<xf numFmtId="{DATETIME_NUMFMT_ID}" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    styles_xml = styles_xml.replace(match.group(0), f'<cellXfs count="{index + 1}"', 1)
+    styles_xml = styles_xml.replace("</cellXfs>", xf + "</cellXfs>", 1)
+    return styles_xml, index
+
+
+def remove_calc_chain(zf_names, content_types, workbook_rels):
+    """替换工作表后计算链可能失效，删除calcChain部件及其引用"""
+    if "xl/calcChain.xml" not in zf_names:
+        return content_types, workbook_rels, set()
+    content_types = re.sub(r'<Override[^>]*PartName="/xl/calcChain\.xml"[^>]*/>', "", content_types)
+    workbook_rels = re.sub(r'<Relationship[^>]*Target="[^"]*calcChain\.xml"[^>]*/>', "", workbook_rels)
+    return content_types, workbook_rels, {"xl/calcChain.xml"}
+
+
+def inline_string(text):
+    """生成内联字符串单元格片段"""
+    text = escape(ILLEGAL_XML_CHARS.sub("", text))
+    if text != text.strip():
+        return f' t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+    return f' t="inlineStr"><is><t>{text}</t></is></c>'
+
+
+def value_fragment(value, date_style):
+    """生成单个值的单元格片段（不含<c r=...起始部分），空值返回None"""
+    if value is None or value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return f' t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, np.integer)):
+        return f"><v>{int(value)}</v></c>"
+    if isinstance(value, (float, np.floating)):
+        if np.isnan(value):
+            return None
+        if np.isinf(value):
+            return inline_string(str(value))
+        return f"><v>{float(value)!r}</v></c>"
+    if isinstance(value, (pd.Timestamp, np.datetime64)) or hasattr(value, "toordinal"):
+        stamp = pd.Timestamp(value)
+        if stamp.tzinfo is not None:
+            stamp = stamp.tz_localize(None)
+        serial = (stamp - EXCEL_EPOCH) / pd.Timedelta(days=1)
+        return f' s="{date_style}"><v>{serial!r}</v></c>'
+    return inline_string(str(value))
+
+
+def column_fragments(series, date_style):
+    """将一列数据转换为单元格片段列表"""
+    kind = series.dtype.kind
+    if not isinstance(series.dtype, np.dtype) and kind != "M":
+        # 可空整数/布尔等扩展类型可能含pd.NA，逐个处理
+        return [value_fragment(v, date_style) for v in series.tolist()]
+    if kind == "M":
+        values = series
+        if getattr(values.dt, "tz", None) is not None:
+            values = values.dt.tz_localize(None)
+        serials = ((values - EXCEL_EPOCH) / pd.Timedelta(days=1)).tolist()
+        return [None if np.isnan(v) else f' s="{date_style}"><v>{v!r}</v></c>' for v in serials]
+    if kind in "iu":
+        return [f"><v>{v}</v></c>" for v in series.tolist()]
+    if kind == "b":
+        return [f' t="b"><v>{int(v)}</v></c>' for v in series.tolist()]
+    if kind == "f":
+        return [None if v != v else (inline_string(str(v)) if v in (np.inf, -np.inf) else f"><v>{v!r}</v></c>")
+                for v in series.tolist()]
+    return [value_fragment(v, date_style) for v in series.tolist()]
+
+
+def write_sheet_xml(fp, df, date_style, progress=None):
+    """以内联字符串流式写出工作表XML（首行为列名），df可以是只写出部分行的SheetRows
+
+    progress(rows_written)在每批行写出后调用。
+    """
+    rows = sheet_rows(df)
+    letters = [get_column_letter(i + 1) for i in range(rows.shape[1])]
+    last_cell = f"{letters[-1]}{len(rows) + 1}" if letters else "A1"
+    fp.write((f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+              f'<worksheet xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">'
+              f'<dimension ref="A1:{last_cell}"/><sheetData>').encode("utf-8"))
+
+    header = "".join(f'<c r="{letter}1"{inline_string(str(col))}' for letter, col in zip(letters, rows.columns))
+    fp.write(f'<row r="1">{header}</row>'.encode("utf-8"))
+
+    start = 0
+    for chunk in rows.chunks(XML_CHUNK_ROWS):
+        columns = [column_fragments(chunk.iloc[:, i], date_style) for i in range(chunk.shape[1])]
+        lines = []
+        for offset, cells in enumerate(zip(*columns)):
+            row_number = start + offset + 2
+            body = "".join(f'<c r="{letter}{row_number}"{cell}'
+                           for letter, cell in zip(letters, cells) if cell is not None)
+            lines.append(f'<row r="{row_number}">{body}</row>')
+        fp.write("".join(lines).encode("utf-8"))
+        start += len(chunk)
+        if progress is not None:
+            progress(start)
+
+    fp.write(b"</sheetData></worksheet>")
+
+
+def needs_date_style(frames):
+    """判断要写出的工作表中是否包含日期时间数据"""
+    for df in frames.values():
+        for i in range(df.shape[1]):
+            column = df.iloc[:, i]
+            if column.dtype.kind == "M":
+                return True
+            if column.dtype == object and column.map(lambda v: isinstance(v, pd.Timestamp) or hasattr(v, "toordinal")).any():
+                return True
+    return False
+
+
+def copy_compressed(zin, zout, info):
+    """把zin中的一个部件的压缩数据原样复制到zout，保留压缩方式、CRC和大小，不解压也不重新压缩"""
+    zin.fp.seek(info.header_offset)
+    header = struct.unpack(LOCAL_HEADER_FORMAT, zin.fp.read(LOCAL_HEADER_SIZE))
+    if header[0] != LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"部件 {info.filename} 的文件头无效")
+    zin.fp.seek(header[LOCAL_HEADER_NAME_LENGTH] + header[LOCAL_HEADER_EXTRA_LENGTH], os.SEEK_CUR)
+
+    out_info = zipfile.ZipInfo(info.filename, info.date_time)
+    out_info.compress_type = info.compress_type
+    out_info.external_attr = info.external_attr
+    out_info.create_system = info.create_system
+    out_info.CRC = info.CRC
+    out_info.compress_size = info.compress_size
+    out_info.file_size = info.file_size
+    # 大小已写在文件头中，不再需要原部件可能带有的数据描述符
+    out_info.flag_bits = info.flag_bits & ~FLAG_DATA_DESCRIPTOR
+    zip64 = max(info.file_size, info.compress_size) > zipfile.ZIP64_LIMIT
+
+    # zipfile没有写入已压缩数据的接口，按ZipFile.writestr的方式直接写文件头和数据并登记部件
+    zout.fp.seek(zout.start_dir)
+    out_info.header_offset = zout.fp.tell()
+    zout._writecheck(out_info)
+    zout._didModify = True
+    zout.fp.write(out_info.FileHeader(zip64))
+    remaining = info.compress_size
+    while remaining:
+        block = zin.fp.read(min(remaining, COPY_BUFFER_SIZE))
+        if not block:
+            raise zipfile.BadZipFile(f"部件 {info.filename} 的数据不完整")
+        zout.fp.write(block)
+        remaining -= len(block)
+    zout.start_dir = zout.fp.tell()
+    zout.filelist.append(out_info)
+    zout.NameToInfo[out_info.filename] = out_info
+
+
+def patch_workbook(src_path, dst_path, dirty_frames, progress=None):
+    """复制原工作簿包，只重新生成修改过的工作表部件，其余部件原样复制
+
+    progress(message, fraction)用于报告写入进度。
+    """
+    with zipfile.ZipFile(src_path) as zin:
+        parts = sheet_parts(zin)
+        names = set(zin.namelist())
+        replaced = {parts[sheet]: df for sheet, df in dirty_frames.items()}
+        sheet_of_part = {parts[sheet]: sheet for sheet in dirty_frames}
+
+        # 需要改写的小型清单部件
+        overrides = {}
+        content_types = zin.read("[Content_Types].xml").decode("utf-8")
+        workbook_rels = zin.read("xl/_rels/workbook.xml.rels").decode("utf-8")
+        new_types, new_rels, dropped = remove_calc_chain(names, content_types, workbook_rels)
+        if dropped:
+            overrides["[Content_Types].xml"] = new_types
+            overrides["xl/_rels/workbook.xml.rels"] = new_rels
+
+        date_style = 0
+        if needs_date_style(dirty_frames):
+            styles, date_style = add_datetime_style(zin.read("xl/styles.xml").decode("utf-8"))
+            if styles is None:
+                raise ValueError("无法在styles.xml中添加日期格式")
+            overrides["xl/styles.xml"] = styles
+
+        written = []
+        with zipfile.ZipFile(dst_path, "w", compression=zipfile.ZIP_DEFLATED) as zout:
+            for info in zin.infolist():
+                name = info.filename
+                if name in dropped:
+                    continue
+                out_info = zipfile.ZipInfo(name, info.date_time)
+                out_info.compress_type = zipfile.ZIP_DEFLATED
+                out_info.external_attr = info.external_attr
+                if name in replaced:
+                    df = replaced[name]
+                    sheet = sheet_of_part[name]
+                    large = (df.size + df.shape[1]) * XML_BYTES_PER_CELL > zipfile.ZIP64_LIMIT
+                    report = None
+                    if progress is not None:
+                        done = len(written)
+                        report = lambda rows: progress(
+                            f"正在写入工作表 {sheet}: {rows}/{len(df)}行",
+                            (done + rows / max(len(df), 1)) / len(replaced))
+                    with span("写入工作表", *df.shape, sheet=sheet, engine="局部替换"), \
+                            zout.open(out_info, "w", force_zip64=large) as fp:
+                        write_sheet_xml(fp, df, date_style, report)
+                    written.append(sheet)
+                elif name in overrides:
+                    zout.writestr(out_info, overrides[name].encode("utf-8"))
+                else:
+                    # 未修改的部件直接复制压缩数据，不解压也不重新压缩
+                    copy_compressed(zin, zout, info)
+
+
+# 新建工作簿时使用的最小样式表（日期时间格式由add_datetime_style追加，写入前不检查是否有日期数据）
+MINIMAL_STYLES = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<styleSheet xmlns="{MAIN_NS}">'
+                  '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+                  '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+                  '<fill><patternFill patternType="gray125"/></fill></fills>'
+                  '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+                  '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+                  '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+                  '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+                  '</styleSheet>')
+CONTENT_TYPE_PREFIX = "application/vnd.openxmlformats-officedocument.spreadsheetml"
+# Excel工作表名称的长度上限和不允许的字符
+SHEET_NAME_MAX_LENGTH = 31
+INVALID_SHEET_NAME_CHARS = re.compile(r"[\\/*?:\[\]]")
+
+
+def write_new_workbook(dst_path, frames, progress=None):
+    """不经过openpyxl直接生成新的xlsx包，各工作表用write_sheet_xml流式写出
+
+    frames可以是按需加载的LazyFrames，各工作表逐个取出写入。progress(message, fraction)用于报告写入进度。
+    """
+    for sheet in frames:
+        if not sheet or len(sheet) > SHEET_NAME_MAX_LENGTH or INVALID_SHEET_NAME_CHARS.search(sheet):
+            raise ValueError(f"无效的工作表名称: {sheet!r}")
+    styles, date_style = add_datetime_style(MINIMAL_STYLES)
+    count = len(frames)
+    content_types = "".join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+                            f'ContentType="{CONTENT_TYPE_PREFIX}.worksheet+xml"/>' for i in range(1, count + 1))
+    sheets = "".join(f'<sheet name={quoteattr(sheet)} sheetId="{i}" r:id="rId{i}"/>'
+                     for i, sheet in enumerate(frames, start=1))
+    rels = "".join(f'<Relationship Id="rId{i}" Type="{REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+                   for i in range(1, count + 1))
+    header = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    parts = {
+        "[Content_Types].xml": (
+            f'{header}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            f'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            f'<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Override PartName="/xl/workbook.xml" ContentType="{CONTENT_TYPE_PREFIX}.sheet.main+xml"/>'
+            f'<Override PartName="/xl/styles.xml" ContentType="{CONTENT_TYPE_PREFIX}.styles+xml"/>'
+            f'{content_types}</Types>'),
+        "_rels/.rels": (
+            f'{header}<Relationships xmlns="{PKG_REL_NS}"><Relationship Id="rId1" '
+            f'Type="{REL_NS}/officeDocument" Target="xl/workbook.xml"/></Relationships>'),
+        "xl/workbook.xml": f'{header}<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}"><sheets>{sheets}</sheets></workbook>',
+        "xl/_rels/workbook.xml.rels": (
+            f'{header}<Relationships xmlns="{PKG_REL_NS}">{rels}<Relationship Id="rId{count + 1}" '
+            f'Type="{REL_NS}/styles" Target="styles.xml"/></Relationships>'),
+        "xl/styles.xml": styles,
+    }
+    with zipfile.ZipFile(dst_path, "w", compression=zipfile.ZIP_DEFLATED) as zout:
+        for name, xml in parts.items():
+            zout.writestr(name, xml.encode("utf-8"))
+        for i, (sheet, data) in enumerate(frames.items()):
+            rows = sheet_rows(data)
+            large = (len(rows) + 1) * rows.shape[1] * XML_BYTES_PER_CELL > zipfile.ZIP64_LIMIT
+            report = None
+            if progress is not None:
+                report = lambda done, i=i, sheet=sheet, total=len(rows): progress(
+                    f"正在写入工作表 {sheet}: {done}/{total}行", (i + done / max(total, 1)) / count)
+            with span("写入工作表", *rows.shape, sheet=sheet, engine="xlsx-stream"), \
+                    zout.open(f"xl/worksheets/sheet{i + 1}.xml", "w", force_zip64=large) as fp:
+                write_sheet_xml(fp, rows, date_style, report)
+
+
+def write_full_workbook(dst_path, sheet_names, load_sheet, progress=None):
+    """用最快的可用写入引擎重新写出全部工作表（无法局部替换时的后备方案）"""
+    write_frames(dst_path, {sheet: load_sheet(sheet) for sheet in sheet_names}, progress)
+
+
+def save_workbook(file_path, sheet_names, dirty_frames, load_sheet, before_replace=None, progress=None):
+    """保存工作簿：只写入修改过的工作表，完成后原子替换原文件
+
+    返回True表示使用了局部替换，False表示重新写出了全部工作表。
+    progress(message, fraction)用于报告写入进度，可在其中抛出异常以中止保存。
+    """
+    patch = os.path.exists(file_path) and can_patch(file_path, sheet_names)
+    if patch:
+        write_func = lambda tmp_path: patch_workbook(file_path, tmp_path, dirty_frames, progress)
+    else:
+        write_func = lambda tmp_path: write_full_workbook(tmp_path, sheet_names, load_sheet, progress)
+    atomic_write(file_path, write_func, before_replace)
+    return patch